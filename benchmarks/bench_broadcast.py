@@ -0,0 +1,102 @@
+""" round start broadcast to 300 teams, 4 messages each: sequential sends, all teams at once
+without limits and the broadcast scheduler.
+The fake Telegram answers with latency and 429 when its flood limits are exceeded,
+latency and limits are scaled 10x so a run takes seconds instead of minutes.
+
+usage: python benchmarks/bench_broadcast.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from broadcast import BroadcastScheduler, CHAT_BURST, CHAT_RATE, GLOBAL_RATE  # noqa: E402
+
+
+TEAMS = 300
+MESSAGES = 4
+SCALE = 10
+LATENCY = 0.05 / SCALE
+
+
+class FloodLimit:
+    """ server side token bucket, no waiting: a request is either allowed or not """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.perf_counter()
+
+    def allow(self) -> bool:
+        now = time.perf_counter()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class FakeTelegram:
+    def __init__(self) -> None:
+        self._global = FloodLimit(GLOBAL_RATE * SCALE, GLOBAL_RATE * SCALE)
+        self._chats = {}
+        self.delivered = 0
+        self.flood_errors = 0
+
+    async def send_message(self, chat_id, text: str) -> None:
+        await asyncio.sleep(LATENCY)
+        chat = self._chats.setdefault(chat_id, FloodLimit(CHAT_RATE * SCALE, CHAT_BURST))
+        if not chat.allow() or not self._global.allow():
+            self.flood_errors += 1
+            raise TelegramRetryAfter(method=SendMessage(chat_id=chat_id, text=text),
+                                     message="Too Many Requests", retry_after=1 / SCALE)
+        self.delivered += 1
+
+
+async def intro(bot, chat_id) -> None:
+    for m in range(MESSAGES):
+        await bot.send_message(chat_id, f"message {m}")
+
+
+async def sequential(telegram: FakeTelegram) -> int:
+    failed = 0
+    for chat_id in range(TEAMS):
+        try:
+            await intro(telegram, chat_id)
+        except Exception:
+            failed += 1
+    return failed
+
+
+async def unlimited(telegram: FakeTelegram) -> int:
+    results = await asyncio.gather(*(intro(telegram, chat_id) for chat_id in range(TEAMS)), return_exceptions=True)
+    return sum(1 for r in results if isinstance(r, Exception))
+
+
+async def scheduled(telegram: FakeTelegram) -> int:
+    scheduler = BroadcastScheduler(telegram, concurrency=20, rate=GLOBAL_RATE * SCALE,
+                                   chat_rate=CHAT_RATE * SCALE, chat_burst=CHAT_BURST)
+    stats = await scheduler.broadcast(range(TEAMS), intro)
+    return stats["failed"]
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'sender':>10} {'time, s':>8} {'delivered':>10} {'failed teams':>13} {'429s':>6}")
+    for name, send in (("sequential", sequential), ("unlimited", unlimited), ("scheduler", scheduled)):
+        telegram = FakeTelegram()
+        started = time.perf_counter()
+        failed = asyncio.run(send(telegram))
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10} {elapsed:>8.2f} {telegram.delivered:>10} {failed:>13} {telegram.flood_errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+""" /endround scoring time for a round with many architects and hackers
+
+usage: python benchmarks/bench_endround.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from games.ogneborec import KiprGameOgneborec  # noqa: E402
+from persistence import stub  # noqa: E402
+
+
+GAME_ID = "bench"
+ROUND = 1
+# (architects, hackers), the last one is a tournament-size round
+ROUND_SIZES = [(250, 250), (2500, 2500)]
+
+
+def fill_round(architects: int, hackers: int) -> None:
+    rnd = random.Random(42)
+    stub.reset_game_data()
+    KiprGameOgneborec.reset_live_scores()
+    components = KiprGameOgneborec.get_attacks_ids(round=ROUND)
+    for i in range(architects + hackers):
+        role = stub.ROLE_ARCHITECT if i < architects else stub.ROLE_HACKER
+        picks = rnd.sample(components, 3)
+        # choices go through the game, so live scores are accumulated before /endround
+        KiprGameOgneborec.store_update_choice({
+            "game_id": GAME_ID,
+            "chat_id": i,
+            "player_username": f"player_{i}",
+            "player_name": f"Team {i}",
+            "role": role,
+            "choice": ",".join(str(c) for c in picks),
+        }, round=ROUND)
+
+
+def bench(backend: str, architects: int, hackers: int) -> float:
+    """ returns /endround scoring time in seconds """
+    stub._force_backend(backend, f"./data/{backend}_{architects}.sqlite")
+    fill_round(architects, hackers)
+    started = time.perf_counter()
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=ROUND)
+    return time.perf_counter() - started
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        for architects, hackers in ROUND_SIZES:
+            for backend in (stub.BACKEND_JSON, stub.BACKEND_SQLITE):
+                elapsed = bench(backend, architects, hackers)
+                print(f"{backend:>8}: {architects} architects x {hackers} hackers scored in {elapsed:.3f} s")
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+""" event loop lag while 500 players send their choices within a second and correct them twice,
+storage called directly from handlers vs through the async persistence facade.
+Messages arrive at a fixed rate as they would from Telegram, every handler reads the game status
+and stores the choice, every 100th message is an admin reading the round details, which waits for
+the queued choices to be committed. The status cache is cold at the start of each run, as after a restart.
+
+usage: python benchmarks/bench_event_loop_lag.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from games.ogneborec import KiprGameOgneborec  # noqa: E402
+from monitoring import LoopLagMonitor  # noqa: E402
+from persistence import aio as storage  # noqa: E402
+from persistence import stub  # noqa: E402
+
+
+GAME_ID = "bench"
+PLAYERS = 500
+CHOICES = ["1,2", "3,4,6", "7,8", "1,5"]
+# messages per second, each player sends a message within a second
+ARRIVAL_RATE = PLAYERS
+# every n-th message reads the round as /endround does
+ADMIN_EVERY = 100
+# storage work of a handler mustn't hold the loop longer than this
+LAG_BOUND_MS = 10
+
+
+def make_choice(player: int, text: str) -> dict:
+    role = stub.ROLE_ARCHITECT if player % 2 else stub.ROLE_HACKER
+    parsed = KiprGameOgneborec.parse_choice(text, 1, role)
+    return {
+        "game_id": GAME_ID,
+        "chat_id": player,
+        "player_username": f"player_{player}",
+        "player_name": f"Team {player}",
+        "role": role,
+        "choice": parsed.ids,
+    }
+
+
+async def handler_blocking(player: int, text: str) -> None:
+    if player % ADMIN_EVERY == 0:
+        stub.get_round_details(game_id=GAME_ID, round=1)
+    stub.get_game_status(game_id=GAME_ID)
+    KiprGameOgneborec.store_update_choice(choice=make_choice(player, text), round=1)
+    # the answer sent back to the player
+    await asyncio.sleep(0)
+
+
+async def handler_async(player: int, text: str) -> None:
+    if player % ADMIN_EVERY == 0:
+        await storage.get_round_details(game_id=GAME_ID, round=1)
+    await storage.get_game_status(game_id=GAME_ID)
+    await storage.run(KiprGameOgneborec.store_update_choice, choice=make_choice(player, text), round=1)
+    await asyncio.sleep(0)
+
+
+async def burst(handler) -> tuple:
+    monitor = LoopLagMonitor(interval=0.001)
+    sampling = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.01)
+    monitor.reset()
+    # every player sends a choice and corrects it a couple of times
+    messages = [(p, CHOICES[(p + i) % len(CHOICES)]) for i in range(3) for p in range(PLAYERS)]
+    handlers = []
+    started = time.perf_counter()
+    while len(handlers) < len(messages):
+        # handlers of the messages that have arrived by now
+        arrived = min(len(messages), int((time.perf_counter() - started) * ARRIVAL_RATE) + 1)
+        handlers += [asyncio.create_task(handler(*m)) for m in messages[len(handlers):arrived]]
+        await asyncio.sleep(max(0.0, started + arrived / ARRIVAL_RATE - time.perf_counter()))
+    await asyncio.gather(*handlers)
+    elapsed = time.perf_counter() - started
+    sampling.cancel()
+    return elapsed, monitor.stats()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        print(f"{PLAYERS * 3} messages at {ARRIVAL_RATE} per second, lag bound {LAG_BOUND_MS} ms")
+        print(f"{'backend':>8} {'handlers':>9} {'burst, s':>9} {'lag p50, ms':>12} {'lag p99, ms':>12} {'lag max, ms':>12}"
+              f" {'bounded':>8}")
+        for backend in (stub.BACKEND_JSON, stub.BACKEND_SQLITE):
+            for name, handler in (("blocking", handler_blocking), ("async", handler_async)):
+                stub._force_backend(backend, f"./data/{name}.sqlite")
+                stub.reset_game_data()
+                KiprGameOgneborec.reset_live_scores()
+                elapsed, lag = asyncio.run(burst(handler))
+                bounded = "yes" if lag["p99"] <= LAG_BOUND_MS else "no"
+                print(f"{backend:>8} {name:>9} {elapsed:>9.3f} {lag['p50']:>12.2f} {lag['p99']:>12.2f} {lag['max']:>12.2f}"
+                      f" {bounded:>8}")
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
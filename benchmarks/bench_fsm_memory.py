@@ -0,0 +1,76 @@
+""" memory per player of FSM sessions: the default memory storage with the Message objects
+the bot used to put into FSM data vs compact player sessions, and the size of a stored session
+
+usage: python benchmarks/bench_fsm_memory.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from persistence import stub  # noqa: E402
+from session_storage import PlayerSessionStorage  # noqa: E402
+
+
+PLAYERS = 1000
+
+
+def message(player: int, text: str) -> Message:
+    return Message.model_validate({
+        "message_id": player, "date": 1700000000, "text": text,
+        "chat": {"id": player, "type": "private", "username": f"player_{player}", "first_name": f"Team {player}"},
+        "from": {"id": player, "is_bot": False, "first_name": f"Team {player}", "username": f"player_{player}",
+                 "language_code": "ru"},
+    })
+
+
+async def fill(sessions, with_message: bool) -> None:
+    for player in range(PLAYERS):
+        key = StorageKey(bot_id=1, chat_id=player, user_id=player)
+        data = {"name": f"Team {player}", "role": stub.ROLE_ARCHITECT, "round": 3, "username": f"player_{player}",
+                "choice_round_1": "1,2,3", "choice_round_2": "1,4,5,6", "choice_round_3": "2,7"}
+        if with_message:
+            data["message"] = message(player, data["choice_round_3"])
+        await sessions.set_state(key, "Form:choice")
+        await sessions.set_data(key, data)
+
+
+def measure(make_sessions, with_message: bool) -> float:
+    async def run():
+        sessions = make_sessions()
+        # persistence thread and tables are started before measuring
+        await sessions.get_state(StorageKey(bot_id=1, chat_id=-1, user_id=-1))
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await fill(sessions, with_message)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return sessions, after - before
+
+    sessions, allocated = asyncio.run(run())
+    return allocated / PLAYERS
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        stub._force_backend(stub.BACKEND_JSON)
+        print(f"{'storage':>34} {'bytes per player':>17}")
+        print(f"{'memory storage with Message':>34} {measure(MemoryStorage, True):>17.0f}")
+        print(f"{'memory storage without Message':>34} {measure(MemoryStorage, False):>17.0f}")
+        # includes the resident session table of the persistence layer
+        print(f"{'player sessions':>34} {measure(PlayerSessionStorage, False):>17.0f}")
+        record = stub.get_player_sessions()[0]
+        print(f"stored session: {len(json.dumps(record, ensure_ascii=False).encode('utf-8'))} bytes")
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+""" durable choice writes: one commit per write vs group commit of queued choices,
+500 players send a choice and correct it twice
+
+usage: python benchmarks/bench_group_commit.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from persistence import stub  # noqa: E402
+
+
+GAME_ID = "bench"
+PLAYERS = 500
+RESENDS = 3
+
+
+def make_choice(player: int, attempt: int) -> dict:
+    return {
+        "game_id": GAME_ID,
+        "chat_id": player,
+        "player_username": f"player_{player}",
+        "player_name": f"Team {player}",
+        "role": stub.ROLE_ARCHITECT if player % 2 else stub.ROLE_HACKER,
+        "choice": f"{1 + attempt},{4 + attempt}",
+    }
+
+
+def commit_each(choice: dict, round: int = 1) -> None:
+    # what every write used to cost: its own durable commit
+    stub._commit_choices([stub._prepare_choice(choice, round=round)])
+
+
+def measure(store) -> float:
+    started = time.perf_counter()
+    for attempt in range(RESENDS):
+        for player in range(PLAYERS):
+            store(make_choice(player, attempt), round=1)
+    stub.flush()
+    return time.perf_counter() - started
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        writes = PLAYERS * RESENDS
+        print(f"{'backend':>8} {'mode':>12} {'total, s':>9} {'writes/s':>9} {'commits':>8} "
+              f"{'batch p50':>10} {'latency p99, ms':>16}")
+        for backend in (stub.BACKEND_JSON, stub.BACKEND_SQLITE):
+            for mode, store in (("commit each", commit_each), ("group", stub.store_update_choice)):
+                stub._force_backend(backend, f"./data/{mode.replace(' ', '_')}.sqlite")
+                stub.reset_game_data()
+                elapsed = measure(store)
+                assert len(stub.get_game_data(GAME_ID, round=1, role=None)) == PLAYERS
+                if store is commit_each:
+                    commits, batch, latency = writes, "1", "-"
+                else:
+                    stats = stub.get_write_stats()
+                    commits, batch, latency = stats["commits"], str(stats["batch_p50"]), f"{stats['latency_p99_ms']:.2f}"
+                print(f"{backend:>8} {mode:>12} {elapsed:>9.3f} {writes / elapsed:>9.0f} {commits:>8} "
+                      f"{batch:>10} {latency:>16}")
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+""" per-write cost of store_update_choice and per-read cost of get_round_details
+as the number of stored games grows, for the old pysondb path and both backends,
+with data partitioned per game the cost shouldn't depend on the number of games
+
+usage: python benchmarks/bench_persistence.py
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pysondb import db  # noqa: E402
+from persistence import stub  # noqa: E402
+from persistence.migrate import migrate  # noqa: E402
+from persistence.stub import preserve_entry_schema, ROLE_ARCHITECT, ROLE_HACKER  # noqa: E402
+
+
+GAMES = [10, 100, 1000]
+PLAYERS_PER_GAME = 20
+WRITES = 60
+
+
+def make_choice(game_id: str, player: int, round: int = 1) -> dict:
+    return {
+        "game_id": game_id,
+        "chat_id": player,
+        "player_username": f"player_{player}",
+        "player_name": f"Team {player}",
+        "role": ROLE_ARCHITECT if player % 2 else ROLE_HACKER,
+        "choice": "1,2,3",
+    }
+
+
+def prefill(n_games: int) -> None:
+    """ writes the shared game data file the same way pysondb would have left it """
+    stub._force_backend(stub.BACKEND_JSON)
+    shutil.rmtree(os.path.dirname(stub.GAME_DATA_FILE_NAME), ignore_errors=True)
+    records = []
+    pk = 1
+    for g in range(n_games):
+        for p in range(PLAYERS_PER_GAME):
+            record = preserve_entry_schema(make_choice(f"game_{g}", p))
+            record["round"] = 1
+            record["choice"] = [1, 2, 3]
+            record["id"] = pk
+            pk += 1
+            records.append(record)
+    os.makedirs(os.path.dirname(stub.GAME_DATA_FILE_NAME), exist_ok=True)
+    with open(stub.GAME_DATA_FILE_NAME, "w", encoding="utf-8") as f:
+        json.dump({"data": records}, f, indent=3, ensure_ascii=False)
+
+
+def pysondb_store_update_choice(choice: dict, round: int = 1) -> None:
+    """ the pysondb based implementation the stub used to have """
+    game_db = db.getDb(stub.GAME_DATA_FILE_NAME)
+    choice = preserve_entry_schema(choice)
+    choice["round"] = round
+    choice["choice"] = [int(c) for c in choice["choice"].split(",")]
+    try:
+        data = game_db.getByQuery({
+            "game_id": choice["game_id"],
+            "player_username": choice["player_username"],
+            "round": round
+        })[0]
+        data["choice"] = choice["choice"]
+        data["player_name"] = choice["player_name"]
+        game_db.updateById(data["id"], data)
+    except IndexError:
+        game_db.add(choice)
+
+
+def pysondb_get_round_details(game_id: str, round: int = 1) -> list:
+    return db.getDb(stub.GAME_DATA_FILE_NAME).getByQuery({"game_id": game_id, "round": round})
+
+
+def measure(store_update_choice, get_round_details, n_games: int) -> tuple:
+    """ returns mean write and read time in milliseconds, writes are half updates and half new records """
+    game_id = f"game_{n_games - 1}"
+    started = time.perf_counter()
+    for i in range(WRITES):
+        store_update_choice(make_choice(game_id, i % PLAYERS_PER_GAME), round=1 + i // PLAYERS_PER_GAME % 3)
+        # every write is committed on its own, as it happens when players are few
+        stub.flush()
+    write_time = (time.perf_counter() - started) * 1000 / WRITES
+    started = time.perf_counter()
+    for i in range(WRITES):
+        get_round_details(game_id=game_id, round=1 + i % 3)
+    read_time = (time.perf_counter() - started) * 1000 / WRITES
+    return write_time, read_time
+
+
+def bench_pysondb(n_games: int) -> tuple:
+    prefill(n_games)
+    # pysondb prints the file encoding on every add
+    with contextlib.redirect_stdout(io.StringIO()):
+        return measure(pysondb_store_update_choice, pysondb_get_round_details, n_games)
+
+
+def bench_journal(n_games: int) -> tuple:
+    prefill(n_games)
+    stub._force_backend(stub.BACKEND_JSON)
+    # games are split into partitions once at startup, it's not part of the write cost
+    stub.get_game_data(game_id="game_0", round=None, role=None)
+    return measure(stub.store_update_choice, stub.get_round_details, n_games)
+
+
+def bench_sqlite(n_games: int) -> tuple:
+    prefill(n_games)
+    sqlite_db_file_name = f"./data/game_{n_games}.sqlite"
+    migrate(sqlite_db_file_name)
+    stub._force_backend(stub.BACKEND_SQLITE, sqlite_db_file_name)
+    stub.get_game_data(game_id="game_0", round=None, role=None)
+    return measure(stub.store_update_choice, stub.get_round_details, n_games)
+
+
+BACKENDS = {
+    "pysondb": bench_pysondb,
+    "journal": bench_journal,
+    "sqlite": bench_sqlite,
+}
+
+
+def main():
+    print(f"{'games':>8} " + " ".join(f"{name + ', ms/write':>18} {name + ', ms/read':>18}" for name in BACKENDS))
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        for n_games in GAMES:
+            results = [bench(n_games) for bench in BACKENDS.values()]
+            print(f"{n_games:>8} " + " ".join(f"{w:>18.3f} {r:>18.3f}" for w, r in results))
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
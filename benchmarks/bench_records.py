@@ -0,0 +1,71 @@
+""" memory and file size of stored player-round records: padded dicts vs compact records
+
+usage: python benchmarks/bench_records.py
+"""
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from persistence.records import PlayerRound, ROLE_ARCHITECT, ROLE_HACKER  # noqa: E402
+from persistence.stub import preserve_entry_schema  # noqa: E402
+
+
+PLAYERS = 2500
+ROUNDS = 3
+
+
+def padded_records() -> list:
+    records = []
+    for r in range(1, ROUNDS + 1):
+        for p in range(PLAYERS):
+            role = ROLE_ARCHITECT if p % 2 else ROLE_HACKER
+            record = preserve_entry_schema({
+                "id": int(str(10 ** 17 + p * 10 + r)),
+                "game_id": "1BxiMVs0XRA5nFMdKvBdBZjgmUUqptlbs74OgvE2upms",
+                "chat_id": 100000000 + p,
+                "player_username": f"player_{p}",
+                "player_name": f"Team {p}",
+                "role": role,
+                "round": r,
+                "choice": [1, 2, 6],
+            })
+            if role == ROLE_ARCHITECT:
+                record[f"protected_score_round_{r}"] = 3
+                record[f"compromised_score_round_{r}"] = 2
+                record[f"compromised_tcb_components_round_{r}"] = [4, 7]
+            else:
+                record[f"successful_attacks_score_round_{r}"] = 5
+                record[f"unsuccessful_attacks_score_round_{r}"] = 2
+                record[f"irrelevant_attacks_score_round_{r}"] = 1
+            records.append(record)
+    return records
+
+
+def resident_size(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main():
+    padded = padded_records()
+    compact = [PlayerRound.from_dict(r) for r in padded]
+    padded_memory = resident_size(padded_records)
+    compact_memory = resident_size(lambda: [PlayerRound.from_dict(r) for r in padded])
+    padded_file = len(json.dumps({"data": padded}, indent=3, ensure_ascii=False).encode("utf-8"))
+    compact_file = len(json.dumps({"data": [r.to_dict() for r in compact]}, indent=3, ensure_ascii=False).encode("utf-8"))
+    print(f"{PLAYERS} players x {ROUNDS} rounds, per player")
+    print(f"{'format':>8} {'memory, bytes':>14} {'file, bytes':>12}")
+    for name, memory, file_size in (("padded", padded_memory, padded_file), ("compact", compact_memory, compact_file)):
+        print(f"{name:>8} {memory // PLAYERS:>14} {file_size // PLAYERS:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+""" admin commands with a slow Google Sheets mirror: every Sheets call takes a while and
+some fail with 503 at first. Handlers queue the report writes, so they answer at once and
+the admin gets a notice when the write is done. Choices are streamed to the sheet as they come,
+/endround only sends rows not written yet, so Sheets calls follow the changes, not the players.
+Reports handler latency, time until all report writes are done, Sheets calls and the report queue statistics.
+
+usage: python benchmarks/bench_reports.py
+"""
+import asyncio
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from bench_rooms import FakeSession, update  # noqa: E402
+
+SHEETS_LATENCY = 0.5
+FAILURE_RATE = 0.3
+GAMES = 5
+PLAYERS = 20
+
+
+class SlowReport:
+    """ Google Sheets stand-in, calls take SHEETS_LATENCY seconds and sometimes fail """
+    calls = 0
+    rows = 0
+
+    def __init__(self, sheet_id=None):
+        self.sheet_id = sheet_id
+
+    def _call(self):
+        import httplib2
+        from googleapiclient.errors import HttpError
+        SlowReport.calls += 1
+        time.sleep(SHEETS_LATENCY)
+        if random.random() < FAILURE_RATE:
+            raise HttpError(httplib2.Response({"status": 503}), b"")
+
+    def create_game_details_sheet(self, game_id):
+        self._call()
+        self.sheet_id = f"sheet-{game_id}"
+        return self.sheet_id
+
+    def write_rows(self, rows):
+        self._call()
+        SlowReport.rows += len(rows)
+        return len(rows)
+
+    def reset_game_data(self):
+        self._call()
+
+
+async def run(bot_module) -> dict:
+    from aiogram import Bot, Dispatcher
+    from aiogram.enums import ParseMode
+    from google_sheets.pipeline import ReportQueue
+    from rooms import RoomRegistry
+    from session_storage import PlayerSessionStorage
+
+    bot_module.reports = ReportQueue(backoff=0.2)
+    bot_module.rooms = RoomRegistry(create_report=SlowReport, reports=bot_module.reports)
+    session = FakeSession()
+    bot = Bot(token="42:BENCH", session=session, parse_mode=ParseMode.HTML)
+    dp = Dispatcher(storage=PlayerSessionStorage())
+    dp.include_router(bot_module.form_router)
+    update_ids = iter(range(1, 10 ** 9))
+    handler_ms = {}
+
+    async def feed(user_id: int, username: str, text: str) -> None:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update(next(update_ids), user_id, username, text))
+        command = text.split()[0]
+        if command.startswith("/"):
+            handler_ms.setdefault(command, []).append((time.perf_counter() - started) * 1000)
+
+    async def game(n: int) -> None:
+        admin_id = 10 ** 6 + n
+        await feed(admin_id, f"admin_{n}", "/newgame")
+        code = re.search(r"Код для подключения: (\w+)", session.last_text[admin_id]).group(1)
+        await feed(admin_id, f"admin_{n}", "/reset")
+        for p in range(PLAYERS):
+            user_id = n * 1000 + p
+            for text in (f"/start {code}", f"Team {p}", "Архитектор" if p % 2 else "Хакер", "1,2"):
+                await feed(user_id, f"player_{n}_{p}", text)
+        await feed(admin_id, f"admin_{n}", "/endround 1")
+        # nothing has changed since, no rows are sent
+        await feed(admin_id, f"admin_{n}", "/endround 1")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(game(n) for n in range(GAMES)))
+    answered = time.perf_counter() - started
+    while bot_module.reports.depth() > 0 or any(room._flush is not None for room in rooms_of(bot_module)):
+        await asyncio.sleep(0.05)
+    written = time.perf_counter() - started
+    return {"handler_ms": handler_ms, "answered": answered, "written": written,
+            "stats": bot_module.reports.stats()}
+
+
+def rooms_of(bot_module) -> list:
+    return list(bot_module.rooms._rooms.values())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copytree(os.path.join(ROOT, "resources"), os.path.join(work_dir, "resources"))
+        os.chdir(work_dir)
+        os.environ["GAME_ADMINS_TG_USERNAMES"] = ",".join(f"admin_{n}" for n in range(GAMES))
+        import kipr_game_bot
+
+        result = asyncio.run(run(kipr_game_bot))
+        print(f"{GAMES} games, Sheets calls take {SHEETS_LATENCY * 1000:.0f} ms, {FAILURE_RATE:.0%} fail with 503")
+        for command, values in sorted(result["handler_ms"].items()):
+            print(f"{command:>12}: handler max {max(values):7.1f} ms")
+        print(f"all commands answered in {result['answered']:.2f} s, all report writes done in {result['written']:.2f} s")
+        print(f"{GAMES * PLAYERS} choices, {SlowReport.rows} rows written in {SlowReport.calls} Sheets calls "
+              f"(retries and spreadsheet creation included)")
+        print(f"report queue: {result['stats']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+""" many workshops at once in one bot process: every room gets an admin and players who join
+by the room code, register and send their choices, then the admin ends the round.
+Updates are fed to the bot's dispatcher, Bot API calls are answered by a fake session
+after a simulated network latency, players pause before every message.
+Reports handler latency per room.
+
+usage: python benchmarks/bench_rooms.py
+"""
+import asyncio
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+ROOMS = 40
+PLAYERS = 25
+API_LATENCY = 0.02
+# players type: a pause before each message, uniformly random up to this many seconds
+THINK_TIME = 4.0
+CHOICES = {"Архитектор": "1,2", "Хакер": "1,4"}
+
+
+class FakeSession:
+    """ stands in for the aiohttp session of the bot, remembers the last text sent to every chat """
+
+    def __new__(cls):
+        from aiogram.client.session.base import BaseSession
+
+        class _FakeSession(BaseSession):
+            def __init__(self) -> None:
+                super().__init__()
+                self.last_text = {}
+                self.calls = 0
+
+            async def make_request(self, bot, method, timeout=None):
+                from aiogram import methods
+                from aiogram.types import Chat, Message, PhotoSize, User
+                self.calls += 1
+                await asyncio.sleep(API_LATENCY)
+                if isinstance(method, methods.GetMe):
+                    return User(id=1, is_bot=True, first_name="KIPR", username="kipr_bench_bot")
+                chat = Chat(id=getattr(method, "chat_id", 0), type="private")
+                photo = [PhotoSize(file_id=f"photo-{self.calls}", file_unique_id=str(self.calls), width=1, height=1)]
+                if isinstance(method, methods.SendMessage):
+                    self.last_text[method.chat_id] = method.text
+                    return Message(message_id=self.calls, date=0, chat=chat, text=method.text)
+                if isinstance(method, methods.SendPhoto):
+                    return Message(message_id=self.calls, date=0, chat=chat, photo=photo)
+                if isinstance(method, methods.SendMediaGroup):
+                    return [Message(message_id=self.calls, date=0, chat=chat, photo=photo) for _ in method.media]
+                return True
+
+            async def stream_content(self, *args, **kwargs):
+                yield b""
+
+            async def close(self) -> None:
+                pass
+
+        return _FakeSession()
+
+
+def update(update_id: int, user_id: int, username: str, text: str):
+    from aiogram.types import Update
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "text": text,
+                    "chat": {"id": user_id, "type": "private", "username": username},
+                    "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username}}})
+
+
+async def run_rooms(bot_module) -> dict:
+    from aiogram import Bot, Dispatcher
+    from aiogram.enums import ParseMode
+    from session_storage import PlayerSessionStorage
+
+    session = FakeSession()
+    bot = Bot(token="42:BENCH", session=session, parse_mode=ParseMode.HTML)
+    dp = Dispatcher(storage=PlayerSessionStorage())
+    dp.include_router(bot_module.form_router)
+    latencies = {}
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def feed(room: int, user_id: int, username: str, text: str) -> None:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update(next(update_ids), user_id, username, text))
+        latencies.setdefault(room, []).append(time.perf_counter() - started)
+
+    async def player(room: int, code: str, n: int) -> None:
+        user_id = room * 1000 + n
+        username = f"player_{room}_{n}"
+        role = "Архитектор" if n % 2 else "Хакер"
+        for text in (f"/start {code}", f"Team {n}", role, CHOICES[role]):
+            await asyncio.sleep(random.uniform(0, THINK_TIME))
+            await feed(room, user_id, username, text)
+
+    async def workshop(room: int) -> None:
+        admin_id = 10 ** 6 + room
+        await feed(room, admin_id, f"admin_{room}", "/newgame")
+        code = re.search(r"Код для подключения: (\w+)", session.last_text[admin_id]).group(1)
+        await asyncio.gather(*(player(room, code, n) for n in range(PLAYERS)))
+        await feed(room, admin_id, f"admin_{room}", "/endround 1")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(workshop(r) for r in range(ROOMS)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "latencies": latencies, "api_calls": session.calls}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copytree(os.path.join(ROOT, "resources"), os.path.join(work_dir, "resources"))
+        os.chdir(work_dir)
+        os.environ["GAME_ADMINS_TG_USERNAMES"] = ",".join(f"admin_{r}" for r in range(ROOMS))
+        os.environ.pop("CREDENTIALS_FILE", None)
+        import kipr_game_bot
+        from persistence import stub
+
+        result = asyncio.run(run_rooms(kipr_game_bot))
+        stub.flush()
+
+        def ms(values: list, q: int) -> float:
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, len(ordered) * q // 100)] * 1000
+
+        everything = [v for values in result["latencies"].values() for v in values]
+        per_room_p99 = sorted(ms(values, 99) for values in result["latencies"].values())
+        print(f"{ROOMS} rooms x {PLAYERS} players, {len(everything)} updates, {result['api_calls']} API calls "
+              f"with {API_LATENCY * 1000:.0f} ms latency, think time up to {THINK_TIME:.0f} s, "
+              f"in {result['elapsed']:.2f} s")
+        print(f"handler latency, ms: p50 {ms(everything, 50):.1f}, p99 {ms(everything, 99):.1f}")
+        print(f"p99 by room, ms: best {per_room_p99[0]:.1f}, median {per_room_p99[len(per_room_p99) // 2]:.1f}, "
+              f"worst {per_room_p99[-1]:.1f}")
+        games = {r["game_id"] for r in stub.get_game_rooms()}
+        stored = sum(len(stub.get_game_data(g, round=1, role=None)) for g in games)
+        print(f"{len(games)} games, {stored} choices stored")
+
+
+if __name__ == "__main__":
+    main()
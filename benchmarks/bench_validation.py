@@ -0,0 +1,121 @@
+""" per-message validation cost: scanning components_full, precomputed round tables
+with string arguments, and a Choice parsed once per message.
+New messages: every call gets another message and there are more messages than cached parsed choices,
+so each one is parsed. Repeated messages: a few short messages sent again and again, as most players do,
+their parsed choices are cached.
+
+usage: python benchmarks/bench_validation.py
+"""
+import itertools
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from games.ogneborec import KiprGameOgneborec  # noqa: E402
+from persistence.stub import ROLE_ARCHITECT, ROLE_HACKER  # noqa: E402
+
+
+REPEAT = 20000
+RUNS = 5
+ROUND = 3
+
+
+def messages(max_size: int = 4, separators: tuple = (",", ", ", " , ")) -> list:
+    """ every set of up to max_size components of the round, typed in a few ways """
+    ids = sorted(KiprGameOgneborec.round_tables[ROUND-1].allowed_ids)
+    texts = []
+    for size in range(1, max_size + 1):
+        for chosen in itertools.combinations(ids, size):
+            for separator in separators:
+                texts.append(separator.join(map(str, chosen)))
+    return texts
+
+
+def scan_component_by_id(component_id: int) -> dict or None:
+    for c in KiprGameOgneborec.components_full:
+        if c["id"] == component_id:
+            return c
+    return None
+
+
+def scan_attacks_ids(round: int = 1) -> list:
+    return [c["id"] for c in KiprGameOgneborec.components_full if c["available_from_round"] <= round]
+
+
+def scan_security_costs(choice: str, round_num: int) -> int:
+    costs = 0
+    for c in choice.split(","):
+        component = scan_component_by_id(int(c))
+        if component is None or component["available_from_round"] > round_num:
+            raise ValueError("invalid choice")
+        costs += component["cost"]
+    return costs
+
+
+def scan_security_message(choice: str, round_num: int) -> bool:
+    """ previous implementation: validation and costing each scan the components, the log line is always formatted """
+    costs = scan_security_costs(choice, round_num)
+    valid = costs <= KiprGameOgneborec.security_budget[round_num-1]
+    if valid:
+        logging.debug(f"user input validation successful: chosen {choice}, calculated budget: {costs}")
+    else:
+        logging.info(f"user input validation unsuccessful: chosen {choice}, calculated budget: {costs}")
+    scan_security_costs(choice, round_num)
+    return valid
+
+
+def scan_attack_message(choice: str, round_num: int) -> bool:
+    attacks = choice.split(",")
+    if len(attacks) > KiprGameOgneborec.attack_budget[round_num-1]:
+        return False
+    for a in attacks:
+        if int(a) not in scan_attacks_ids(round=round_num):
+            return False
+    return True
+
+
+def table_security_message(choice: str, round_num: int) -> bool:
+    valid = KiprGameOgneborec.is_security_choice_valid(choice, round_num)
+    KiprGameOgneborec.calculate_security_costs(choice, round_num)
+    return valid
+
+
+def table_attack_message(choice: str, round_num: int) -> bool:
+    return KiprGameOgneborec.is_attacking_choice_valid(choice, round_num)
+
+
+def choice_security_message(text: str, round_num: int) -> bool:
+    choice = KiprGameOgneborec.parse_choice(text, round_num, ROLE_ARCHITECT)
+    valid = KiprGameOgneborec.is_security_choice_valid(choice, round_num)
+    KiprGameOgneborec.calculate_security_costs(choice, round_num)
+    return valid
+
+
+def choice_attack_message(text: str, round_num: int) -> bool:
+    choice = KiprGameOgneborec.parse_choice(text, round_num, ROLE_HACKER)
+    return KiprGameOgneborec.is_attacking_choice_valid(choice, round_num)
+
+
+def per_call_us(func, texts: list) -> float:
+    """ the best of a few runs, the others are slowed down by the rest of the machine """
+    number = max(1, REPEAT // len(texts))
+    best = min(timeit.repeat(lambda: [func(text, ROUND) for text in texts], number=number, repeat=RUNS))
+    return best * 1e6 / (number * len(texts))
+
+
+def main():
+    for title, texts in (("new messages", messages()), ("repeated messages", messages(2, (",",)))):
+        print(f"{title}: {len(texts)} messages of round {ROUND}")
+        print(f"{'message':>10} {'scan, us':>10} {'tables, us':>12} {'choice, us':>12}")
+        for name, scan, table, choice in (
+                ("architect", scan_security_message, table_security_message, choice_security_message),
+                ("hacker", scan_attack_message, table_attack_message, choice_attack_message)):
+            print(f"{name:>10} {per_call_us(scan, texts):>10.2f} {per_call_us(table, texts):>12.2f} "
+                  f"{per_call_us(choice, texts):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+""" webhook load test: 500 players post their choices to the local aiohttp server,
+end-to-end latency from posting an update until its handler has stored the choice.
+Updates handled in background tasks vs inside the request.
+
+usage: python benchmarks/bench_webhook.py
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiohttp import ClientSession, TCPConnector, web  # noqa: E402
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler  # noqa: E402
+from games.ogneborec import KiprGameOgneborec  # noqa: E402
+from persistence import aio as storage  # noqa: E402
+from persistence import stub  # noqa: E402
+
+
+PLAYERS = 500
+# simultaneous connections of Telegram to the webhook, max_connections of setWebhook
+CONNECTIONS = 40
+SECRET = "bench"
+CHOICES = ["1,2", "3,4,6", "7,8", "1,5"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def update(player: int) -> dict:
+    return {"update_id": player,
+            "message": {"message_id": player, "date": 0, "text": CHOICES[player % len(CHOICES)],
+                        "chat": {"id": player, "type": "private"},
+                        "from": {"id": player, "is_bot": False, "first_name": f"Team {player}"}}}
+
+
+def make_dispatcher(done: dict) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def choice_handler(message: Message) -> None:
+        player = message.chat.id
+        role = stub.ROLE_ARCHITECT if player % 2 else stub.ROLE_HACKER
+        parsed = KiprGameOgneborec.parse_choice(message.text, 1, role)
+        await storage.run(KiprGameOgneborec.store_update_choice, choice={
+            "game_id": "bench", "chat_id": player, "player_username": f"player_{player}",
+            "player_name": message.from_user.first_name, "role": role, "choice": parsed.ids}, round=1)
+        done[player] = time.perf_counter()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def load(handle_in_background: bool) -> tuple:
+    done = {}
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=make_dispatcher(done), bot=Bot(token="42:BENCH"),
+                         handle_in_background=handle_in_background, secret_token=SECRET).register(app, path="/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    posted = {}
+    try:
+        async with ClientSession(connector=TCPConnector(limit=CONNECTIONS)) as session:
+            async def post(player: int) -> None:
+                posted[player] = time.perf_counter()
+                async with session.post(f"http://127.0.0.1:{port}/webhook", json=update(player),
+                                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                    assert response.status == 200
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(p) for p in range(PLAYERS)))
+            while len(done) < PLAYERS:
+                await asyncio.sleep(0.001)
+            elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+    latencies = sorted(done[p] - posted[p] for p in range(PLAYERS))
+    return elapsed, latencies[len(latencies) // 2] * 1000, latencies[len(latencies) * 99 // 100] * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        print(f"{'handling':>12} {'total, s':>9} {'updates/s':>10} {'p50, ms':>9} {'p99, ms':>9}")
+        for name, background in (("in request", False), ("background", True)):
+            stub._force_backend(stub.BACKEND_JSON)
+            stub.reset_game_data()
+            KiprGameOgneborec.reset_live_scores()
+            elapsed, p50, p99 = asyncio.run(load(background))
+            print(f"{name:>12} {elapsed:>9.3f} {PLAYERS / elapsed:>10.0f} {p50:>9.2f} {p99:>9.2f}")
+        stub.flush()
+        stub._force_backend(stub.BACKEND_JSON)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+""" update flood in the multi-worker mode: players already in a game send their choices all at once,
+the front routes the updates by chat to 1, 2 and 4 worker processes, workers share the state service.
+Bot API calls are answered by a fake session without latency, so the handlers are CPU bound.
+Reports updates per second until all choices are stored.
+
+usage: python benchmarks/bench_workers.py
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from bench_rooms import FakeSession, update  # noqa: E402
+
+PLAYERS = 2000
+WORKERS = (1, 2, 4)
+GAME_ID = "bench-game"
+BOT_ID = 42
+CHOICES = {"архитектор": "1,2", "хакер": "1,4"}
+
+
+def make_bot():
+    """ called in the worker processes """
+    import logging
+    from aiogram import Bot
+    from aiogram.enums import ParseMode
+    # a log line per handled update would flood the output
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    return Bot(token=f"{BOT_ID}:BENCH", session=FakeSession(), parse_mode=ParseMode.HTML)
+
+
+def seed_players() -> None:
+    """ players have joined the game and chosen their roles """
+    from persistence import stub
+    stub._force_backend(stub.BACKEND_JSON)
+    stub.set_last_game_id(GAME_ID)
+    stub.set_game_status(game_id=GAME_ID, round=1, status=stub.GAME_STATUS_IN_PROGRESS)
+    for chat_id in range(1, PLAYERS + 1):
+        stub.store_player_session({"key": f"{BOT_ID}:{chat_id}:{chat_id}", "state": "Form:choice",
+                                   "name": f"Team {chat_id}", "role": role(chat_id), "extra": {"game_id": GAME_ID}})
+    stub.flush()
+
+
+def role(chat_id: int) -> str:
+    return "архитектор" if chat_id % 2 else "хакер"
+
+
+async def flood(workers: int) -> dict:
+    import kipr_game_bot
+    from persistence import aio as storage
+    from workers import start_workers, stop_workers
+
+    processes, router = await start_workers(workers, "./sockets", kipr_game_bot.run_worker, make_bot)
+    try:
+        updates = [update(n, n, f"player_{n}", CHOICES[role(n)]).model_dump(mode="json", by_alias=True,
+                                                                            exclude_none=True)
+                   for n in range(1, PLAYERS + 1)]
+        started = time.perf_counter()
+        for u in updates:
+            await router.route(u)
+        while True:
+            # participant counts of committed choices, player records aren't sent to the front
+            totals = await storage.get_round_totals(GAME_ID, round=1)
+            if totals["architects_count"] + totals["hackers_count"] >= PLAYERS:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    finally:
+        await router.close()
+        stop_workers(processes)
+    return {"elapsed": elapsed, "routed": router.routed}
+
+
+def main():
+    os.environ.setdefault("GAME_ADMINS_TG_USERNAMES", "admin")
+    print(f"{PLAYERS} choices, {os.cpu_count()} cpu cores")
+    print(f"{'workers':>8} {'seconds':>8} {'updates/s':>10}  updates per worker")
+    for workers in WORKERS:
+        with tempfile.TemporaryDirectory() as work_dir:
+            shutil.copytree(os.path.join(ROOT, "resources"), os.path.join(work_dir, "resources"))
+            os.chdir(work_dir)
+            seed_players()
+            result = asyncio.run(flood(workers))
+            print(f"{workers:>8} {result['elapsed']:>8.2f} {PLAYERS / result['elapsed']:>10.0f}  {result['routed']}")
+            os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+""" broadcasts to players within Telegram flood limits: bounded concurrency,
+global and per-chat token buckets, retries on flood control and network errors
+"""
+import asyncio
+import logging
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+# about 30 messages per second to all chats and about 1 per second to one chat
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+# a round intro is a few messages in a row, short bursts to one chat are tolerated
+CHAT_BURST = 4
+
+
+class TokenBucket:
+    """ allows `rate` acquisitions per second on average and up to `capacity` at once """
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = None
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self._updated is None:
+            self._updated = now
+        elif now > self._updated:
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._refill(now)
+            wait = self._paused_until - now
+            if wait <= 0:
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """ nothing is acquired for `seconds`, then the bucket starts empty """
+        now = asyncio.get_running_loop().time()
+        self._refill(now)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+class _RateLimitedBot:
+    """ bot-like object for broadcast jobs, every method call goes through the scheduler """
+
+    def __init__(self, scheduler: "BroadcastScheduler") -> None:
+        self._scheduler = scheduler
+
+    def __getattr__(self, method: str):
+        async def call(chat_id, *args, **kwargs):
+            return await self._scheduler.call(method, chat_id, *args, **kwargs)
+        return call
+
+
+class BroadcastScheduler:
+    """
+    Sends to many chats at once, at most `concurrency` chats at a time. Messages to one chat
+    keep their order, a chat whose messages fail is skipped and reported as failed.
+    """
+
+    def __init__(self, bot, concurrency: int = 20, rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: float = CHAT_BURST, max_retries: int = 5) -> None:
+        self._bot = bot
+        self._concurrency = concurrency
+        self._global = TokenBucket(rate, capacity=rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats = {}
+        self._max_retries = max_retries
+        self.retries = 0
+
+    def _chat(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, capacity=self._chat_burst)
+        return bucket
+
+    async def call(self, method: str, chat_id, *args, **kwargs):
+        """ one Bot API call to the chat within the limits, retried on flood control and network errors """
+        chat = self._chat(chat_id)
+        attempt = 0
+        while True:
+            await chat.acquire()
+            await self._global.acquire()
+            try:
+                return await getattr(self._bot, method)(chat_id, *args, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                # flood control may apply to the whole bot, everything waits
+                logging.warning(f"flood control on {method} to {chat_id}, retry in {e.retry_after} s")
+                self._global.pause(e.retry_after)
+                chat.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt >= self._max_retries:
+                    raise
+                logging.warning(f"{method} to {chat_id} failed, retrying: {e}")
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 10))
+            attempt += 1
+            self.retries += 1
+
+    async def broadcast(self, chat_ids, job, progress=None, progress_every: float = 5.0) -> dict:
+        """
+        Runs `await job(bot, chat_id)` for every chat, `bot` is rate limited.
+        `await progress(stats)` is called every `progress_every` seconds and when done.
+        Returns {"total", "delivered", "failed"}.
+        """
+        chat_ids = list(dict.fromkeys(chat_ids))
+        stats = {"total": len(chat_ids), "delivered": 0, "failed": 0}
+        bot = _RateLimitedBot(self)
+        pending = iter(chat_ids)
+
+        async def worker() -> None:
+            for chat_id in pending:
+                try:
+                    await job(bot, chat_id)
+                    stats["delivered"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    logging.error(f"failed to deliver broadcast to {chat_id}: {e}")
+
+        async def report() -> None:
+            try:
+                await progress(dict(stats))
+            except Exception as e:
+                logging.error(f"failed to report broadcast progress: {e}")
+
+        async def report_periodically() -> None:
+            while True:
+                await asyncio.sleep(progress_every)
+                await report()
+
+        reporter = asyncio.create_task(report_periodically()) if progress is not None else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self._concurrency, len(chat_ids)))))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        if progress is not None:
+            await report()
+        return stats
@@ -0,0 +1,47 @@
+""" player choice parsed once per message and shared by validation, costing and storage
+"""
+from typing import NamedTuple
+from games.tables import RoundTable
+
+
+class Choice(NamedTuple):
+    # message text as the player sent it
+    text: str
+    # normalized component ids: sorted, without repetitions
+    ids: tuple
+    mask: int
+    # protection cost of the components, counted for valid ids only
+    cost: int
+    valid: bool
+
+
+def parse_choice(text: str or None, table: RoundTable, is_hacker: bool) -> Choice:
+    """ architects' choices are limited by the security budget, hackers' by the number of attacks """
+    if not isinstance(text, str):
+        # stickers, photos and voice messages have no text
+        return Choice(text=text or "", ids=(), mask=0, cost=0, valid=False)
+    tokens = text.split(",")
+    try:
+        # the usual message: ids of the round separated by commas and spaces
+        ids = set(map(table.ids_by_token.__getitem__, map(str.strip, tokens)))
+    except KeyError:
+        try:
+            ids = set(map(int, tokens))
+        except ValueError:
+            # not a number
+            return Choice(text=text, ids=(), mask=0, cost=0, valid=False)
+        if not ids <= table.allowed_ids:
+            # no such component in this round
+            return Choice(text=text, ids=tuple(sorted(ids)), mask=0, cost=0, valid=False)
+    ids = tuple(sorted(ids))
+    costs = table.costs
+    mask = 0
+    cost = 0
+    for c in ids:
+        mask |= 1 << c
+        cost += costs[c]
+    if is_hacker:
+        valid = len(ids) <= table.attack_budget
+    else:
+        valid = cost <= table.security_budget
+    return Choice(text, ids, mask, cost, valid)
@@ -0,0 +1,75 @@
+""" local ranking of players: per-round and cumulative scores, ranks by role and feedback text.
+
+Updated incrementally when a round closes: each player's total changes by the
+difference with the previous score of that round, and every role keeps its totals
+sorted, so a rank is a binary search.
+"""
+from bisect import bisect_right, insort
+
+
+class Leaderboard:
+    """ architects and hackers are ranked separately, their scores aren't comparable """
+
+    def __init__(self) -> None:
+        # chat_id -> {"name", "role", "rounds": {round: score}, "total"}
+        self._players = {}
+        # role -> ascending totals of all its players
+        self._totals = {}
+
+    def close_round(self, round: int, players) -> None:
+        """ players are (chat_id, name, role, score), closing a round again replaces its scores """
+        for chat_id, name, role, score in players:
+            player = self._players.get(chat_id)
+            if player is None:
+                player = self._players[chat_id] = {"name": name, "role": role, "rounds": {}, "total": 0}
+                insort(self._totals.setdefault(role, []), 0)
+            elif player["role"] != role:
+                # a player record changed its role, the player moves to the other ranking
+                self._move(player["role"], player["total"], role, 0)
+                player["role"] = role
+                player["total"] = 0
+                player["rounds"] = {}
+            player["name"] = name
+            total = player["total"] - player["rounds"].get(round, 0) + score
+            self._move(role, player["total"], role, total)
+            player["rounds"][round] = score
+            player["total"] = total
+
+    def _move(self, old_role: str, old_total: int, new_role: str, new_total: int) -> None:
+        totals = self._totals[old_role]
+        del totals[bisect_right(totals, old_total) - 1]
+        insort(self._totals.setdefault(new_role, []), new_total)
+
+    def rank(self, chat_id) -> int or None:
+        """ 1 for the best total, players with equal totals share the rank """
+        player = self._players.get(chat_id)
+        if player is None:
+            return None
+        totals = self._totals[player["role"]]
+        return len(totals) - bisect_right(totals, player["total"]) + 1
+
+    def score(self, chat_id, round: int) -> int:
+        player = self._players.get(chat_id)
+        return 0 if player is None else player["rounds"].get(round, 0)
+
+    def total(self, chat_id) -> int:
+        player = self._players.get(chat_id)
+        return 0 if player is None else player["total"]
+
+    def standings(self, role: str) -> list:
+        """ (rank, name, total) of the role's players, best first """
+        players = sorted((p for p in self._players.values() if p["role"] == role), key=lambda p: -p["total"])
+        totals = self._totals.get(role, [])
+        return [(len(totals) - bisect_right(totals, p["total"]) + 1, p["name"], p["total"]) for p in players]
+
+    def feedback(self, chat_id, round: int) -> str or None:
+        if chat_id not in self._players:
+            return None
+        return f"* за этот ход вы получаете {self.score(chat_id, round)} очков\n" + \
+               f"* общее количество очков {self.total(chat_id)}\n" + \
+               f"ваша позиция в рейтинге №{self.rank(chat_id)}."
+
+    def round_feedback(self, round: int) -> dict:
+        """ chat_id -> feedback of every player scored in the round """
+        return {chat_id: self.feedback(chat_id, round)
+                for chat_id, player in self._players.items() if round in player["rounds"]}
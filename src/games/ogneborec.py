@@ -1,5 +1,12 @@
+import functools
 import logging
-from persistence.stub import get_game_data, store_update_score, get_round_summary, ROLE_ARCHITECT, ROLE_HACKER, get_round_details
+from types import MappingProxyType
+from games.choice import Choice, parse_choice
+from games.leaderboard import Leaderboard
+from games.scoring import LiveRoundScoring, ids_to_mask, mask_to_ids
+from games.tables import RoundTable, build_round_tables
+from persistence.stub import get_game_data, store_update_scores, get_round_summary, ROLE_ARCHITECT, ROLE_HACKER, get_round_details
+from persistence.stub import store_update_choice as _store_update_choice
 
 
 class KiprGameOgneborec:
@@ -109,21 +116,24 @@ class KiprGameOgneborec:
         }
     ]
 
+    components_by_id = MappingProxyType({c["id"]: c for c in components_full})
+    max_component_id = max(c["id"] for c in components_full)
+
+    @staticmethod
+    def get_round_table(round: int = 1) -> RoundTable:
+        return KiprGameOgneborec.round_tables[round-1]
+
     @staticmethod
     def get_attacks_text(round: int = 1) -> list:
-        attacks = []
-        for c in KiprGameOgneborec.components_full:
-            if c["available_from_round"] <= round:
-                attacks.append(f'{c["name"]}: {c["attack_text"]}')
-        return attacks
+        return list(KiprGameOgneborec.round_tables[round-1].attacks_text)
+
+    @staticmethod
+    def get_attacks_text_block(round: int = 1) -> str:
+        return KiprGameOgneborec.round_tables[round-1].attacks_text_block
 
     @staticmethod
     def get_attacks_ids(round: int = 1) -> list:
-        attacks = []
-        for c in KiprGameOgneborec.components_full:
-            if c["available_from_round"] <= round:
-                attacks.append(c["id"])
-        return attacks
+        return sorted(KiprGameOgneborec.round_tables[round-1].allowed_ids)
 
     @staticmethod
     def message_round_2_architects() -> str:
@@ -159,65 +169,46 @@ class KiprGameOgneborec:
     round_3_attack_budget_limit = 6
     security_budget = [round_1_security_budget_limit, round_2_security_budget_limit, round_3_security_budget_limit]
     attack_budget = [round_1_attack_budget_limit, round_2_attack_budget_limit, round_3_attack_budget_limit]
+    # built once at class load, validation, costing, scoring and round intro read from them
+    round_tables = build_round_tables(components_full, security_budget, attack_budget)
 
     @staticmethod
     def get_component_by_id(component_id: int) -> dict or None:
-        for c in KiprGameOgneborec.components_full:
-            if c["id"] == component_id:
-                return c
-        return None
+        return KiprGameOgneborec.components_by_id.get(component_id)
 
     @staticmethod
-    def calculate_security_costs(choice: str, round_num: int) -> int:
-        components = choice.split(",")
-        security_budget = 0
-        for c in components:
-            try:
-                c_index = int(c)
-            except Exception as e:
-                logging.error(f"user input validation failed: {e}")
-                raise e
-            component = KiprGameOgneborec.get_component_by_id(c_index)
-            if component is None or component["available_from_round"] > round_num:
-                logging.error("user input validation failed: invalid choice")
-                raise ValueError("invalid choice")
-            security_budget += component["cost"]
-        return security_budget
+    @functools.lru_cache(maxsize=1024)
+    def parse_choice(choice: str, round_num: int, role: str) -> Choice:
+        """
+        parses the player message once, the result is passed to validation, costing and storage.
+        Parsed choices are immutable and cached, callers passing the text to several checks share one parse.
+        """
+        return parse_choice(choice, KiprGameOgneborec.round_tables[round_num-1], is_hacker=role == ROLE_HACKER)
 
     @staticmethod
-    def is_security_choice_valid(choice: str, round_num: int):
-        validation_result = False
-        try:
-            security_budget = KiprGameOgneborec.calculate_security_costs(
-                choice, round_num)
-        except Exception as _:
-            return False
-
-        if security_budget <= KiprGameOgneborec.security_budget[round_num-1]:
-            validation_result = True
-            logging.debug(
-                f"user input validation successful: chosen {choice}, calculated budget: {security_budget}")
+    def calculate_security_costs(choice: str or Choice, round_num: int) -> int:
+        if not isinstance(choice, Choice):
+            choice = KiprGameOgneborec.parse_choice(choice, round_num, ROLE_ARCHITECT)
+        if choice.mask == 0:
+            logging.error("user input validation failed: invalid choice %s", choice.text)
+            raise ValueError("invalid choice")
+        return choice.cost
+
+    @staticmethod
+    def is_security_choice_valid(choice: str or Choice, round_num: int):
+        if not isinstance(choice, Choice):
+            choice = KiprGameOgneborec.parse_choice(choice, round_num, ROLE_ARCHITECT)
+        if choice.valid:
+            logging.debug("user input validation successful: chosen %s, calculated budget: %s", choice.text, choice.cost)
         else:
-            logging.info(
-                f"user input validation unsuccessful: chosen {choice}, calculated budget: {security_budget}")
-        return validation_result
+            logging.info("user input validation unsuccessful: chosen %s, calculated budget: %s", choice.text, choice.cost)
+        return choice.valid
 
     @staticmethod
-    def is_attacking_choice_valid(choice: str, round_num: int):
-        attacks = choice.split(",")
-        if len(attacks) > KiprGameOgneborec.attack_budget[round_num-1]:
-            return False
-        for a in attacks:
-            try:
-                a_index = int(a)
-            except Exception as _:
-                # not a number
-                return False
-            allowed_attacks = KiprGameOgneborec.get_attacks_ids(round=round_num)
-            if a_index not in allowed_attacks:
-                # no such attack
-                return False
-        return True
+    def is_attacking_choice_valid(choice: str or Choice, round_num: int):
+        if not isinstance(choice, Choice):
+            choice = KiprGameOgneborec.parse_choice(choice, round_num, ROLE_HACKER)
+        return choice.valid
 
 
     @staticmethod
@@ -226,44 +217,155 @@ class KiprGameOgneborec:
             game_id=game_id, round=round, role=ROLE_ARCHITECT)
         choice_hackers = get_game_data(
             game_id=game_id, round=round, role=ROLE_HACKER)
+        # histograms are already up to date, only players' scores are derived here
+        scoring = KiprGameOgneborec.get_live_round(game_id=game_id, round=round)
+        if scoring.architects != len(choice_architects) or scoring.hackers != len(choice_hackers):
+            logging.warning(f"live scores of round {round} are out of sync with stored choices, rebuilding")
+            KiprGameOgneborec._live_rounds.pop((game_id, round), None)
+            scoring = KiprGameOgneborec.get_live_round(game_id=game_id, round=round)
+
+        # compact record scores, see persistence.records.ROLE_SCORES
+        scores = []
+        # (chat_id, name, role, round score) for the leaderboard
+        ranked = []
+        # players' result messages are rendered once, "see results" taps are served from memory
+        cards = {}
+        render = KiprGameOgneborec.render_result_card
         for a in choice_architects:
-            protected = a["choice"]
-            a[f"protected_score_round_{round}"] = 0
-            a[f"compromised_score_round_{round}"] = 0
-            for h in choice_hackers:
-                hacked = h["choice"]
-                for c in hacked:
-                    component = KiprGameOgneborec.get_component_by_id(c)
-                    if component["in_tcb"] is False:
-                        # not interested in components outside of trusted code base
-                        if h[f"irrelevant_attacks_score_round_{round}"] == -1:
-                            h[f"irrelevant_attacks_score_round_{round}"] = 1
-                        else:
-                            h[f"irrelevant_attacks_score_round_{round}"] += 1
-                        continue
-
-                    if c in protected:
-                        # attack blocked, score to the architects
-                        a[f"protected_score_round_{round}"] += 1
-                        # update unsuccessful attacks score for hackers
-                        key = f"unsuccessful_attacks_score_round_{round}"
-                    else:
-                        a[f"compromised_score_round_{round}"] += 1
-                        try:
-                            a[f"compromised_tcb_components_round_{round}"].append(c)
-                        except Exception as _:
-                            a[f"compromised_tcb_components_round_{round}"] = [c]
-                        key = f"successful_attacks_score_round_{round}"
-                    if h[key] == -1:
-                            h[key] = 1
-                    else:
-                        h[key] += 1
-                store_update_score(h)
-            store_update_score(a)
-
-        round_results = get_game_data(game_id=game_id, round=round, role=None)
-        logging.debug(round_results)
+            protected, compromised, compromised_components = scoring.architect_score(a["choice"])
+            compromised_mask = ids_to_mask(compromised_components)
+            scores.append({"id": a["id"], "game_id": game_id, "scores": [protected, compromised],
+                           "compromised_mask": compromised_mask})
+            cards[a["chat_id"]] = render(round, ROLE_ARCHITECT, (protected, compromised), compromised_mask)
+            ranked.append((a["chat_id"], a["player_name"], ROLE_ARCHITECT, protected))
+        for h in choice_hackers:
+            successful, unsuccessful, irrelevant = scoring.hacker_score(h["choice"])
+            scores.append({"id": h["id"], "game_id": game_id, "scores": [successful, unsuccessful, irrelevant]})
+            cards[h["chat_id"]] = render(round, ROLE_HACKER, (successful, unsuccessful, irrelevant))
+            ranked.append((h["chat_id"], h["player_name"], ROLE_HACKER, successful))
+
+        # scores are calculated in memory, all players are persisted as one batch
+        store_update_scores(scores)
+        KiprGameOgneborec._result_cards[(game_id, round)] = cards
+        KiprGameOgneborec.get_leaderboard(game_id=game_id).close_round(round, ranked)
+        logging.debug(f"round {round} results calculated for {len(choice_architects)} architects "
+                      f"and {len(choice_hackers)} hackers")
+
+
+    # (game_id, round) -> LiveRoundScoring, updated on every stored choice
+    _live_rounds = {}
+
+    @staticmethod
+    def get_live_round(game_id: str, round: int = 1) -> LiveRoundScoring:
+        key = (game_id, round)
+        scoring = KiprGameOgneborec._live_rounds.get(key)
+        if scoring is None:
+            # first access after start or reset, restore from already stored choices
+            scoring = LiveRoundScoring(tcb_mask=KiprGameOgneborec.round_tables[round-1].tcb_mask,
+                                       max_component_id=KiprGameOgneborec.max_component_id)
+            for p in get_game_data(game_id=game_id, round=round, role=None):
+                scoring.update_choice(p["player_username"], p["role"] == ROLE_HACKER, p["choice"])
+            KiprGameOgneborec._live_rounds[key] = scoring
+        return scoring
+
+    @staticmethod
+    def store_update_choice(choice: dict, round: int = 1) -> None:
+        """ stores the player choice and updates live scores of the round with it """
+        data = _store_update_choice(choice=choice, round=round)
+        scoring = KiprGameOgneborec.get_live_round(game_id=data["game_id"], round=round)
+        scoring.update_choice(data["player_username"], data["role"] == ROLE_HACKER, data["choice"])
+
+    @staticmethod
+    def reset_live_scores(game_id: str or None = None) -> None:
+        """ drops everything cached for rounds of the game, of all games if no game is given """
+        if game_id is None:
+            KiprGameOgneborec._live_rounds = {}
+            KiprGameOgneborec._result_cards = {}
+            KiprGameOgneborec._leaderboards = {}
+            return
+        for cache in (KiprGameOgneborec._live_rounds, KiprGameOgneborec._result_cards):
+            for key in [k for k in cache if k[0] == game_id]:
+                del cache[key]
+        KiprGameOgneborec._leaderboards.pop(game_id, None)
+
+    # (game_id, round) -> {chat_id: result message}, rendered when the round is scored
+    _result_cards = {}
 
+    @staticmethod
+    def render_result_card(round: int, role: str, scores: list, compromised_mask: int = 0) -> str:
+        text = f"Результаты игры для шага {round}\n"
+        if role == ROLE_ARCHITECT:
+            protected, compromised = scores
+            text += f"Успешная защита: {protected}\n" \
+                    f"Пропущенные критические атаки: {compromised}"
+            if compromised > 0:
+                text += "\n\nУспешные атаки:\n"
+                for c in mask_to_ids(compromised_mask):
+                    component = KiprGameOgneborec.components_by_id[c]
+                    text += component["name"] + ": " + component["attack_text"] + "\n"
+        elif role == ROLE_HACKER:
+            successful, unsuccessful, _ = scores
+            text += f"Успешный взлом: {successful}\n" \
+                    f"Заблокированный взлом: {unsuccessful}"
+        else:
+            text = "неопределённая роль, нельзя интерпретировать результаты"
+        return text
+
+    @staticmethod
+    def _render_result_cards(players: list, round: int) -> dict:
+        return {
+            p["chat_id"]: KiprGameOgneborec.render_result_card(round, p["role"], p["scores"], p["compromised_mask"])
+            for p in players if p["scores"] is not None
+        }
+
+    @staticmethod
+    def peek_result_cards(game_id: str, round: int = 1) -> dict or None:
+        """ cached result cards of the round, never reads storage, None if not cached """
+        return KiprGameOgneborec._result_cards.get((game_id, round))
+
+    @staticmethod
+    def get_result_cards(game_id: str, round: int = 1) -> dict:
+        """ chat_id -> result message, rendered from stored scores if not cached (e.g. after restart) """
+        cards = KiprGameOgneborec.peek_result_cards(game_id=game_id, round=round)
+        if cards is None:
+            cards = KiprGameOgneborec._render_result_cards(get_round_details(game_id=game_id, round=round), round)
+            KiprGameOgneborec._result_cards[(game_id, round)] = cards
+        return cards
+
+    # game_id -> Leaderboard, updated when a round is scored
+    _leaderboards = {}
+
+    @staticmethod
+    def get_leaderboard(game_id: str) -> Leaderboard:
+        leaderboard = KiprGameOgneborec._leaderboards.get(game_id)
+        if leaderboard is None:
+            # first access after start or reset, restore from already stored scores
+            leaderboard = Leaderboard()
+            rounds = {}
+            for p in get_game_data(game_id=game_id, round=None, role=None):
+                if p["scores"] is not None:
+                    rounds.setdefault(p["round"], []).append(
+                        (p["chat_id"], p["player_name"], p["role"], p["scores"][0]))
+            for r in sorted(rounds):
+                leaderboard.close_round(r, rounds[r])
+            KiprGameOgneborec._leaderboards[game_id] = leaderboard
+        return leaderboard
+
+    @staticmethod
+    def peek_round_feedback(game_id: str, round: int = 1) -> dict or None:
+        """ feedback of the cached leaderboard, never reads storage, None if not cached """
+        leaderboard = KiprGameOgneborec._leaderboards.get(game_id)
+        return None if leaderboard is None else leaderboard.round_feedback(round)
+
+    @staticmethod
+    def get_round_feedback(game_id: str, round: int = 1) -> dict:
+        """ chat_id -> round score, total score and rating position text of the round players """
+        return KiprGameOgneborec.get_leaderboard(game_id=game_id).round_feedback(round)
+
+    @staticmethod
+    def get_live_round_summary(game_id: str, round: int = 1) -> dict:
+        """ provisional round totals and participant counts, before the round is over """
+        return KiprGameOgneborec.get_live_round(game_id=game_id, round=round).summary()
 
     @staticmethod
     def get_round_summary(game_id: str, round: int = 1):
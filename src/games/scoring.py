@@ -0,0 +1,118 @@
+""" round scoring on component bitmasks.
+
+Every choice is a set of component ids, stored as a bitmask (bit N is component N).
+Instead of checking every architect against every hacker, the round keeps
+per-component histograms: how many times each component is attacked and how many
+architects protect it. Each player's score is then derived from the histograms,
+so scoring a round costs O((architects + hackers) * components).
+"""
+
+
+def ids_to_mask(ids) -> int:
+    mask = 0
+    for i in ids:
+        mask |= 1 << i
+    return mask
+
+
+def mask_to_ids(mask: int) -> list:
+    ids = []
+    i = 0
+    while mask:
+        if mask & 1:
+            ids.append(i)
+        mask >>= 1
+        i += 1
+    return ids
+
+
+class RoundScoring:
+    """
+    Aggregated choices of one round. Hacker choices are counted with repetitions,
+    as every listed attack is played separately; for architects only the set of
+    protected components matters.
+    """
+
+    def __init__(self, tcb_mask: int, max_component_id: int) -> None:
+        self._tcb_mask = tcb_mask
+        self._attacks = [0] * (max_component_id + 1)
+        self._protectors = [0] * (max_component_id + 1)
+        self._tcb_attacks = 0
+        self.architects = 0
+        self.hackers = 0
+
+    def add_hacker(self, choice: list, sign: int = 1) -> None:
+        """ sign -1 retracts a previously added choice """
+        for c in choice:
+            self._attacks[c] += sign
+            if self._tcb_mask >> c & 1:
+                self._tcb_attacks += sign
+        self.hackers += sign
+
+    def add_architect(self, choice: list, sign: int = 1) -> None:
+        for c in mask_to_ids(ids_to_mask(choice)):
+            self._protectors[c] += sign
+        self.architects += sign
+
+    def architect_score(self, choice: list) -> tuple:
+        """ returns protected and compromised counts and compromised tcb components, one entry per successful attack """
+        protected_mask = ids_to_mask(choice) & self._tcb_mask
+        protected = 0
+        for c in mask_to_ids(protected_mask):
+            protected += self._attacks[c]
+        compromised_components = []
+        for c in mask_to_ids(self._tcb_mask & ~protected_mask):
+            compromised_components.extend([c] * self._attacks[c])
+        return protected, self._tcb_attacks - protected, compromised_components
+
+    def hacker_score(self, choice: list) -> tuple:
+        """ returns successful, unsuccessful and irrelevant attacks against all architects of the round """
+        successful = 0
+        unsuccessful = 0
+        irrelevant = 0
+        for c in choice:
+            if self._tcb_mask >> c & 1:
+                unsuccessful += self._protectors[c]
+                successful += self.architects - self._protectors[c]
+            else:
+                irrelevant += self.architects
+        return successful, unsuccessful, irrelevant
+
+
+class LiveRoundScoring(RoundScoring):
+    """
+    Round histograms kept up to date while choices arrive: a changed choice
+    retracts the player's previous contribution and adds the new one.
+    """
+
+    def __init__(self, tcb_mask: int, max_component_id: int) -> None:
+        super().__init__(tcb_mask=tcb_mask, max_component_id=max_component_id)
+        # player -> (is hacker, choice)
+        self._choices = {}
+
+    def update_choice(self, player: str, is_hacker: bool, choice: list) -> None:
+        previous = self._choices.get(player)
+        if previous is not None:
+            self._add(previous[0], previous[1], sign=-1)
+        self._choices[player] = (is_hacker, list(choice))
+        self._add(is_hacker, choice, sign=1)
+
+    def _add(self, is_hacker: bool, choice: list, sign: int) -> None:
+        if is_hacker:
+            self.add_hacker(choice, sign=sign)
+        else:
+            self.add_architect(choice, sign=sign)
+
+    def summary(self) -> dict:
+        """ provisional totals, same meaning as persistence get_round_summary """
+        architects_score = 0
+        hackers_score = 0
+        for c in mask_to_ids(self._tcb_mask):
+            architects_score += self._attacks[c] * self._protectors[c]
+            hackers_score += self._attacks[c] * (self.architects - self._protectors[c])
+        return {
+            "architects": architects_score,
+            "hackers": hackers_score,
+            "architects_count": self.architects,
+            "hackers_count": self.hackers
+        }
@@ -0,0 +1,47 @@
+""" immutable per-round lookup tables, built once from a game's component list
+"""
+from types import MappingProxyType
+from typing import NamedTuple
+from games.scoring import ids_to_mask
+
+
+class RoundTable(NamedTuple):
+    # id -> component, only components available in the round
+    components: MappingProxyType
+    allowed_ids: frozenset
+    # component id by its text, e.g. "3" -> 3, so messages are parsed without int()
+    ids_by_token: MappingProxyType
+    allowed_mask: int
+    # protection cost indexed by component id, 0 for unavailable components
+    costs: tuple
+    tcb_mask: int
+    # one rendered line per attack and all of them joined as a message block
+    attacks_text: tuple
+    attacks_text_block: str
+    security_budget: int
+    attack_budget: int
+
+
+def build_round_tables(components: list, security_budget: list, attack_budget: list) -> tuple:
+    """ returns one RoundTable per round, round N is at index N-1 """
+    max_component_id = max(c["id"] for c in components)
+    tables = []
+    for round_num in range(1, len(security_budget) + 1):
+        available = [MappingProxyType(dict(c)) for c in components if c["available_from_round"] <= round_num]
+        costs = [0] * (max_component_id + 1)
+        for c in available:
+            costs[c["id"]] = c["cost"]
+        attacks_text = tuple(f'{c["name"]}: {c["attack_text"]}' for c in available)
+        tables.append(RoundTable(
+            components=MappingProxyType({c["id"]: c for c in available}),
+            allowed_ids=frozenset(c["id"] for c in available),
+            ids_by_token=MappingProxyType({str(c["id"]): c["id"] for c in available}),
+            allowed_mask=ids_to_mask(c["id"] for c in available),
+            costs=tuple(costs),
+            tcb_mask=ids_to_mask(c["id"] for c in available if c["in_tcb"]),
+            attacks_text=attacks_text,
+            attacks_text_block="\n".join(attacks_text),
+            security_budget=security_budget[round_num - 1],
+            attack_budget=attack_budget[round_num - 1],
+        ))
+    return tuple(tables)
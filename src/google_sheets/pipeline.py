@@ -0,0 +1,167 @@
+""" background pipeline of Google Sheets report writes.
+Handlers queue a job and return at once, one thread runs the jobs in the order they were queued.
+Transient failures (rate limits, server errors, network) are retried with exponential backoff.
+"""
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+import httplib2
+from googleapiclient.errors import HttpError
+
+# statuses of the Sheets API worth retrying: rate limit and failures on Google's side
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# number of recent jobs the statistics are computed from
+STATS_WINDOW = 1000
+
+
+class RetryLater(Exception):
+    """ raised by a job that can't run yet, e.g. its spreadsheet is still being created """
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, RetryLater):
+        return True
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRY_STATUSES
+    # timeouts, dropped connections and name resolution failures
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+
+class ReportJob:
+    __slots__ = ("name", "run", "done", "loop", "queued", "attempts")
+
+    def __init__(self, name: str, run, done, loop) -> None:
+        self.name = name
+        self.run = run
+        self.done = done
+        self.loop = loop
+        self.queued = time.perf_counter()
+        self.attempts = 0
+
+
+class ReportQueue:
+    """
+    ``put(name, run, done)`` queues ``run()``. ``done(result, error)`` is a coroutine function,
+    it is run on the event loop that queued the job once the job succeeded or gave up.
+    A retry waits ``backoff * 2 ** n`` seconds, at most ``max_backoff``, with jitter.
+    """
+
+    def __init__(self, max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                 sleep=time.sleep, name: str = "sheets-report") -> None:
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._sleep = sleep
+        self._name = name
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pending = 0
+        self._done = 0
+        self._failed = 0
+        self._retries = 0
+        # seconds from a job being queued to its end
+        self._latencies = deque(maxlen=STATS_WINDOW)
+        # notices being delivered on the event loop
+        self._notices = set()
+
+    def put(self, name: str, run, done=None) -> None:
+        loop = asyncio.get_running_loop() if done is not None else None
+        self._start_worker()
+        with self._lock:
+            self._pending += 1
+        self._jobs.put(ReportJob(name, run, done, loop))
+
+    def depth(self) -> int:
+        """ jobs queued or running """
+        with self._lock:
+            return self._pending
+
+    def flush(self) -> None:
+        """ blocks until all queued jobs are over """
+        if self._worker is not None:
+            self._jobs.join()
+
+    def stats(self) -> dict:
+        """ job counts and queue-to-end latencies in milliseconds over the recent jobs """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "pending": self._pending,
+                "done": self._done,
+                "failed": self._failed,
+                "retries": self._retries,
+                "latency_p50_ms": _percentile(latencies, 50) * 1000,
+                "latency_p99_ms": _percentile(latencies, 99) * 1000,
+            }
+
+    def _start_worker(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._work, name=self._name, daemon=True)
+                    self._worker.start()
+
+    def _work(self) -> None:
+        while True:
+            job = self._jobs.get()
+            try:
+                self._run(job)
+            finally:
+                self._jobs.task_done()
+
+    def _run(self, job: ReportJob) -> None:
+        result = error = None
+        while True:
+            try:
+                result = job.run()
+                break
+            except Exception as e:
+                if job.attempts >= self._max_retries or not is_transient(e):
+                    error = e
+                    break
+                delay = min(self._max_backoff, self._backoff * 2 ** job.attempts) * random.uniform(0.5, 1)
+                job.attempts += 1
+                with self._lock:
+                    self._retries += 1
+                logging.warning(f"{self._name}: {job.name} failed, retry {job.attempts} in {delay:.1f} s: {e}")
+                self._sleep(delay)
+        latency = time.perf_counter() - job.queued
+        with self._lock:
+            self._pending -= 1
+            self._latencies.append(latency)
+            if error is None:
+                self._done += 1
+            else:
+                self._failed += 1
+        if error is not None:
+            logging.error(f"{self._name}: {job.name} failed after {job.attempts + 1} attempts: {error}")
+        else:
+            logging.info(f"{self._name}: {job.name} done in {latency:.1f} s")
+        if job.done is not None:
+            try:
+                job.loop.call_soon_threadsafe(self._notify, job, result, error)
+            except RuntimeError:
+                # the event loop is closed, nobody to notify
+                pass
+
+    def _notify(self, job: ReportJob, result, error: Exception or None) -> None:
+        task = asyncio.ensure_future(self._deliver(job, result, error))
+        self._notices.add(task)
+        task.add_done_callback(self._notices.discard)
+
+    async def _deliver(self, job: ReportJob, result, error: Exception or None) -> None:
+        try:
+            await job.done(result, error)
+        except Exception as e:
+            logging.error(f"{self._name}: failed to report the end of {job.name}: {e}")
+
+
+def _percentile(ordered: list, percent: int) -> float:
+    if len(ordered) == 0:
+        return 0
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
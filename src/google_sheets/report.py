@@ -4,8 +4,6 @@ from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
 from os import getenv
 import logging
-import requests
-import json
 
 load_dotenv()  # take environment variables from .env.
 
@@ -13,6 +11,13 @@ CREDENTIALS_FILE = getenv("CREDENTIALS_FILE")
 SHARE_REPORT_WITH = getenv("SHARE_REPORT_WITH")
 
 
+def moves_row(round_num: int, result: dict) -> list:
+    """ values of the player's row in the Moves sheet: ChatId, Role, Name, TurnNo, Choice """
+    choice = ', '.join(['{:02d}'.format(i)
+                       for i in result['choice']])
+    return [str(result['chat_id']), result['role'], result['player_name'], round_num, "'" + choice]
+
+
 class GoogleSheetsIntegration:
     def __init__(self, credentials=CREDENTIALS_FILE) -> None:
         self._creds = ServiceAccountCredentials.from_json_keyfile_name(
@@ -29,7 +34,6 @@ class GoogleSheetsIntegration:
 
         self._spreadsheet_id = None
         self._details_sheets = {}
-        self._rows_rounds = [0, 0, 0]
         self._max_players = 500
 
     def set_spreadsheet_id(self, s_id: str) -> None:
@@ -96,36 +100,30 @@ class GoogleSheetsIntegration:
         ).execute()
         # TODO: also reset results sheet
 
-    def update_game_results(self, game_id, round_num, results):
-        logging.debug(
-            f"trying to update google sheet with {results} of game with id {game_id}")
-
-        self._rows_rounds[round_num-1] = len(results)
-        # update starting from the first empty row, exclude table header, so the first empty row is #2
-        offset = 2
-        for i in range(0, round_num-1):
-            offset += self._rows_rounds[i]
-        last_row = offset + self._rows_rounds[round_num-1]
+    def write_rows(self, rows: list) -> int:
+        """ writes [row number, values] rows of the Moves sheet in one request, consecutive rows share a range """
+        ranges = []
+        for row, values in sorted(rows, key=lambda r: r[0]):
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+                ranges[-1][2].append(values)
+            else:
+                ranges.append([row, row, [values]])
+        logging.debug(f"writing {len(rows)} rows in {len(ranges)} ranges to google sheet {self._spreadsheet_id}")
 
-        # skip headers update
         body = {
             "valueInputOption": "USER_ENTERED",
             "data": [
-                {"range": f"Moves!A{offset}:E{last_row}",
+                {"range": f"Moves!A{first}:E{last}",
                  "majorDimension": "ROWS",
-                 "values": []}
+                 "values": values}
+                for first, last, values in ranges
             ]
         }
 
-        for r in results:
-            choice = ', '.join(['{:02d}'.format(i)
-                               for i in r['choice']])
-            choice = "'" + choice
-            body["data"][0]["values"].append(
-                [str(r['chat_id']), r['role'], r['player_name'], round_num, choice])
-
         self._sheets_service.spreadsheets().values().batchUpdate(
             spreadsheetId=self._spreadsheet_id, body=body).execute()
+        return len(rows)
 
     def _share_spreadsheet(self, user_emails: list):
         for u in user_emails:
@@ -134,24 +132,3 @@ class GoogleSheetsIntegration:
                 body={'type': 'user', 'role': 'writer', 'emailAddress': u},
                 fields='id'
             ).execute()
-
-    def retrieve_game_results(self, round_num) -> dict:       
-        access_token_info = self._creds.get_access_token()
-        access_token = access_token_info.access_token
-
-        spreadsheet_id = self._spreadsheet_id
-        sheet_name = 'Results'
-
-        query = f'select A,C,D,E,F where B={round_num}'
-        url = 'https://docs.google.com/spreadsheets/d/' + spreadsheet_id + \
-            '/gviz/tq?sheet=' + sheet_name + '&tqx=out:json&tq=' + query
-        try:
-            response = requests.get(
-                url, headers={'Authorization': 'Bearer ' + access_token}).text
-            json_part = "{" + response.split("({")[1].strip(");")
-            res = json.loads(json_part)['table']
-        except Exception as e:
-            logging.error(f"failed to retrieve results: {e}")
-            raise
-            
-        return res
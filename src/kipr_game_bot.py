@@ -1,13 +1,17 @@
 import asyncio
+import functools
 import logging
+import os
+import secrets
+import signal
 import sys
 from os import getenv
-from typing import Any, Dict
+from typing import Any, Dict, NamedTuple
 from uuid import uuid4
 
 from aiogram import Bot, Dispatcher, F, Router, html
 from aiogram.enums import ParseMode
-from aiogram.filters import Command, CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
@@ -17,20 +21,27 @@ from aiogram.types import (
     ReplyKeyboardRemove,
     # InlineKeyboardMarkup,
     # InlineKeyboardButton,
-    CallbackQuery,
-    FSInputFile
+    CallbackQuery
 )
 
 from dotenv import load_dotenv
 
+from games.choice import Choice
 from games.ogneborec import KiprGameOgneborec
-from google_sheets.report import GoogleSheetsIntegration
-from persistence.stub import store_update_choice, get_score, \
-    get_last_game_id, set_last_game_id, \
-    reset_game_data, get_game_status, set_game_status, get_game_data, \
-    ROLE_HACKER, ROLE_ARCHITECT, \
+from google_sheets.pipeline import ReportQueue
+from google_sheets.report import GoogleSheetsIntegration, CREDENTIALS_FILE, moves_row
+from persistence import aio as storage
+from persistence.stub import ROLE_HACKER, ROLE_ARCHITECT, \
     GAME_STATUS_IN_PROGRESS, GAME_STATUS_COMPLETED
 from admins import check_authorization
+from broadcast import BroadcastScheduler, GLOBAL_RATE
+from media import PhotoCache
+from rooms import GameRoom, RoomRegistry
+from session_storage import PlayerSessionStorage
+from webhook import start_webhook
+from workers import SERVICE_SOCKET, UpdateServer, forwarding_dispatcher, start_workers, stop_workers, \
+    worker_of, worker_socket
+from monitoring import LoopLagMonitor
 
 load_dotenv()  # take environment variables from .env.
 
@@ -39,17 +50,99 @@ KIPR_BOT_VERSION = "1.01"
 
 TOKEN = getenv("BOT_TOKEN")
 MAX_ROUNDS = 3
+# chats served at once and messages per second of round broadcasts
+BROADCAST_CONCURRENCY = int(getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(getenv("BROADCAST_RATE", str(GLOBAL_RATE)))
+# images are uploaded to this chat at startup, so players get them by file_id from the first round
+MEDIA_CACHE_CHAT_ID = getenv("MEDIA_CACHE_CHAT_ID")
+# webhook mode if the public url is set, long polling otherwise
+WEBHOOK_URL = getenv("WEBHOOK_URL")
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# more than one: updates are handled by worker processes sharing state through the state service
+WORKERS = int(getenv("WORKERS", "1"))
+WORKERS_SOCKET_DIR = getenv("WORKERS_SOCKET_DIR", "./data/sockets")
 
 selected_game = KiprGameOgneborec
-report = GoogleSheetsIntegration()
+photos = PhotoCache()
 
-# restore the last game context, if no last game present, start new one
-game_id = get_last_game_id()
-if game_id is None:
-    game_id = uuid4().__str__()
-    set_last_game_id(game_id)
-else:
-    report.set_spreadsheet_id(game_id)
+
+def create_report(sheet_id: str or None = None) -> GoogleSheetsIntegration:
+    """ Google Sheets is an optional mirror of the game, results and ranks are computed locally """
+    report = GoogleSheetsIntegration()
+    if sheet_id is not None:
+        report.set_spreadsheet_id(sheet_id)
+    return report
+
+
+if not CREDENTIALS_FILE:
+    logging.info("no Google credentials, game results are not mirrored to Google Sheets")
+# report writes are sent by a background thread, handlers don't wait for Google
+reports = ReportQueue()
+# rooms are loaded from the storage on first use
+rooms = RoomRegistry(create_report=create_report if CREDENTIALS_FILE else None, reports=reports)
+
+
+def report_notice(message: Message, title: str):
+    """ tells the admin how the queued report write ended """
+    async def done(result, error) -> None:
+        if error is None:
+            await message.answer(f"{title}: записано в гугл-таблицу")
+        else:
+            await message.answer(f"{title}: не удалось записать в гугл-таблицу ({html.quote(str(error))})")
+    return done
+
+
+broadcaster = None
+# workers of this bot, set in worker processes
+worker_count = 1
+
+
+def get_broadcaster(bot: Bot) -> BroadcastScheduler:
+    """ one scheduler for all broadcasts, so flood limits are shared between them """
+    global broadcaster
+    if broadcaster is None:
+        # every worker broadcasts at its share of the bot's flood limit
+        broadcaster = BroadcastScheduler(bot, concurrency=BROADCAST_CONCURRENCY, rate=BROADCAST_RATE / worker_count)
+    return broadcaster
+
+
+def delivery_progress(message: Message, title: str):
+    """ broadcast progress for the admin, in one message edited as the broadcast goes """
+    status = {}
+
+    async def progress(stats: dict) -> None:
+        text = f"{title}: доставлено {stats['delivered']} из {stats['total']}, ошибок {stats['failed']}"
+        if status.get("text") == text:
+            return
+        if "message" not in status:
+            status["message"] = await message.answer(text)
+        else:
+            await status["message"].edit_text(text)
+        status["text"] = text
+    return progress if message is not None else None
+
+
+async def default_game_id() -> str:
+    """ players who /start without a code join the last started game, if no last game present, start new one """
+    game_id = await storage.get_last_game_id()
+    if game_id is None:
+        game_id = uuid4().__str__()
+        await storage.set_last_game_id(game_id=game_id)
+    return game_id
+
+
+async def room_game_id(data: Dict[str, Any]) -> str:
+    """ game of the player's room, sessions from before rooms existed play the last started game """
+    game_id = data.get("game_id")
+    return game_id if game_id is not None else await default_game_id()
+
+
+async def current_room(state: FSMContext) -> GameRoom:
+    """ room of the player or of the admin managing it """
+    return await rooms.get(await room_game_id(await state.get_data()))
 
 form_router = Router()
 
@@ -70,13 +163,35 @@ class Form(StatesGroup):
 
 
 @form_router.message(CommandStart())
-async def command_start(message: Message, state: FSMContext) -> None:
+async def command_start(message: Message, state: FSMContext, command: CommandObject) -> None:
+    # a deep link passes the game code as the start parameter
+    if command.args:
+        room = await rooms.find(command.args)
+        if room is None:
+            await message.answer(f"Игра с кодом {html.quote(command.args)} не найдена")
+            return
+    else:
+        room = await rooms.get(await default_game_id())
     await state.set_state(Form.name)
+    await state.update_data(game_id=room.game_id)
     await message.answer(
         "Привет! Как зовут вас или вашу команду?",
         reply_markup=ReplyKeyboardRemove(),
     )
 
+@form_router.message(Command("join"))
+async def join_handler(message: Message, state: FSMContext, command: CommandObject) -> None:
+    """
+    Move the player or the admin to the game with the given code
+    """
+    room = await rooms.find(command.args or "")
+    if room is None:
+        await message.answer("Укажите код игры, например: /join ABC123")
+        return
+    await state.update_data(game_id=room.game_id)
+    await message.answer(f"Вы в игре {room.code}", reply_markup=ReplyKeyboardRemove())
+
+
 @form_router.message(Command("version"))
 @form_router.message(F.text.casefold() == "version")
 async def cancel_handler(message: Message) -> None:
@@ -121,13 +236,18 @@ async def reset_handler(message: Message, state: FSMContext) -> None:
             reply_markup=ReplyKeyboardRemove(),
         )
         return
-    reset_game_data()
-    report.reset_game_data()
+    room = await current_room(state)
+    # only the partition of the admin's game is dropped, other games are kept
+    await storage.reset_game_data(game_id=room.game_id)
+    await storage.run(selected_game.reset_live_scores, game_id=room.game_id)
+    # the row map of the sheet was dropped with the game data, rows of old choices aren't written
+    room.forget_rows()
+    room.mirror("reset_game_data", done=report_notice(message, "Сброс игры"))
     await message.answer(
             "Игровые данные удалены успешно",
             reply_markup=ReplyKeyboardRemove(),
         )
-    set_game_status(game_id=game_id, round=1, status=GAME_STATUS_IN_PROGRESS)
+    await storage.set_game_status(game_id=room.game_id, round=1, status=GAME_STATUS_IN_PROGRESS)
 
 
 @form_router.message(Command("newgame"))
@@ -145,41 +265,47 @@ async def new_game_handler(message: Message, state: FSMContext) -> None:
         )
         return
 
-    global game_id
-    global report
-
     # check if existing game id has been provided
     game_details = message.text.strip("/newgame").strip().split(";")
     if game_details != ['']:
-        # game details provided, use it
+        # game details provided, use it, the sheet of the game is reused for its results
         game_id = game_details[0]
-        # reuse already created sheet for game results
-        if len(game_details) >= 1:
-            report.set_spreadsheet_id(game_id)
-        else:
-            report.create_game_details_sheet(game_id)
+        room = await rooms.get(game_id)
     else:
-        # uuid will only be used in the title, for communication will be used Google spreadsheet id 
         game_id = uuid4().__str__()
-        report.create_game_details_sheet(game_id)
-        game_id = report.get_spreadsheet_id()
-
-    set_last_game_id(game_id=game_id)
-    set_game_status(game_id=game_id, round=1, status=GAME_STATUS_IN_PROGRESS)
-
+        room = await rooms.get(game_id, new_game=True)
 
+    await storage.set_last_game_id(game_id=game_id)
+    await storage.set_game_status(game_id=game_id, round=1, status=GAME_STATUS_IN_PROGRESS)
 
     current_state = await state.get_state()
     if current_state is not None:
         await state.clear()
+    # the admin manages the new game until joining another one
+    await state.update_data(game_id=game_id)
 
-    logging.info("New game started!")
+    logging.info(f"New game {game_id} started in room {room.code}!")
 
-    await message.answer(
-        "Начата новая игра! Таблица с результатами: " +
-        f"https://docs.google.com/spreadsheets/d/{report.get_spreadsheet_id()}",
-        reply_markup=ReplyKeyboardRemove(),
-    )
+    bot_user = await message.bot.me()
+    text = f"Начата новая игра! Код для подключения: {room.code}\n" \
+           f"Ссылка для игроков: {room.deep_link(bot_user.username)}"
+    if room.mirrored and room.sheet_id is not None:
+        text += f"\nТаблица с результатами: {sheet_url(room.sheet_id)}"
+    elif room.mirrored:
+        text += "\nТаблица с результатами создаётся, ссылка придёт отдельным сообщением"
+
+        async def created(sheet_id, error) -> None:
+            if error is None:
+                await message.answer(f"Таблица с результатами: {sheet_url(sheet_id)}")
+            else:
+                await message.answer(f"Не удалось создать гугл-таблицу игры ({html.quote(str(error))})")
+
+        room.create_sheet(done=created)
+    await message.answer(text, reply_markup=ReplyKeyboardRemove())
+
+
+def sheet_url(sheet_id: str) -> str:
+    return f"https://docs.google.com/spreadsheets/d/{sheet_id}"
 
 
 @form_router.message(Command("endround"))
@@ -210,19 +336,74 @@ async def end_round(message: Message, state: FSMContext) -> None:
         except Exception as _:
             round_num = 1
 
-    logging.info(f"round {round_num} is over!")
-    selected_game.calculate_game_round_results(game_id=game_id, round=round_num)
+    room = await current_room(state)
+    # admins of the game may be served by different workers, the round is scored once at a time
+    lease = f"endround:{room.game_id}:{round_num}"
+    token = await storage.acquire_lease(name=lease)
+    if token is None:
+        await message.answer(f"Шаг {round_num} уже подсчитывается, попробуйте позже")
+        return
+    try:
+        logging.info(f"round {round_num} of game {room.game_id} is over!")
+        await storage.run(selected_game.calculate_game_round_results, game_id=room.game_id, round=round_num)
 
-    # calculate round results
+        # calculate round results
+        await message.answer(
+            f"Шаг {round_num} игры завершён!",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+
+        if room.mirrored:
+            # choices are streamed to the sheet as they come, only rows not written yet are sent
+            results = await storage.run(selected_game.get_round_details, game_id=room.game_id, round=round_num)
+            room.write_rows({(round_num, r["chat_id"]): moves_row(round_num, r) for r in results},
+                            done=report_notice(message, f"Итоги шага {round_num}"))
+    finally:
+        await storage.release_lease(name=lease, token=token)
+
+
+@form_router.message(Command("reports"))
+async def reports_handler(message: Message) -> None:
+    """
+    Allow admins to see the queue of Google Sheets writes
+    """
+    if not check_authorization(message.chat.username):
+        await message.answer("Только администраторы могут смотреть очередь записи в гугл-таблицы!")
+        return
+    stats = reports.stats()
     await message.answer(
-        f"Шаг {round_num} игры завершён!",
+        f"Записи в гугл-таблицы: в очереди {stats['pending']}, выполнено {stats['done']}, "
+        f"ошибок {stats['failed']}, повторов {stats['retries']}\n"
+        f"Время от постановки в очередь до записи: медиана {stats['latency_p50_ms']:.0f} мс, "
+        f"p99 {stats['latency_p99_ms']:.0f} мс",
         reply_markup=ReplyKeyboardRemove(),
     )
 
-    results = selected_game.get_round_details(game_id=game_id, round=round_num)
 
-    global report
-    report.update_game_results(game_id, round_num, results=results)
+@form_router.message(Command("livescore"))
+async def live_score_handler(message: Message, state: FSMContext) -> None:
+    """
+    Allow admins to see provisional scores of the current round
+    """
+    if not check_authorization(message.chat.username):
+        logging.info(
+            f"Unauthorized request for live score! Request from {message.chat.username}")
+        await message.answer(
+            "Только администраторы могут смотреть промежуточные результаты!",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+    game_id = await room_game_id(await state.get_data())
+    status = await storage.get_game_status(game_id=game_id)
+    round_num = status["round"] if status is not None else 1
+    summary = await storage.run(selected_game.get_live_round_summary, game_id=game_id, round=round_num)
+    await message.answer(
+        f"Промежуточные результаты шага {round_num}\n"
+        f"Архитекторов: {summary['architects_count']}, хакеров: {summary['hackers_count']}\n"
+        f"Очки архитекторов: {summary['architects']}\n"
+        f"Очки хакеров: {summary['hackers']}",
+        reply_markup=ReplyKeyboardRemove(),
+    )
 
 
 @form_router.message(Command("roundresults"))
@@ -232,7 +413,7 @@ async def start_round(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
     round_num = data['round']    
     bot = message.bot
-    await broadcast_round_results(bot, round_num)
+    await broadcast_round_results(bot, await room_game_id(data), round_num, admin_message=message)
 
 
 @form_router.message(Command("startround"))
@@ -240,57 +421,64 @@ async def start_round(message: Message, state: FSMContext) -> None:
 async def start_round(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
     round_num = data['round']
-    await set_next_round_state(bot=message.bot, state=state, finished_round_num=round_num)
+    await set_next_round_state(bot=message.bot, state=state, finished_round_num=round_num, admin_message=message)
     logging.info("starting results")
 
 
-async def set_next_round_state(bot, state: FSMContext, finished_round_num: int):
+async def set_next_round_state(bot, state: FSMContext, finished_round_num: int, admin_message: Message = None):
+    game_id = await room_game_id(await state.get_data())
     if finished_round_num < MAX_ROUNDS:
         round_num = finished_round_num + 1
         status = GAME_STATUS_IN_PROGRESS
         try:
             await state.set_state(Form.choice)
-            set_game_status(game_id, round_num, status)
-            await broadcast_next_round(bot, game_id, round_num)
+            await storage.set_game_status(game_id=game_id, round=round_num, status=status)
+            await broadcast_next_round(bot, game_id, round_num, admin_message=admin_message)
         except Exception as e:
             logging.error(f"failed to set next round state: {e}")
     else:
         round_num = MAX_ROUNDS
         status = GAME_STATUS_COMPLETED
-        set_game_status(game_id, round_num, status)
-        await broadcast_final_results(bot, game_id)
+        await storage.set_game_status(game_id=game_id, round=round_num, status=status)
+        await broadcast_final_results(bot, game_id, admin_message=admin_message)
+        await storage.archive_game(game_id)
 
-async def broadcast_round_results(bot, round_num):
-    try:
-        results = report.retrieve_game_results(round_num=round_num)
-        logging.debug(f"round {round_num} results: {results}")
-        for r in results['rows']:
-            chat_id = int(r['c'][0]['v'])
-            # score = int(r['c'][1]['v'])
-            # total_score = int(r['c'][1]['v'])
-            # rating = int(r['c'][3]['v'])
-            # comment = r['c'][4]['v']
-            feedback = r['c'][4]['v']
-            # summary = f"* за этот ход вы получаете {score} очков\n" + \
-            #           f"* общее количество очков {total_score}\n" +\
-            #           f"ваша позиция в рейтинге №{rating}.\n\n" + \
-            #           f"Подробная информация: {comment}"
-            await bot.send_message(chat_id, feedback)
-    except Exception as e:
-        logging.error(f"failed to handle round results: {e}")
-
-
-async def broadcast_next_round(bot, game_id: str, round_num: int) -> None:
-    data = get_game_data(game_id, round=round_num-1 if round_num > 0 else 0, role=None)
-    for player in data:
-        await bot.send_message(player["chat_id"], f"Начинаем шаг {round_num}!")
-        await intro_round(bot=bot, chat_id=player['chat_id'], round=round_num, role=player['role'])
-
-
-async def broadcast_final_results(bot, game_id: str) -> None:
-    data = get_game_data(game_id, round=MAX_ROUNDS, role=None)
-    for player in data:
-        await bot.send_message(player["chat_id"], "Игра завершена! Проверьте свои результаты")
+async def broadcast_round_results(bot, game_id: str, round_num: int, admin_message: Message = None):
+    # every player gets the result card with the score, total and rating from the local leaderboard
+    messages = dict(await get_result_cards(game_id, round_num))
+    feedback = selected_game.peek_round_feedback(game_id=game_id, round=round_num)
+    if feedback is None:
+        feedback = await storage.run(selected_game.get_round_feedback, game_id=game_id, round=round_num)
+    for chat_id, text in feedback.items():
+        card = messages.get(chat_id)
+        messages[chat_id] = text if card is None else card + "\n\n" + text
+
+    async def send(bot, chat_id) -> None:
+        await bot.send_message(chat_id, messages[chat_id])
+
+    await get_broadcaster(bot).broadcast(messages, send,
+                                         progress=delivery_progress(admin_message, f"Итоги шага {round_num}"))
+
+
+async def broadcast_next_round(bot, game_id: str, round_num: int, admin_message: Message = None) -> None:
+    data = await storage.get_game_data(game_id, round=round_num-1 if round_num > 0 else 0, role=None)
+    roles = {player["chat_id"]: player["role"] for player in data}
+
+    async def send(bot, chat_id) -> None:
+        await intro_round(bot=bot, chat_id=chat_id, round=round_num, role=roles[chat_id], announce=True)
+
+    await get_broadcaster(bot).broadcast(roles, send,
+                                         progress=delivery_progress(admin_message, f"Начало шага {round_num}"))
+
+
+async def broadcast_final_results(bot, game_id: str, admin_message: Message = None) -> None:
+    data = await storage.get_game_data(game_id, round=MAX_ROUNDS, role=None)
+
+    async def send(bot, chat_id) -> None:
+        await bot.send_message(chat_id, "Игра завершена! Проверьте свои результаты")
+
+    await get_broadcaster(bot).broadcast([player["chat_id"] for player in data], send,
+                                         progress=delivery_progress(admin_message, "Завершение игры"))
 
 
 @form_router.message(Form.name)
@@ -311,42 +499,55 @@ async def process_name(message: Message, state: FSMContext) -> None:
     )
 
 
-async def intro_round(bot, chat_id, round, role):
+class RoundIntro(NamedTuple):
+    # (image path, caption), sent as one media group
+    photos: tuple
+    # everything else the player needs to make the choice, one message
+    text: str
+
+
+@functools.lru_cache(maxsize=None)
+def round_intro(round: int, role: str, announce: bool = False) -> RoundIntro:
+    """ the same for every player of the role, built once per round """
     arch = [selected_game.architecture_round_1, selected_game.architecture_round_2, selected_game.architecture_round_3]
-    security_budget = [selected_game.round_1_security_budget_limit,selected_game.round_2_security_budget_limit,selected_game.round_3_security_budget_limit]
-    attacks_budget = [selected_game.round_1_attack_budget_limit, selected_game.round_2_attack_budget_limit, selected_game.round_3_attack_budget_limit]
-    await bot.send_photo(chat_id, photo=FSInputFile(path=arch[round-1][0]),
-                               caption="Архитектура системы и стоимость защиты компонентов:\n"
-                               "<b>₽</b> - один миллион рублей, <b>₽₽</b> - два миллиона"
-                               )
+    round_table = selected_game.get_round_table(round=round)
+    caption = "Архитектура системы и стоимость защиты компонентов:\n" \
+              "<b>₽</b> - один миллион рублей, <b>₽₽</b> - два миллиона"
+    if announce:
+        caption = f"Начинаем шаг {round}!\n\n" + caption
+    photos = [(arch[round-1][0], caption)]
     if round != 2:
         # on round 2 this diagram is the same, no need to spam players
-        await bot.send_photo(chat_id, photo=FSInputFile(path=arch[round-1][1]),
-                               caption="Логика взаимодействия компонентов"                               
-                               )
+        photos.append((arch[round-1][1], "Логика взаимодействия компонентов"))
+    texts = []
     if (role == ROLE_HACKER):
         if round == 1:
-            await bot.send_message(chat_id, "Вы получите очки, если в ходе атаки будет нарушена хотя бы одна из целей безопасности:\n" +
-                                selected_game.security_objectives_and_assumptions
-                                )
-        max_attacks = attacks_budget[round-1]
+            texts.append("Вы получите очки, если в ходе атаки будет нарушена хотя бы одна из целей безопасности:\n" +
+                         selected_game.security_objectives_and_assumptions)
+        max_attacks = round_table.attack_budget
         if round == 2:
-            await bot.send_message(chat_id, "Атаки и последствия не изменились, но увеличилось количество вариантов.\n\n" +
-                                f"Какие атаки вы выбираете? (максимум {max_attacks}, каждая атака работает независимо от других)\n" +
-                                "В ответном сообщении пришлите список с номерами атак через запятую (например, 1,2)",
-                                )
-        else:            
-            await bot.send_message(chat_id, "Вы можете атаковать следующими способами:\n"
-                                """{}""".format("\n".join(selected_game.get_attacks_text(round=round))) +
-                                f"\n\nКакие атаки вы выбираете? (максимум {max_attacks}, каждая атака работает независимо от других)\n" +
-                                "В ответном сообщении пришлите список с номерами атак через запятую (например, 1,2)",
-                                )
+            texts.append("Атаки и последствия не изменились, но увеличилось количество вариантов.\n\n" +
+                         f"Какие атаки вы выбираете? (максимум {max_attacks}, каждая атака работает независимо от других)\n" +
+                         "В ответном сообщении пришлите список с номерами атак через запятую (например, 1,2)")
+        else:
+            texts.append("Вы можете атаковать следующими способами:\n" +
+                         round_table.attacks_text_block +
+                         f"\n\nКакие атаки вы выбираете? (максимум {max_attacks}, каждая атака работает независимо от других)\n" +
+                         "В ответном сообщении пришлите список с номерами атак через запятую (например, 1,2)")
     elif role == ROLE_ARCHITECT:
-        max_secure = security_budget[round-1]
-        await bot.send_message(chat_id, f"Бюджет защиты <b>{max_secure}</b> млн руб.\n"
-                         "Какие компоненты вы будете защищать за эти деньги?\n"
-                         "В ответном сообщении пришлите список с номерами через запятую (например, 1,2)",
-                         )
+        max_secure = round_table.security_budget
+        texts.append(f"Бюджет защиты <b>{max_secure}</b> млн руб.\n"
+                     "Какие компоненты вы будете защищать за эти деньги?\n"
+                     "В ответном сообщении пришлите список с номерами через запятую (например, 1,2)")
+    return RoundIntro(photos=tuple(photos), text="\n\n".join(texts))
+
+
+async def intro_round(bot, chat_id, round, role, announce: bool = False):
+    """ two API calls per player: diagrams as a media group and one text message """
+    intro = round_intro(round, role, announce)
+    await photos.send_group(bot, chat_id, intro.photos)
+    if intro.text:
+        await bot.send_message(chat_id, intro.text)
 
 
 @form_router.message(Form.role, F.text.casefold() == ROLE_ARCHITECT)
@@ -363,7 +564,7 @@ async def process_system_architect(message: Message, state: FSMContext) -> None:
                          )
     await intro_round(bot=message.bot, chat_id=message.chat.id, round=1, role=ROLE_ARCHITECT)
     await state.set_state(Form.choice)
-    await state.update_data(message=message, name=name, role=ROLE_ARCHITECT)
+    await state.update_data(name=name, role=ROLE_ARCHITECT, game_id=await room_game_id(data))
 
 
 @form_router.message(Form.role, F.text.casefold() == ROLE_HACKER)
@@ -376,20 +577,25 @@ async def process_hacker(message: Message, state: FSMContext) -> None:
                          )
     await intro_round(bot=message.bot, chat_id=message.chat.id, round=1, role= ROLE_HACKER)
     await state.set_state(Form.choice)
-    await state.update_data(message=message, name=name, role=message.text.casefold())
+    await state.update_data(name=name, role=message.text.casefold())
 
 
-async def extract_choice_from_state_and_store(state: FSMContext, chat_id: str, username: str, round: int = 1):
+async def extract_choice_from_state_and_store(state: FSMContext, chat_id: str, username: str, choice: Choice, round: int = 1):
     data = await state.get_data()
     choice = {
-        "game_id": game_id,
+        "game_id": await room_game_id(data),
         "chat_id": chat_id,
         "player_username": username,
         "player_name": data["name"],
         "role": data["role"],
-        "choice": data[f"choice_round_{round}"]
+        # already parsed and validated, stored as normalized component ids
+        "choice": choice.ids
     }
-    store_update_choice(choice=choice, round=round)
+    # runs on the persistence thread, choices of one player are stored in order
+    await storage.run(selected_game.store_update_choice, choice=choice, round=round)
+    # the row of the player is written to the game's sheet in background, with other changed rows
+    room = await rooms.get(choice["game_id"])
+    room.write_rows({(round, chat_id): moves_row(round, choice)})
 
 
 async def show_input_common_summary(message: Message, data: Dict[str, Any], choice, round_num) -> None:
@@ -423,41 +629,33 @@ async def show_round_results_summary(callback: CallbackQuery, state: FSMContext)
         await bot.send_message(callback.from_user.id, "нет данных о текущем шаге")
         return
     game_round = player_info["round"]
-    results = get_score(game_id=game_id, player_info=player_info, round=game_round)
-
-    text = f"Результаты игры для шага {game_round}\n"
-
-    if player_info["role"] == ROLE_ARCHITECT:
-        text += f"Успешная защита: {results['protected_score_round_'+str(game_round)]}\n" \
-               f"Пропущенные критические атаки: {results['compromised_score_round_'+str(game_round)]}"
-        if results['compromised_score_round_'+str(game_round)] > 0:
-            text += "\n\nУспешные атаки:\n"
-            for a_id in results['compromised_tcb_components_round_'+str(game_round)]:
-                component = selected_game.components_full[a_id-1]
-                text += component["name"] + ": " + component["attack_text"] + "\n"
-    elif player_info["role"] == ROLE_HACKER:
-        text += f"Успешный взлом: {results['successful_attacks_score_round_'+str(game_round)]}\n" \
-               f"Заблокированный взлом: {results['unsuccessful_attacks_score_round_'+str(game_round)]}"
-    else:
-        text = "неопределённая роль, нельзя интерпретировать результаты"
-
+    cards = await get_result_cards(await room_game_id(player_info), game_round)
+    text = cards.get(callback.from_user.id, f"нет результатов шага {game_round}")
     await bot.send_message(callback.from_user.id, text)
 
 
+async def get_result_cards(game_id: str, round_num: int) -> dict:
+    """ rendered at /endround, storage is only read if the bot was restarted since """
+    cards = selected_game.peek_result_cards(game_id=game_id, round=round_num)
+    if cards is None:
+        cards = await storage.run(selected_game.get_result_cards, game_id=game_id, round=round_num)
+    return cards
+
+
 async def process_choice(message: Message, state: FSMContext, round_num: int, data, budget) -> None:
-    choice = message.text
     name = data.get("name", "Anonymous")
     role = data.get("role", "<роль не определена>")
     need_to_reset_state = False
+    # the message is parsed once, validators, costing and storage share the result
+    choice = selected_game.parse_choice(message.text, round_num, role)
 
-    await state.update_data(round=round_num, username=message.chat.username, message=message, name=name)
+    await state.update_data(round=round_num, username=message.chat.username, name=name)
 
     if role == ROLE_ARCHITECT:
-        if selected_game.is_security_choice_valid(message.text, round_num):
+        if selected_game.is_security_choice_valid(choice, round_num):
             await show_input_common_summary(message=message, data=data, choice=message.text.casefold(), round_num=round_num)
-            costs = selected_game.calculate_security_costs(
-                choice=choice, round_num=round_num)
-            await extract_choice_from_state_and_store(state, message.chat.id, message.chat.username, round=round_num)
+            costs = choice.cost
+            await extract_choice_from_state_and_store(state, message.chat.id, message.chat.username, choice, round=round_num)
             await message.answer(f"Вы потратили {costs} млн. руб. "
                                  f"из общего бюджета {budget} млн. руб.\n",
                                 #  reply_markup = InlineKeyboardMarkup(
@@ -475,9 +673,9 @@ async def process_choice(message: Message, state: FSMContext, round_num: int, da
             await show_input_error_message(message=message, text=err_message)
             need_to_reset_state = True
     elif role == ROLE_HACKER:
-        if selected_game.is_attacking_choice_valid(message.text, round_num):
+        if selected_game.is_attacking_choice_valid(choice, round_num):
             await extract_choice_from_state_and_store(
-                state, message.chat.id, message.chat.username, round=round_num
+                state, message.chat.id, message.chat.username, choice, round=round_num
             )
             await show_input_common_summary(message=message, data=data, choice=message.text.casefold(),  round_num=round_num)
             await message.answer("Команда сделала свой выбор, теперь дождитесь окончания текущего "
@@ -496,17 +694,17 @@ async def process_choice(message: Message, state: FSMContext, round_num: int, da
             need_to_reset_state = True
 
     if need_to_reset_state:
-        await state.update_data(message=message, name=name, role=role)
+        await state.update_data(name=name, role=role)
 
 
 @form_router.message(Form.choice)
 async def process_choice_input(message: Message, state: FSMContext) -> None:
     """ 
     handle user choices for all rounds here, 
-    sync current round through the game status stored in local file 
+    sync current round through the cached game status, a dictionary lookup on the persistence thread
     """
     choice = message.text
-    status = get_game_status(game_id=game_id)
+    status = await storage.get_game_status(game_id=await room_game_id(await state.get_data()))
     if status is not None:
         round_num = status["round"]
     else:
@@ -531,16 +729,94 @@ async def process_choice_input(message: Message, state: FSMContext) -> None:
     )
 
 
+def run_worker(index: int, workers: int, socket_dir: str, make_bot=None) -> None:
+    """ entry point of a worker process of the multi-worker mode, `make_bot()` returns the Bot of the worker """
+    global worker_count
+    worker_count = workers
+    # force: logging at import of the module has already configured the root logger
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, force=True,
+                        format=f"worker {index}: %(levelname)s:%(name)s:%(message)s")
+    storage.connect(os.path.join(socket_dir, SERVICE_SOCKET))
+
+    async def serve() -> None:
+        bot = make_bot() if make_bot is not None else Bot(token=TOKEN, parse_mode=ParseMode.HTML)
+        # updates of a chat always come to the same worker, so it only needs sessions of its chats
+        sessions = PlayerSessionStorage(owns=lambda chat_id: worker_of(chat_id, workers) == index)
+        dp = Dispatcher(storage=sessions)
+        dp.include_router(form_router)
+        logging.info(f"{await sessions.count()} player sessions restored")
+        updates = UpdateServer(dp, bot, worker_socket(socket_dir, index))
+        server = await updates.start()
+        stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(sig, stopped.set)
+        async with server:
+            await stopped.wait()
+            updates.disconnect()
+            await asyncio.sleep(0)
+        await bot.session.close()
+
+    asyncio.run(serve())
+
+
+async def receive_updates(dp: Dispatcher, bot: Bot) -> None:
+    """ from the webhook if it is configured and could be set, by polling otherwise """
+    allowed_updates = form_router.resolve_used_update_types()
+    runner = None
+    if WEBHOOK_URL:
+        try:
+            runner = await start_webhook(dp, bot, url=WEBHOOK_URL, path=WEBHOOK_PATH, host=WEBHOOK_HOST,
+                                         port=WEBHOOK_PORT, secret_token=WEBHOOK_SECRET,
+                                         allowed_updates=allowed_updates)
+        except Exception as e:
+            logging.error(f"failed to start webhook, falling back to polling: {e}")
+    if runner is not None:
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    else:
+        # a webhook left from a previous run would make polling fail
+        await bot.delete_webhook()
+        await dp.start_polling(bot, allowed_updates=allowed_updates)
+
+
 async def main():
     bot=Bot(token=TOKEN, parse_mode=ParseMode.HTML)
-    dp=Dispatcher()
-    dp.include_router(form_router)
-
-    await dp.start_polling(bot)
+    processes = []
+    if WORKERS > 1:
+        # this process only passes updates to the workers, storage calls below go to the state service
+        processes, router = await start_workers(WORKERS, WORKERS_SOCKET_DIR, run_worker)
+        dp = forwarding_dispatcher(router)
+    else:
+        # players' sessions survive restarts
+        sessions = PlayerSessionStorage()
+        dp=Dispatcher(storage=sessions)
+        dp.include_router(form_router)
+        logging.info(f"{await sessions.count()} player sessions restored")
+
+    # games completed before a restart may still be in live partitions
+    await storage.archive_completed_games()
+    if MEDIA_CACHE_CHAT_ID:
+        images = selected_game.architecture_round_1 + selected_game.architecture_round_2 + \
+                 selected_game.architecture_round_3
+        try:
+            uploaded = await photos.preload(bot, MEDIA_CACHE_CHAT_ID, images)
+            logging.info(f"{uploaded} images uploaded to the media cache chat")
+        except Exception as e:
+            logging.error(f"failed to preload images, they will be uploaded on first use: {e}")
+    lag_monitor = asyncio.create_task(LoopLagMonitor().run(report_every=60))
+    try:
+        await receive_updates(dp, bot)
+    finally:
+        lag_monitor.cancel()
+        logging.info(f"choices writer: {await storage.get_write_stats()}")
+        logging.info(f"report writes: {reports.stats()}")
+        stop_workers(processes)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, force=True)
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
@@ -0,0 +1,118 @@
+""" Telegram file_id cache of images sent to players.
+An image is uploaded once, later sends reuse its file_id. The file_id is persisted
+per image path and content hash, so it survives restarts and a changed image is
+uploaded again.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto
+from persistence import aio as storage
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PhotoCache:
+    def __init__(self) -> None:
+        # path -> (mtime, size, sha256), files are hashed again only when they change
+        self._digests = {}
+        # path -> (sha256, file_id or None)
+        self._file_ids = {}
+        # path -> lock held during the first upload, so concurrent sends don't upload it too
+        self._uploads = {}
+        self.uploads = 0
+
+    async def _digest(self, path: str) -> str:
+        stat = os.stat(path)
+        known = self._digests.get(path)
+        if known is None or known[:2] != (stat.st_mtime, stat.st_size):
+            known = self._digests[path] = (stat.st_mtime, stat.st_size, await asyncio.to_thread(_sha256, path))
+        return known[2]
+
+    async def _file_id(self, path: str, digest: str) -> str or None:
+        known = self._file_ids.get(path)
+        if known is None or known[0] != digest:
+            known = self._file_ids[path] = (digest, await storage.get_telegram_file_id(path=path, sha256=digest))
+        return known[1]
+
+    async def send(self, bot, chat_id, path: str, **kwargs):
+        """ bot.send_photo of the image at `path`, uploaded only if there is no file_id for it yet """
+        digest = await self._digest(path)
+        file_id = await self._file_id(path, digest)
+        if file_id is not None:
+            try:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # e.g. the file_id belongs to another bot token
+                logging.warning(f"cached file_id of {path} is rejected, uploading it again: {e}")
+                if self._file_ids.get(path) == (digest, file_id):
+                    self._file_ids[path] = (digest, None)
+        async with self._uploads.setdefault(path, asyncio.Lock()):
+            file_id = await self._file_id(path, digest)
+            if file_id is not None:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            message = await bot.send_photo(chat_id, photo=FSInputFile(path=path), **kwargs)
+            self.uploads += 1
+            # the largest size is the original image
+            file_id = message.photo[-1].file_id
+            self._file_ids[path] = (digest, file_id)
+            await storage.set_telegram_file_id(path=path, sha256=digest, file_id=file_id)
+            return message
+
+    async def send_group(self, bot, chat_id, photos) -> list:
+        """
+        bot.send_media_group of (path, caption) images, one image is sent as a photo.
+        Images without a file_id are uploaded, the others are sent by file_id.
+        """
+        photos = list(photos)
+        if len(photos) == 1:
+            path, caption = photos[0]
+            return [await self.send(bot, chat_id, path, caption=caption)]
+        digests = [await self._digest(path) for path, _ in photos]
+
+        async def media() -> list:
+            file_ids = [await self._file_id(path, digest) for (path, _), digest in zip(photos, digests)]
+            return [InputMediaPhoto(media=FSInputFile(path=path) if file_id is None else file_id, caption=caption)
+                    for (path, caption), file_id in zip(photos, file_ids)]
+
+        group = await media()
+        if all(isinstance(m.media, str) for m in group):
+            try:
+                return await bot.send_media_group(chat_id, media=group)
+            except TelegramBadRequest as e:
+                logging.warning(f"cached file_ids of {[p for p, _ in photos]} are rejected, uploading them again: {e}")
+                for (path, _), digest, m in zip(photos, digests, group):
+                    if self._file_ids.get(path) == (digest, m.media):
+                        self._file_ids[path] = (digest, None)
+        locks = [self._uploads.setdefault(path, asyncio.Lock()) for path in sorted({p for p, _ in photos})]
+        for lock in locks:
+            await lock.acquire()
+        try:
+            group = await media()
+            messages = await bot.send_media_group(chat_id, media=group)
+            for (path, _), digest, m, message in zip(photos, digests, group, messages):
+                if isinstance(m.media, FSInputFile):
+                    self.uploads += 1
+                    file_id = message.photo[-1].file_id
+                    self._file_ids[path] = (digest, file_id)
+                    await storage.set_telegram_file_id(path=path, sha256=digest, file_id=file_id)
+            return messages
+        finally:
+            for lock in locks:
+                lock.release()
+
+    async def preload(self, bot, chat_id, paths) -> int:
+        """ uploads images without a file_id to a service chat, returns the number of uploads """
+        uploads = self.uploads
+        for path in dict.fromkeys(paths):
+            if await self._file_id(path, await self._digest(path)) is None:
+                await self.send(bot, chat_id, path)
+        return self.uploads - uploads
@@ -0,0 +1,42 @@
+""" event loop lag measurement: how late the loop wakes up a sleeping coroutine
+"""
+import asyncio
+import logging
+import time
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.01) -> None:
+        self._interval = interval
+        self.samples = []
+
+    def reset(self) -> None:
+        self.samples = []
+
+    def stats(self) -> dict:
+        """ lag percentiles in milliseconds """
+        if len(self.samples) == 0:
+            return {"samples": 0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "p50": ordered[len(ordered) // 2] * 1000,
+            "p99": ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * 1000,
+            "max": ordered[-1] * 1000
+        }
+
+    async def run(self, report_every: float or None = None, warn_above_ms: float = 100) -> None:
+        """ samples the lag until cancelled, optionally logging a summary periodically """
+        reported = time.perf_counter()
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self._interval)
+            now = time.perf_counter()
+            self.samples.append(max(0.0, now - started - self._interval))
+            if report_every is not None and now - reported >= report_every:
+                stats = self.stats()
+                level = logging.WARNING if stats["max"] > warn_above_ms else logging.DEBUG
+                logging.log(level, f"event loop lag, ms: p50 {stats['p50']:.1f}, "
+                                   f"p99 {stats['p99']:.1f}, max {stats['max']:.1f}")
+                self.reset()
+                reported = now
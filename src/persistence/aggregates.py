@@ -0,0 +1,61 @@
+""" per-round totals of a game maintained on every write of choices and scores,
+so round summaries are read without touching player records
+"""
+from .records import ROLE_ARCHITECT, ROLE_HACKER
+
+
+def _round_score(scores) -> int:
+    # the first score of both roles counts for the round summary:
+    # protected attacks for architects, successful attacks for hackers
+    if scores is None or scores[0] <= 0:
+        return 0
+    return scores[0]
+
+
+class GameTotals:
+    """
+    Counters of every round of one game: score totals and participants by role.
+    Remembers each player's contribution, so rewritten scores replace it instead
+    of being counted twice.
+    """
+
+    def __init__(self) -> None:
+        # record id -> (round, role, contribution)
+        self._players = {}
+        # round -> {"architects", "hackers", "architects_count", "hackers_count"}
+        self._rounds = {}
+
+    def _round(self, round: int) -> dict:
+        totals = self._rounds.get(round)
+        if totals is None:
+            totals = self._rounds[round] = {"architects": 0, "hackers": 0, "architects_count": 0, "hackers_count": 0}
+        return totals
+
+    def _add(self, round: int, role: str, contribution: int, sign: int) -> None:
+        totals = self._round(round)
+        if role == ROLE_ARCHITECT:
+            totals["architects"] += sign * contribution
+            totals["architects_count"] += sign
+        elif role == ROLE_HACKER:
+            totals["hackers"] += sign * contribution
+            totals["hackers_count"] += sign
+
+    def put(self, record_id: int, round: int, role: str, scores) -> None:
+        """ adds a player record or replaces its previous contribution """
+        previous = self._players.get(record_id)
+        if previous is not None:
+            self._add(*previous, sign=-1)
+        player = (round, role, _round_score(scores))
+        self._players[record_id] = player
+        self._add(*player, sign=1)
+
+    def set_scores(self, record_id: int, scores) -> bool:
+        """ returns False for a record the totals don't know about """
+        player = self._players.get(record_id)
+        if player is None:
+            return False
+        self.put(record_id, player[0], player[1], scores)
+        return True
+
+    def round_summary(self, round: int) -> dict:
+        return dict(self._round(round))
@@ -0,0 +1,166 @@
+""" async facade over persistence.stub for the aiogram event loop.
+Storage work runs on one dedicated thread: handlers await the results without
+blocking other updates, and operations are applied in submission order, so
+writes of the same player can't overtake each other.
+In the multi-worker mode the calls go to the state service (persistence/service.py)
+and run on its persistence thread instead.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from . import leases, stub
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+# state service client of a worker process, None if the storage is owned by this process
+_client = None
+
+
+def connect(path: str) -> None:
+    """ storage calls of this process go to the state service listening on path """
+    global _client
+    from .service import StateClient
+    _client = StateClient(path)
+
+
+def submit(func, *args, **kwargs) -> asyncio.Future:
+    """ schedules the call on the local persistence thread at once """
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run(func, *args, **kwargs):
+    """ runs any storage bound callable (e.g. game scoring) on the persistence thread """
+    if _client is not None:
+        # the callable and its arguments are pickled, module level functions are sent by name
+        return await _client.call(func, *args, **kwargs)
+    return await submit(func, *args, **kwargs)
+
+
+def close() -> None:
+    """ waits for submitted calls and background writes, the facade can't be used after """
+    _executor.shutdown(wait=True)
+    stub.flush()
+
+
+async def store_update_choice(choice: dict, round: int = 1) -> dict:
+    return await run(stub.store_update_choice, choice=choice, round=round)
+
+
+async def store_update_scores(players_info: list) -> None:
+    await run(stub.store_update_scores, players_info)
+
+
+async def get_game_data(game_id: str, round: int or None, role: str or None) -> list:
+    return await run(stub.get_game_data, game_id=game_id, round=round, role=role)
+
+
+async def get_score(game_id: str, player_info: dict, round: int = 1) -> dict:
+    return await run(stub.get_score, game_id=game_id, player_info=player_info, round=round)
+
+
+async def get_round_summary(game_id: str, round: int = 1) -> dict:
+    return await run(stub.get_round_summary, game_id=game_id, round=round)
+
+
+async def get_round_totals(game_id: str, round: int = 1) -> dict:
+    return await run(stub.get_round_totals, game_id=game_id, round=round)
+
+
+async def get_round_details(game_id: str, round: int = 1) -> list:
+    return await run(stub.get_round_details, game_id=game_id, round=round)
+
+
+async def reset_game_data(game_id: str or None = None) -> None:
+    await run(stub.reset_game_data, game_id=game_id)
+
+
+async def archive_game(game_id: str) -> bool:
+    return await run(stub.archive_game, game_id=game_id)
+
+
+async def archive_completed_games() -> list:
+    return await run(stub.archive_completed_games)
+
+
+async def get_last_game_id() -> str or None:
+    return await run(stub.get_last_game_id)
+
+
+async def set_last_game_id(game_id: str) -> None:
+    await run(stub.set_last_game_id, game_id=game_id)
+
+
+async def get_game_status(game_id: str) -> dict or None:
+    # a dictionary lookup once the cache is loaded, but loading it or reading an archived game is file i/o
+    return await run(stub.get_game_status, game_id=game_id)
+
+
+async def set_game_status(game_id: str, round: int, status: str) -> None:
+    await run(stub.set_game_status, game_id=game_id, round=round, status=status)
+
+
+async def wait_for_game_round(game_id: str, round: int) -> dict or None:
+    """
+    game status once the game reaches the round or is completed, None if the game is reset meanwhile.
+    The waiter is kept by the process owning the storage, so status changes of all workers wake it.
+    """
+    if _client is not None:
+        # the state service replies once its waiter is resolved
+        return await _client.call(stub.wait_for_game_round, game_id=game_id, round=round)
+    return await asyncio.wrap_future(await submit(stub.wait_for_game_round, game_id=game_id, round=round))
+
+
+async def get_write_stats() -> dict:
+    return await run(stub.get_write_stats)
+
+
+async def get_telegram_file_id(path: str, sha256: str) -> str or None:
+    return await run(stub.get_telegram_file_id, path=path, sha256=sha256)
+
+
+async def set_telegram_file_id(path: str, sha256: str, file_id: str) -> None:
+    await run(stub.set_telegram_file_id, path=path, sha256=sha256, file_id=file_id)
+
+
+async def get_player_sessions() -> list:
+    return await run(stub.get_player_sessions)
+
+
+async def store_player_session(session: dict) -> None:
+    await run(stub.store_player_session, session=session)
+
+
+async def delete_player_session(key: str) -> None:
+    await run(stub.delete_player_session, key=key)
+
+
+async def get_game_rooms() -> list:
+    return await run(stub.get_game_rooms)
+
+
+async def get_game_room(game_id: str) -> dict or None:
+    return await run(stub.get_game_room, game_id=game_id)
+
+
+async def store_game_room(game_id: str, code: str, sheet_id: str or None = None) -> dict:
+    return await run(stub.store_game_room, game_id=game_id, code=code, sheet_id=sheet_id)
+
+
+async def set_game_room_sheet(game_id: str, sheet_id: str) -> None:
+    await run(stub.set_game_room_sheet, game_id=game_id, sheet_id=sheet_id)
+
+
+async def plan_sheet_rows(game_id: str, rows: list) -> list:
+    return await run(stub.plan_sheet_rows, game_id=game_id, rows=rows)
+
+
+async def confirm_sheet_rows(game_id: str, rows: list) -> None:
+    await run(stub.confirm_sheet_rows, game_id=game_id, rows=rows)
+
+
+async def acquire_lease(name: str, ttl: float = 300) -> str or None:
+    return await run(leases.acquire, name=name, ttl=ttl)
+
+
+async def release_lease(name: str, token: str) -> bool:
+    return await run(leases.release, name=name, token=token)
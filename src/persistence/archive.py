@@ -0,0 +1,54 @@
+""" compressed archive of completed games, one gzipped json file per game.
+Archived games are read only and loaded on demand, e.g. for reports.
+"""
+import gzip
+import json
+import os
+from .memory import _copy_record
+
+
+class GameArchive:
+    """ a game is stored as {"game_id", "status", "data"}, the file name is the game partition name """
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+
+    def _file_name(self, name: str) -> str:
+        return os.path.join(self._directory, name + ".json.gz")
+
+    def write(self, name: str, game: dict) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+        file_name = self._file_name(name)
+        tmp_file_name = file_name + ".tmp"
+        with gzip.open(tmp_file_name, "wt", encoding="utf-8") as archive_file:
+            json.dump(game, archive_file, ensure_ascii=False)
+        with open(tmp_file_name, "rb") as archive_file:
+            os.fsync(archive_file.fileno())
+        os.replace(tmp_file_name, file_name)
+
+    def read(self, name: str) -> dict or None:
+        try:
+            with gzip.open(self._file_name(name), "rt", encoding="utf-8") as archive_file:
+                return json.load(archive_file)
+        except FileNotFoundError:
+            return None
+
+    def remove(self, name: str) -> None:
+        try:
+            os.remove(self._file_name(name))
+        except FileNotFoundError:
+            pass
+
+
+class ArchivedTable:
+    """ read only part of the table interface over records of an archived game """
+
+    def __init__(self, records: list) -> None:
+        self._records = records
+
+    def get_by_query(self, query: dict) -> list:
+        return [_copy_record(r) for r in self._records
+                if all(f in r and r[f] == v for f, v in query.items())]
+
+    def get_all(self) -> list:
+        return [_copy_record(r) for r in self._records]
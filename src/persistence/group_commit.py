@@ -0,0 +1,173 @@
+""" single writer that commits queued records in batches (group commit).
+Records submitted within a few milliseconds are committed together in one
+durable operation, repeated writes of the same key are collapsed into the latest one.
+A failed batch stays queued and is retried, records are never dropped.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+# number of recent commits the statistics are computed from
+STATS_WINDOW = 1000
+
+
+class GroupCommitQueue:
+    """
+    ``commit`` stores a list of records in one operation. A batch is committed
+    ``max_delay`` seconds after its first record was submitted, or at once when
+    it reaches ``max_batch`` records or somebody is waiting in ``flush``.
+    A failed commit is retried after ``retry_delay * 2 ** n`` seconds, at most ``max_retry_delay``,
+    so ``commit`` must accept records that may already be stored.
+    """
+
+    def __init__(self, commit, max_delay: float = 0.005, max_batch: int = 200, name: str = "group-commit",
+                 retry_delay: float = 0.05, max_retry_delay: float = 5.0) -> None:
+        self._commit = commit
+        self._max_delay = max_delay
+        self._max_batch = max_batch
+        self._name = name
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._condition = threading.Condition()
+        # key -> latest record, dict keeps the order keys were first submitted in
+        self._pending = {}
+        self._first_submitted = None
+        self._committing = False
+        self._flush_requested = 0
+        self._writer = None
+        self._submitted = 0
+        self._coalesced = 0
+        self._commits = 0
+        self._failed = 0
+        # failures since the last successful commit, the last error and when the failed batch is retried
+        self._failures = 0
+        self._error = None
+        self._retry_at = None
+        self._batch_sizes = deque(maxlen=STATS_WINDOW)
+        # seconds from the first record of a batch being submitted to its commit end
+        self._latencies = deque(maxlen=STATS_WINDOW)
+        self._commit_durations = deque(maxlen=STATS_WINDOW)
+
+    def submit(self, key, record) -> None:
+        """ queues the record, an older record with the same key not yet committed is dropped """
+        self._start_writer()
+        with self._condition:
+            self._submitted += 1
+            if key in self._pending:
+                self._coalesced += 1
+            elif len(self._pending) == 0:
+                self._first_submitted = time.perf_counter()
+            self._pending[key] = record
+            if len(self._pending) == 1 or len(self._pending) >= self._max_batch:
+                self._condition.notify_all()
+
+    def flush(self) -> None:
+        """
+        blocks until all submitted records are committed, raises RuntimeError
+        if a commit fails meanwhile, the records stay queued for a retry
+        """
+        with self._condition:
+            if len(self._pending) == 0 and not self._committing:
+                return
+            failed = self._failed
+            self._flush_requested += 1
+            self._condition.notify_all()
+            try:
+                while len(self._pending) > 0 or self._committing:
+                    if self._failed > failed:
+                        raise RuntimeError(f"{self._name}: {len(self._pending)} records are not committed "
+                                           f"yet: {self._error}") from self._error
+                    self._condition.wait()
+            finally:
+                self._flush_requested -= 1
+
+    def stats(self) -> dict:
+        """ batch sizes and commit latencies in milliseconds over the recent commits """
+        with self._condition:
+            sizes = sorted(self._batch_sizes)
+            latencies = sorted(self._latencies)
+            durations = sorted(self._commit_durations)
+            return {
+                "submitted": self._submitted,
+                "coalesced": self._coalesced,
+                "commits": self._commits,
+                "failed_commits": self._failed,
+                "pending": len(self._pending),
+                "batch_p50": _percentile(sizes, 50),
+                "batch_max": sizes[-1] if len(sizes) > 0 else 0,
+                "latency_p50_ms": _percentile(latencies, 50) * 1000,
+                "latency_p99_ms": _percentile(latencies, 99) * 1000,
+                "commit_p50_ms": _percentile(durations, 50) * 1000,
+                "commit_p99_ms": _percentile(durations, 99) * 1000,
+            }
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            with self._condition:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_batches, name=self._name, daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+
+    def _next_batch(self) -> tuple:
+        with self._condition:
+            while True:
+                if self._retry_at is not None and len(self._pending) > 0:
+                    # backing off after a failure, flush requests don't hurry the retry
+                    wait = self._retry_at - time.perf_counter()
+                    if wait > 0:
+                        self._condition.wait(wait)
+                        continue
+                    self._retry_at = None
+                if len(self._pending) > 0:
+                    wait = self._first_submitted + self._max_delay - time.perf_counter()
+                    if wait <= 0 or len(self._pending) >= self._max_batch or self._flush_requested > 0:
+                        break
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            batch = self._pending
+            self._pending = {}
+            self._committing = True
+            return batch, self._first_submitted
+
+    def _write_batches(self) -> None:
+        while True:
+            batch, first_submitted = self._next_batch()
+            started = time.perf_counter()
+            error = None
+            try:
+                self._commit(list(batch.values()))
+            except Exception as e:
+                error = e
+            finished = time.perf_counter()
+            with self._condition:
+                self._committing = False
+                if error is not None:
+                    self._failed += 1
+                    self._failures += 1
+                    self._error = error
+                    delay = min(self._max_retry_delay, self._retry_delay * 2 ** (self._failures - 1))
+                    self._retry_at = finished + delay
+                    # the batch goes back in front, records submitted meanwhile replace its older ones
+                    batch.update(self._pending)
+                    self._pending = batch
+                    self._first_submitted = first_submitted
+                    logging.error(f"{self._name}: failed to commit {len(batch)} records, retry in {delay:.2f} s: "
+                                  f"{error}")
+                else:
+                    self._failures = 0
+                    self._error = None
+                    self._commits += 1
+                    self._batch_sizes.append(len(batch))
+                    self._latencies.append(finished - first_submitted)
+                    self._commit_durations.append(finished - started)
+                self._condition.notify_all()
+
+
+def _percentile(ordered: list, percent: int) -> float:
+    if len(ordered) == 0:
+        return 0
+    return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
@@ -0,0 +1,114 @@
+""" append-only journal of table mutations, periodically compacted into a snapshot.
+The snapshot is the table json file itself (pysondb format), the journal lives next to it.
+"""
+import json
+import logging
+import os
+
+
+JOURNAL_SUFFIX = ".journal"
+OP_PUT = "put"
+OP_PUT_MANY = "put_many"
+OP_DELETE = "delete"
+OP_DELETE_ALL = "delete_all"
+
+
+class Journal:
+    """
+    Every mutation is appended as one json line, so write cost doesn't depend
+    on the amount of stored data. After ``compact_every`` entries the caller
+    writes a fresh snapshot and the journal starts over.
+    """
+
+    def __init__(self, file_name: str, compact_every: int = 1000, fsync: bool = False) -> None:
+        self._snapshot_file_name = file_name
+        self._journal_file_name = file_name + JOURNAL_SUFFIX
+        self._compact_every = compact_every
+        self._fsync = fsync
+        self._journal_file = None
+        self._entries = 0
+        self._damaged = False
+
+    @property
+    def entries(self) -> int:
+        return self._entries
+
+    def needs_compaction(self) -> bool:
+        return self._damaged or self._entries >= self._compact_every
+
+    def read_snapshot(self) -> list:
+        try:
+            with open(self._snapshot_file_name, "r", encoding="utf-8") as db_file:
+                return json.load(db_file)["data"]
+        except FileNotFoundError:
+            return []
+
+    def replay(self):
+        """ yields journal entries written after the last snapshot """
+        self._entries = 0
+        try:
+            journal_file = open(self._journal_file_name, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write of the last entry, everything before it is consistent,
+                    # compaction is required before anything is appended after it
+                    logging.warning(f"skipping damaged journal entry in {self._journal_file_name}")
+                    self._damaged = True
+                    break
+                self._entries += 1
+                yield entry
+
+    def _open(self):
+        if self._journal_file is None:
+            directory = os.path.dirname(self._journal_file_name)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._journal_file = open(self._journal_file_name, "a", encoding="utf-8")
+        return self._journal_file
+
+    def append(self, *entries: dict) -> None:
+        journal_file = self._open()
+        journal_file.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+        journal_file.flush()
+        if self._fsync:
+            os.fsync(journal_file.fileno())
+        self._entries += len(entries)
+
+    def compact(self, records) -> None:
+        """ writes all records as the new snapshot and truncates the journal """
+        directory = os.path.dirname(self._snapshot_file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file_name = self._snapshot_file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as db_file:
+            json.dump({"data": list(records)}, db_file, indent=3, ensure_ascii=False)
+            db_file.flush()
+            os.fsync(db_file.fileno())
+        os.replace(tmp_file_name, self._snapshot_file_name)
+        # replaying entries already in the snapshot is harmless, so a crash
+        # before the truncation below doesn't lose or corrupt anything
+        self.close()
+        open(self._journal_file_name, "w", encoding="utf-8").close()
+        self._entries = 0
+        self._damaged = False
+
+    def remove(self) -> None:
+        """ deletes the snapshot and the journal """
+        self.close()
+        for file_name in (self._snapshot_file_name, self._journal_file_name):
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+        self._entries = 0
+        self._damaged = False
+
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
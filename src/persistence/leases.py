@@ -0,0 +1,32 @@
+""" named leases for work that must be done by one worker at a time, e.g. scoring a round.
+Held in the process that owns the storage, a lease of a crashed holder expires after its ttl.
+"""
+import secrets
+import threading
+import time
+
+_lock = threading.Lock()
+# name -> (token, expires at)
+_leases = {}
+
+
+def acquire(name: str, ttl: float = 300) -> str or None:
+    """ token of the acquired lease, None if someone else holds it """
+    now = time.monotonic()
+    with _lock:
+        held = _leases.get(name)
+        if held is not None and held[1] > now:
+            return None
+        token = secrets.token_hex(8)
+        _leases[name] = (token, now + ttl)
+        return token
+
+
+def release(name: str, token: str) -> bool:
+    """ releases the lease if it is still held with the token """
+    with _lock:
+        held = _leases.get(name)
+        if held is None or held[0] != token:
+            return False
+        del _leases[name]
+        return True
@@ -0,0 +1,227 @@
+""" resident in-memory tables with hash indexes,
+each table is restored once from its snapshot and journal and kept in memory
+"""
+import threading
+import uuid
+from .journal import Journal, OP_PUT, OP_PUT_MANY, OP_DELETE, OP_DELETE_ALL
+
+
+# never equal to a queried value
+_MISSING = object()
+
+
+def _copy_record(record: dict) -> dict:
+    # records are flat, only list values (choices, components) need a copy,
+    # so callers can't modify stored data or indexes behind the table's back
+    copied = dict(record)
+    for k, v in copied.items():
+        if isinstance(v, list):
+            copied[k] = list(v)
+    return copied
+
+
+class IndexedTable:
+    """
+    Keeps all records of a table in memory and maintains hash indexes for the
+    given field combinations, so queries by these fields don't scan the whole
+    table. Mutations are appended to the table journal, the snapshot
+    (pysondb json file) is only rewritten on compaction.
+    With ``record_type`` (e.g. persistence.records.PlayerRound) records are kept
+    as its instances: built with ``from_dict``, written and returned as ``to_dict()``.
+    """
+
+    def __init__(self, file_name: str, indexes: tuple = (), id_fieldname: str = "id",
+                 compact_every: int = 1000, fsync: bool = False, record_type=None) -> None:
+        self._file_name = file_name
+        self._id_fieldname = id_fieldname
+        self._record_type = record_type
+        self._journal = Journal(file_name, compact_every=compact_every, fsync=fsync)
+        self._lock = threading.RLock()
+        self._records = {}
+        # index fields -> index key -> {record id: None}, dict keeps insertion order
+        self._indexes = {tuple(fields): {} for fields in indexes}
+        self._loaded = False
+
+    def _decode(self, data: dict):
+        """ resident form of a record read from disk or already copied from the caller """
+        if self._record_type is None:
+            return data
+        return self._record_type.from_dict(data)
+
+    def _encode(self, record) -> dict:
+        """ json form of a resident record, for the journal and snapshots """
+        if self._record_type is None:
+            return record
+        return record.to_dict()
+
+    def _export(self, record) -> dict:
+        """ copy handed out to callers """
+        if self._record_type is None:
+            return _copy_record(record)
+        return record.to_dict()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        for record in self._journal.read_snapshot():
+            self._insert(self._decode(record))
+        for entry in self._journal.replay():
+            self._apply(entry)
+        self._loaded = True
+        if self._journal.needs_compaction():
+            self._journal.compact(self._encode(r) for r in self._records.values())
+
+    def _put(self, record: dict) -> None:
+        if record[self._id_fieldname] in self._records:
+            self._remove(record[self._id_fieldname])
+        self._insert(record)
+
+    def _apply(self, entry: dict) -> None:
+        if entry["op"] == OP_PUT:
+            self._put(self._decode(entry["record"]))
+        elif entry["op"] == OP_PUT_MANY:
+            for record in entry["records"]:
+                self._put(self._decode(record))
+        elif entry["op"] == OP_DELETE:
+            if entry["id"] in self._records:
+                self._remove(entry["id"])
+        elif entry["op"] == OP_DELETE_ALL:
+            self._clear()
+
+    def _log(self, *entries: dict) -> None:
+        self._journal.append(*entries)
+        if self._journal.needs_compaction():
+            self.compact()
+
+    def compact(self) -> None:
+        """ folds the journal into a fresh snapshot """
+        with self._lock:
+            self._load()
+            self._journal.compact(self._encode(r) for r in self._records.values())
+
+    def _clear(self) -> None:
+        self._records = {}
+        self._indexes = {fields: {} for fields in self._indexes}
+
+    @staticmethod
+    def _new_id() -> int:
+        # same id format as pysondb uses
+        return int(str(uuid.uuid4().int)[:18])
+
+    def _insert(self, record: dict) -> None:
+        pk = record[self._id_fieldname]
+        self._records[pk] = record
+        for fields, index in self._indexes.items():
+            key = tuple(record.get(f) for f in fields)
+            index.setdefault(key, {})[pk] = None
+
+    def _remove(self, pk: int) -> dict:
+        record = self._records.pop(pk)
+        for fields, index in self._indexes.items():
+            key = tuple(record.get(f) for f in fields)
+            bucket = index[key]
+            del bucket[pk]
+            if len(bucket) == 0:
+                del index[key]
+        return record
+
+    def _candidates(self, query: dict):
+        """ pick the most selective index covered by the query """
+        best = None
+        for fields in self._indexes:
+            if set(fields).issubset(query) and (best is None or len(fields) > len(best)):
+                best = fields
+        if best is None:
+            return self._records.keys()
+        key = tuple(query[f] for f in best)
+        return self._indexes[best].get(key, {}).keys()
+
+    def add(self, new_data: dict) -> int:
+        with self._lock:
+            self._load()
+            record = self._decode(_copy_record(new_data))
+            record[self._id_fieldname] = self._new_id()
+            self._insert(record)
+            self._log({"op": OP_PUT, "record": self._encode(record)})
+            new_data[self._id_fieldname] = record[self._id_fieldname]
+            return record[self._id_fieldname]
+
+    def update_by_id(self, pk: int, new_data: dict) -> None:
+        with self._lock:
+            self._load()
+            if pk not in self._records:
+                raise KeyError(pk)
+            record = self._remove(pk)
+            record.update(_copy_record(new_data))
+            record[self._id_fieldname] = pk
+            self._insert(record)
+            self._log({"op": OP_PUT, "record": self._encode(record)})
+
+    def update_many(self, records: list, new_records: list = ()) -> None:
+        """
+        updates all records by their ids and adds new records as one journal entry,
+        so either all or none survive a crash
+        """
+        with self._lock:
+            self._load()
+            missing = [r[self._id_fieldname] for r in records if r[self._id_fieldname] not in self._records]
+            if len(missing) > 0:
+                raise KeyError(missing)
+            updated = []
+            for new_data in records:
+                record = self._remove(new_data[self._id_fieldname])
+                record.update(_copy_record(new_data))
+                self._insert(record)
+                updated.append(record)
+            for new_data in new_records:
+                record = self._decode(_copy_record(new_data))
+                record[self._id_fieldname] = self._new_id()
+                self._insert(record)
+                updated.append(record)
+                new_data[self._id_fieldname] = record[self._id_fieldname]
+            self._log({"op": OP_PUT_MANY, "records": [self._encode(r) for r in updated]})
+
+    def import_records(self, records: list) -> None:
+        """ stores records with their existing ids as one journal entry, records with the same id are replaced """
+        with self._lock:
+            self._load()
+            imported = [self._decode(_copy_record(r)) for r in records]
+            for record in imported:
+                self._put(record)
+            self._log({"op": OP_PUT_MANY, "records": [self._encode(r) for r in imported]})
+
+    def delete_by_id(self, pk: int) -> None:
+        with self._lock:
+            self._load()
+            if pk not in self._records:
+                raise KeyError(pk)
+            self._remove(pk)
+            self._log({"op": OP_DELETE, "id": pk})
+
+    def get_by_query(self, query: dict) -> list:
+        with self._lock:
+            self._load()
+            result = []
+            for pk in self._candidates(query):
+                record = self._records[pk]
+                if all(record.get(f, _MISSING) == v for f, v in query.items()):
+                    result.append(self._export(record))
+            return result
+
+    def get_all(self) -> list:
+        with self._lock:
+            self._load()
+            return [self._export(r) for r in self._records.values()]
+
+    def delete_all(self) -> None:
+        with self._lock:
+            self._clear()
+            self._loaded = True
+            self._log({"op": OP_DELETE_ALL})
+
+    def drop(self) -> None:
+        """ removes the table files, the table is empty afterwards """
+        with self._lock:
+            self._clear()
+            self._loaded = True
+            self._journal.remove()
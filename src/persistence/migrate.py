@@ -0,0 +1,49 @@
+""" imports the pysondb json tables and game partitions (including not yet compacted journals)
+into the sqlite database, archived games are shared by both backends and stay as they are
+
+usage: PYTHONPATH=src python -m persistence.migrate [sqlite database file]
+"""
+import logging
+import os
+import sys
+from .journal import JOURNAL_SUFFIX
+from .memory import IndexedTable
+from .sqlite import SqliteDatabase, SqliteTable
+from .stub import SQLITE_DB_FILE_NAME, SQLITE_TABLE_NAMES, SQLITE_GAME_DATA_TABLE_NAME, GAME_DATA_FILE_NAME, \
+    GAME_INDEX_FILE_NAME, PARTITION_TYPE, partition_file_name, partition_table_name
+
+
+def migrate(sqlite_db_file_name: str = SQLITE_DB_FILE_NAME) -> dict:
+    """ copies all records keeping their ids, running it again overwrites them """
+    database = SqliteDatabase(sqlite_db_file_name)
+    imported = {}
+    try:
+        for file_name, table_name in SQLITE_TABLE_NAMES.items():
+            records = IndexedTable(file_name).get_all()
+            SqliteTable(database, table_name).import_records(records)
+            imported[table_name] = len(records)
+            logging.info(f"imported {len(records)} records from {file_name} into {table_name}")
+        imported[SQLITE_GAME_DATA_TABLE_NAME] = 0
+        partitions = IndexedTable(GAME_INDEX_FILE_NAME).get_by_query({"type": PARTITION_TYPE})
+        for partition in partitions:
+            if partition["archived"]:
+                continue
+            records = IndexedTable(partition_file_name(partition["partition"])).get_all()
+            SqliteTable(database, partition_table_name(partition["partition"]),
+                        schema=SQLITE_GAME_DATA_TABLE_NAME).import_records(records)
+            imported[SQLITE_GAME_DATA_TABLE_NAME] += len(records)
+        logging.info(f"imported {imported[SQLITE_GAME_DATA_TABLE_NAME]} records of {len(partitions)} games")
+        if any(os.path.exists(f) for f in (GAME_DATA_FILE_NAME, GAME_DATA_FILE_NAME + JOURNAL_SUFFIX)):
+            # not yet split shared table, the bot splits it on the first start, it may have no snapshot yet
+            records = IndexedTable(GAME_DATA_FILE_NAME).get_all()
+            SqliteTable(database, SQLITE_GAME_DATA_TABLE_NAME).import_records(records)
+            imported[SQLITE_GAME_DATA_TABLE_NAME] += len(records)
+            logging.info(f"imported {len(records)} records from {GAME_DATA_FILE_NAME}")
+    finally:
+        database.close()
+    return imported
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    migrate(*sys.argv[1:2])
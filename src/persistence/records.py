@@ -0,0 +1,174 @@
+""" compact player-round records.
+
+A stored choice used to carry 18 ``*_round_N`` score fields, most of them -1 placeholders
+for other rounds and the other role. A record now keeps only the scores of its own round
+and role, compromised components are a bitmask. PlayerRoundView shows a record with
+the old field names for code written against the padded format.
+"""
+from collections.abc import Mapping
+
+ROLE_ARCHITECT = "архитектор"
+ROLE_HACKER = "хакер"
+# scores kept in PlayerRound.scores, by role, in this order
+ROLE_SCORES = {
+    ROLE_ARCHITECT: ("protected_score", "compromised_score"),
+    ROLE_HACKER: ("successful_attacks_score", "unsuccessful_attacks_score", "irrelevant_attacks_score"),
+}
+COMPROMISED_COMPONENTS = "compromised_tcb_components"
+LEGACY_ROUNDS = (1, 2, 3)
+# fields of the padded format, one per score, round and role
+LEGACY_SCORE_FIELDS = tuple(
+    f"{name}_round_{r}"
+    for name in ROLE_SCORES[ROLE_ARCHITECT] + (COMPROMISED_COMPONENTS,) + ROLE_SCORES[ROLE_HACKER]
+    for r in LEGACY_ROUNDS
+)
+_LEGACY_SCORE_FIELDS = frozenset(LEGACY_SCORE_FIELDS)
+
+
+def _mask_to_ids(mask: int) -> list:
+    return [c for c in range(mask.bit_length()) if mask >> c & 1]
+
+
+class PlayerRound:
+    """
+    Choice and results of one player in one round. ``scores`` is None until the
+    round is scored, unknown fields are kept in ``extra``.
+    Supports the dict operations the resident tables use: get, [], update.
+    """
+
+    __slots__ = ("id", "game_id", "chat_id", "player_username", "player_name", "role", "round",
+                 "choice", "scores", "compromised_mask", "extra")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self) -> None:
+        for f in self.__slots__:
+            setattr(self, f, None)
+        self.compromised_mask = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlayerRound":
+        """ accepts both compact and padded (legacy) records """
+        record = cls()
+        record.update({f: v for f, v in data.items() if f not in _LEGACY_SCORE_FIELDS})
+        if "scores" not in data:
+            record._scores_from_legacy(data)
+        return record
+
+    def _scores_from_legacy(self, data: dict) -> None:
+        names = ROLE_SCORES.get(self.role)
+        if names is None or self.round is None:
+            return
+        scores = [data.get(f"{name}_round_{self.round}", -1) for name in names]
+        if all(s == -1 for s in scores):
+            # not scored yet
+            return
+        # hackers' zero scores were stored as -1 placeholders
+        self.scores = tuple(max(s, 0) for s in scores)
+        compromised = data.get(f"{COMPROMISED_COMPONENTS}_round_{self.round}", -1)
+        if isinstance(compromised, list):
+            for c in compromised:
+                self.compromised_mask |= 1 << c
+
+    def to_dict(self) -> dict:
+        data = {f: getattr(self, f) for f in self.FIELDS}
+        if self.choice is not None:
+            data["choice"] = list(self.choice)
+        if self.scores is not None:
+            data["scores"] = list(self.scores)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get(self, field: str, default=None):
+        if field in self.FIELDS:
+            return getattr(self, field)
+        if self.extra is not None:
+            return self.extra.get(field, default)
+        return default
+
+    def __getitem__(self, field: str):
+        value = self.get(field, KeyError)
+        if value is KeyError:
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field: str, value) -> None:
+        if field in self.FIELDS:
+            if field in ("choice", "scores") and value is not None:
+                value = tuple(value)
+            setattr(self, field, value)
+        elif field in _LEGACY_SCORE_FIELDS:
+            # a padded field means something only with the round and role of the record, see compact_scores
+            raise ValueError(f"{field} of the padded format is set on a compact record")
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[field] = value
+
+    def update(self, data: dict) -> None:
+        for field, value in data.items():
+            self[field] = value
+
+
+def compact_scores(data: dict, role: str, round: int) -> dict:
+    """
+    ``data`` of a record of the role and round with the padded score fields replaced by
+    ``scores`` and ``compromised_mask``. Placeholders (-1) of other rounds and roles are dropped,
+    a score of another round or role raises ValueError.
+    """
+    own = {f"{name}_round_{round}" for name in ROLE_SCORES.get(role, ())}
+    if role == ROLE_ARCHITECT:
+        own.add(f"{COMPROMISED_COMPONENTS}_round_{round}")
+    stray = [f for f, v in data.items() if f in _LEGACY_SCORE_FIELDS and f not in own and v != -1]
+    if stray:
+        raise ValueError(f"scores of another round or role in a record of {role} in round {round}: {stray}")
+    record = PlayerRound()
+    record.role, record.round = role, round
+    record._scores_from_legacy(data)
+    compact = {f: v for f, v in data.items() if f not in _LEGACY_SCORE_FIELDS}
+    if record.scores is not None:
+        compact["scores"] = list(record.scores)
+        compact["compromised_mask"] = record.compromised_mask
+    return compact
+
+
+class PlayerRoundView(Mapping):
+    """ read only view of a compact record dict with the padded format fields added """
+
+    def __init__(self, record: dict) -> None:
+        if "scores" not in record:
+            # padded record stored before the compact format
+            record = PlayerRound.from_dict(record).to_dict()
+        self._record = record
+
+    def _legacy(self, field: str):
+        name, _, round = field.rpartition("_round_")
+        record = self._record
+        scores = record["scores"]
+        if scores is None or int(round) != record["round"]:
+            return -1
+        names = ROLE_SCORES.get(record["role"], ())
+        if name == COMPROMISED_COMPONENTS and record["role"] == ROLE_ARCHITECT:
+            return _mask_to_ids(record["compromised_mask"]) if scores[1] > 0 else -1
+        if name not in names:
+            return -1
+        value = scores[names.index(name)]
+        if record["role"] == ROLE_HACKER and value <= 0:
+            # scores not earned in the round keep the -1 placeholder
+            return -1
+        return value
+
+    def __getitem__(self, field: str):
+        if field in _LEGACY_SCORE_FIELDS:
+            return self._legacy(field)
+        return self._record[field]
+
+    def __iter__(self):
+        yield from self._record
+        yield from LEGACY_SCORE_FIELDS
+
+    def __len__(self) -> int:
+        return len(self._record) + len(LEGACY_SCORE_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"PlayerRoundView({self._record!r})"
@@ -0,0 +1,175 @@
+""" shared state service of the multi-worker mode: one process owns the storage and the game's
+in-memory scoring, worker processes call it over a unix socket.
+A call names a storage bound callable (e.g. stub.get_game_data or a scoring method of the game)
+with its arguments, it runs on the persistence thread of the service, so calls of all workers
+are applied one by one in arrival order. Calls are pickled, the socket must only be reachable
+by the bot's own processes.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import logging
+import os
+import pickle
+import signal
+import struct
+from . import aio
+
+_HEADER = struct.Struct("!I")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return await reader.readexactly(size)
+
+
+def write_frame(writer: asyncio.StreamWriter, payload: bytes) -> None:
+    writer.write(_HEADER.pack(len(payload)) + payload)
+
+
+def _reply(call_id: int, error: Exception or None, result=None) -> bytes:
+    try:
+        return pickle.dumps((call_id, error, result))
+    except Exception as e:
+        # the result or the error of the call can't be sent to the worker
+        return pickle.dumps((call_id, RuntimeError(f"state service reply failed: {e!r}, call error: {error!r}"), None))
+
+
+class StateService:
+    """ serves calls of the workers on the socket at ``path`` """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._writers = set()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                call_id, func, args, kwargs = pickle.loads(await read_frame(reader))
+                # submitted to the persistence thread right away, so calls keep their arrival order
+                future = aio.submit(func, *args, **kwargs)
+                future.add_done_callback(functools.partial(self._done, writer, call_id))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def disconnect(self) -> None:
+        """ closes connections of the workers, their handlers end with the end of the stream """
+        for writer in list(self._writers):
+            writer.close()
+
+    @staticmethod
+    def _done(writer: asyncio.StreamWriter, call_id: int, future: asyncio.Future) -> None:
+        if writer.is_closing() or future.cancelled():
+            return
+        error = future.exception()
+        if error is None and isinstance(future.result(), concurrent.futures.Future):
+            # the call returned a waiter (e.g. stub.wait_for_game_round), the reply is its result
+            waiter = asyncio.wrap_future(future.result())
+            waiter.add_done_callback(functools.partial(StateService._done, writer, call_id))
+            return
+        write_frame(writer, _reply(call_id, error) if error is not None else _reply(call_id, None, future.result()))
+
+    async def start(self) -> asyncio.AbstractServer:
+        if os.path.exists(self.path):
+            # left by a previous run
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._serve_connection, path=self.path)
+        logging.info(f"state service listening on {self.path}")
+        return server
+
+
+class StateClient:
+    """ calls of all handlers of a worker share one connection, replies are matched by call id """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._writer = None
+        self._receiver = None
+        self._connecting = None
+        # call id -> future of the reply, of the current connection
+        self._calls = {}
+        self._ids = itertools.count()
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        if self._writer is None:
+            if self._connecting is None:
+                self._connecting = asyncio.Lock()
+            async with self._connecting:
+                if self._writer is None:
+                    reader, writer = await asyncio.open_unix_connection(self.path)
+                    # calls waiting for replies on this connection
+                    self._calls = {}
+                    self._receiver = asyncio.ensure_future(self._receive(reader, writer, self._calls))
+                    self._writer = writer
+        return self._writer
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, calls: dict) -> None:
+        try:
+            while True:
+                call_id, error, result = pickle.loads(await read_frame(reader))
+                future = calls.pop(call_id, None)
+                if future is None or future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            # any failure drops the connection, e.g. after a reply that can't be unpickled
+            # the stream can't be trusted. The next call connects again
+            if not isinstance(e, (asyncio.IncompleteReadError, ConnectionError)):
+                logging.error(f"state service connection failed: {e!r}")
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            failed = list(calls.values())
+            calls.clear()
+            for future in failed:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"state service connection lost: {e!r}"))
+
+    async def call(self, func, *args, **kwargs):
+        writer = await self._connect()
+        calls = self._calls
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        calls[call_id] = future
+        try:
+            write_frame(writer, pickle.dumps((call_id, func, args, kwargs)))
+            await writer.drain()
+        except BaseException:
+            # the call isn't sent, e.g. its arguments can't be pickled
+            calls.pop(call_id, None)
+            raise
+        return await future
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def main(path: str) -> None:
+    """ entry point of the service process, background writes are flushed on SIGTERM or SIGINT """
+    logging.basicConfig(level=logging.INFO, format="state service: %(levelname)s:%(name)s:%(message)s")
+
+    async def serve() -> None:
+        state_service = StateService(path)
+        server = await state_service.start()
+        stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(sig, stopped.set)
+        async with server:
+            await stopped.wait()
+            state_service.disconnect()
+            await asyncio.sleep(0)
+
+    try:
+        asyncio.run(serve())
+    finally:
+        aio.close()
@@ -0,0 +1,75 @@
+""" compact records of players' bot sessions: FSM state and the few fields the bot keeps per player.
+Only set fields are stored, e.g. {"key": "1:42:42", "state": "Form:choice", "name": "Team", "role": "хакер", "round": 2}
+"""
+
+# FSM data keys of the fields, choices are kept as choice_round_N
+SESSION_FIELDS = ("name", "role", "round", "username")
+CHOICE_PREFIX = "choice_round_"
+
+
+class PlayerSession:
+    """ unknown data keys are kept in ``extra``, they must be json serializable to be stored """
+
+    __slots__ = ("key", "state", "name", "role", "round", "username", "choices", "extra")
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.state = None
+        self.name = None
+        self.role = None
+        self.round = None
+        self.username = None
+        # round -> the raw choice text of the round
+        self.choices = None
+        self.extra = None
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data()
+
+    def data(self) -> dict:
+        """ FSM data of the session """
+        data = {f: getattr(self, f) for f in SESSION_FIELDS if getattr(self, f) is not None}
+        if self.choices:
+            data.update((f"{CHOICE_PREFIX}{r}", c) for r, c in self.choices.items())
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def set_data(self, data: dict) -> None:
+        for f in SESSION_FIELDS:
+            setattr(self, f, data.get(f))
+        self.choices = None
+        self.extra = None
+        for k, v in data.items():
+            if k in SESSION_FIELDS:
+                continue
+            if k.startswith(CHOICE_PREFIX) and k[len(CHOICE_PREFIX):].isdigit():
+                if self.choices is None:
+                    self.choices = {}
+                self.choices[int(k[len(CHOICE_PREFIX):])] = v
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[k] = v
+
+    def to_record(self) -> dict:
+        record = {"key": self.key}
+        for f in ("state",) + SESSION_FIELDS:
+            if getattr(self, f) is not None:
+                record[f] = getattr(self, f)
+        if self.choices:
+            # json object keys are strings
+            record["choices"] = {str(r): c for r, c in self.choices.items()}
+        if self.extra:
+            record["extra"] = self.extra
+        return record
+
+    @classmethod
+    def from_record(cls, record: dict) -> "PlayerSession":
+        session = cls(record["key"])
+        for f in ("state",) + SESSION_FIELDS:
+            setattr(session, f, record.get(f))
+        if record.get("choices"):
+            session.choices = {int(r): c for r, c in record["choices"].items()}
+        session.extra = record.get("extra")
+        return session
@@ -0,0 +1,168 @@
+""" sqlite implementation of the game tables, selected with PERSISTENCE_BACKEND=sqlite.
+All tables live in one database file in WAL mode, the fields the game queries by
+are stored in indexed columns, the whole record is kept as json next to them.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+
+# table name -> (indexed columns, indexes)
+SCHEMA = {
+    "game_data": (
+        ("game_id", "round", "role", "player_username"),
+        (("game_id", "round", "role"), ("game_id", "player_username", "round")),
+    ),
+    "game_index": (
+        ("type",),
+        (("type",),),
+    ),
+    "game_status": (
+        ("game_id",),
+        (("game_id",),),
+    ),
+    "player_sessions": (
+        ("key",),
+        (("key",),),
+    ),
+    "sheet_rows": (
+        ("game_id",),
+        (("game_id",),),
+    ),
+}
+
+
+class SqliteDatabase:
+    """ one connection per database file, shared by all its tables """
+
+    def __init__(self, file_name: str) -> None:
+        self.lock = threading.RLock()
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(file_name, check_same_thread=False, cached_statements=256)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class SqliteTable:
+    """
+    Same interface as persistence.memory.IndexedTable. Statements are
+    parametrized and their text is built once per query shape, so sqlite
+    reuses the prepared statements from the connection cache.
+    ``schema`` is one of SCHEMA keys, the table name by default.
+    """
+
+    def __init__(self, database: SqliteDatabase, name: str, id_fieldname: str = "id",
+                 schema: str or None = None) -> None:
+        self._database = database
+        self._name = name
+        self._id_fieldname = id_fieldname
+        self._columns, indexes = SCHEMA[schema or name]
+        self._statements = {}
+        columns = "".join(f", {c}" for c in self._columns)
+        with self._database.lock, self._database.connection as conn:
+            # seq keeps insertion order, ids are random as in pysondb
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                         f"(seq INTEGER PRIMARY KEY, id INTEGER NOT NULL UNIQUE{columns}, data TEXT NOT NULL)")
+            for fields in indexes:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_{'_'.join(fields)} ON {name} ({', '.join(fields)})")
+
+    @staticmethod
+    def _new_id() -> int:
+        # same id format as pysondb uses
+        return int(str(uuid.uuid4().int)[:18])
+
+    def _statement(self, kind: str, fields: tuple = ()) -> str:
+        key = (kind, fields)
+        sql = self._statements.get(key)
+        if sql is None:
+            if kind == "select":
+                where = " AND ".join(f"{f} IS ?" for f in fields)
+                sql = f"SELECT data FROM {self._name}" + (f" WHERE {where}" if where else "") + " ORDER BY seq"
+            elif kind == "insert":
+                names = ", ".join((self._id_fieldname,) + self._columns + ("data",))
+                sql = f"INSERT OR REPLACE INTO {self._name} ({names}) VALUES ({', '.join('?' * (len(self._columns) + 2))})"
+            elif kind == "update":
+                assignments = "".join(f"{c} = ?, " for c in self._columns)
+                sql = f"UPDATE {self._name} SET {assignments}data = ? WHERE {self._id_fieldname} = ?"
+            elif kind == "get":
+                sql = f"SELECT data FROM {self._name} WHERE {self._id_fieldname} = ?"
+            self._statements[key] = sql
+        return sql
+
+    def _row(self, record: dict) -> tuple:
+        return tuple(record.get(c) for c in self._columns) + (json.dumps(record, ensure_ascii=False),)
+
+    def add(self, new_data: dict) -> int:
+        new_data[self._id_fieldname] = self._new_id()
+        self.import_records([new_data])
+        return new_data[self._id_fieldname]
+
+    def import_records(self, records: list) -> None:
+        """ stores records with their existing ids in one transaction, records with the same id are replaced """
+        rows = [(r[self._id_fieldname],) + self._row(r) for r in records]
+        with self._database.lock, self._database.connection as conn:
+            conn.executemany(self._statement("insert"), rows)
+
+    def update_by_id(self, pk: int, new_data: dict) -> None:
+        new_data = dict(new_data)
+        new_data[self._id_fieldname] = pk
+        self.update_many([new_data])
+
+    def update_many(self, records: list, new_records: list = ()) -> None:
+        """ updates all records by their ids and adds new records in one transaction """
+        for new_data in new_records:
+            new_data[self._id_fieldname] = self._new_id()
+        with self._database.lock, self._database.connection as conn:
+            rows = []
+            for new_data in records:
+                pk = new_data[self._id_fieldname]
+                row = conn.execute(self._statement("get"), (pk,)).fetchone()
+                if row is None:
+                    raise KeyError(pk)
+                record = json.loads(row[0])
+                record.update(new_data)
+                rows.append(self._row(record) + (pk,))
+            conn.executemany(self._statement("update"), rows)
+            conn.executemany(self._statement("insert"), [(r[self._id_fieldname],) + self._row(r) for r in new_records])
+
+    def get_by_query(self, query: dict) -> list:
+        fields = tuple(f for f in query if f in self._columns)
+        with self._database.lock:
+            rows = self._database.connection.execute(
+                self._statement("select", fields), tuple(query[f] for f in fields)).fetchall()
+        result = []
+        for row in rows:
+            record = json.loads(row[0])
+            if all(f in record and record[f] == v for f, v in query.items()):
+                result.append(record)
+        return result
+
+    def get_all(self) -> list:
+        return self.get_by_query({})
+
+    def delete_by_id(self, pk: int) -> None:
+        with self._database.lock, self._database.connection as conn:
+            if conn.execute(f"DELETE FROM {self._name} WHERE {self._id_fieldname} = ?", (pk,)).rowcount == 0:
+                raise KeyError(pk)
+
+    def delete_all(self) -> None:
+        with self._database.lock, self._database.connection as conn:
+            conn.execute(f"DELETE FROM {self._name}")
+
+    def drop(self) -> None:
+        with self._database.lock, self._database.connection as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {self._name}")
+
+    @staticmethod
+    def exists(database: SqliteDatabase, name: str) -> bool:
+        with database.lock:
+            return database.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
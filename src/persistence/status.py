@@ -0,0 +1,135 @@
+""" in-process cache of game statuses, authoritative for the running bot.
+Reads are dictionary lookups, writes update the cache at once and are persisted
+by a background writer, callers can wait for round transitions.
+"""
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class GameStatusCache:
+    """
+    ``load`` returns all stored statuses, ``persist`` stores one status.
+    Status dicts are replaced on every change, never modified, so a returned
+    status may be kept by the caller but must not be changed.
+    """
+
+    def __init__(self, load, persist, completed_status: str) -> None:
+        self._load = load
+        self._persist = persist
+        self._completed_status = completed_status
+        self._lock = threading.Lock()
+        self._statuses = None
+        # game_id -> latest status not yet persisted, older ones are never written
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._writer = None
+        # game_id -> [(round, future)] of the callers waiting for the game to reach the round
+        self._waiters = {}
+
+    def _ensure_loaded(self) -> dict:
+        if self._statuses is None:
+            with self._lock:
+                if self._statuses is None:
+                    self._statuses = {s["game_id"]: s for s in self._load()}
+        return self._statuses
+
+    def get(self, game_id: str) -> dict or None:
+        return self._ensure_loaded().get(game_id)
+
+    def set(self, game_id: str, round: int, status: str) -> dict:
+        statuses = self._ensure_loaded()
+        game_status = {"game_id": game_id, "round": round, "status": status}
+        woken = []
+        with self._lock:
+            statuses[game_id] = game_status
+            self._pending[game_id] = game_status
+            waiting = []
+            for waiter in self._waiters.pop(game_id, ()):
+                (woken if self._reached(game_status, waiter[0]) else waiting).append(waiter)
+            if waiting:
+                self._waiters[game_id] = waiting
+        self._start_writer()
+        self._queue.put(game_id)
+        _wake(woken, game_status)
+        return game_status
+
+    def remember(self, game_status: dict) -> None:
+        """ caches a status stored elsewhere (e.g. in the archive) without persisting it """
+        statuses = self._ensure_loaded()
+        with self._lock:
+            statuses.setdefault(game_status["game_id"], game_status)
+
+    def forget(self, game_id: str) -> None:
+        """ drops the cached status of one game, the caller is responsible for the stored one """
+        self.flush()
+        statuses = self._ensure_loaded()
+        with self._lock:
+            statuses.pop(game_id, None)
+            woken = self._waiters.pop(game_id, [])
+        _wake(woken, None)
+
+    def clear(self) -> None:
+        """ drops cached statuses, the caller is responsible for the stored ones """
+        self.flush()
+        with self._lock:
+            self._statuses = {}
+            woken = [w for waiters in self._waiters.values() for w in waiters]
+            self._waiters = {}
+        _wake(woken, None)
+
+    def _reached(self, game_status: dict or None, round: int) -> bool:
+        return game_status is not None and (game_status["round"] >= round or
+                                            game_status["status"] == self._completed_status)
+
+    def wait_for_round(self, game_id: str, round: int) -> Future:
+        """
+        Future of the game status once the game reaches the round or is completed,
+        of None if the game is forgotten or cleared meanwhile. Waiting is cancelled with the future.
+        """
+        statuses = self._ensure_loaded()
+        future = Future()
+        with self._lock:
+            game_status = statuses.get(game_id)
+            if not self._reached(game_status, round):
+                waiters = [w for w in self._waiters.get(game_id, ()) if not w[1].cancelled()]
+                waiters.append((round, future))
+                self._waiters[game_id] = waiters
+                return future
+        _wake([(round, future)], game_status)
+        return future
+
+    def flush(self) -> None:
+        """ blocks until all pending statuses are persisted """
+        if self._writer is not None:
+            self._queue.join()
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_behind, name="game-status-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+
+    def _write_behind(self) -> None:
+        while True:
+            game_id = self._queue.get()
+            with self._lock:
+                game_status = self._pending.pop(game_id, None)
+            try:
+                if game_status is not None:
+                    self._persist(game_status)
+            except Exception as e:
+                logging.error(f"failed to persist status of game {game_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def _wake(waiters: list, game_status: dict or None) -> None:
+    for _, future in waiters:
+        # cancelled futures are skipped
+        if future.set_running_or_notify_cancel():
+            future.set_result(game_status)
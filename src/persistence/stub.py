@@ -1,25 +1,316 @@
-""" functions for storing and reading player choices, simplest implementation
+""" functions for storing and reading player choices, tables are resident in memory and indexed.
+Data of every game lives in its own partition, completed games are moved to a compressed archive.
 """
-from pysondb import db
+import functools
+import hashlib
 import logging
+import os
+import threading
+from concurrent.futures import Future
+from os import getenv
+from dotenv import load_dotenv
+from .aggregates import GameTotals
+from .archive import ArchivedTable, GameArchive
+from .group_commit import GroupCommitQueue
+from .journal import JOURNAL_SUFFIX
+from .memory import IndexedTable
+from .records import LEGACY_SCORE_FIELDS, PlayerRound, PlayerRoundView, ROLE_ARCHITECT, ROLE_HACKER, compact_scores
+from .sqlite import SqliteDatabase, SqliteTable
+from .status import GameStatusCache
 
+load_dotenv()  # take environment variables from .env.
+
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+# json: resident tables persisted to pysondb files with a journal, sqlite: single database file
+PERSISTENCE_BACKEND = getenv("PERSISTENCE_BACKEND", BACKEND_JSON)
+SQLITE_DB_FILE_NAME = getenv("SQLITE_DB_FILE_NAME", "./data/game.sqlite")
+# players' choices are committed in batches: after this many milliseconds or records
+CHOICES_COMMIT_DELAY_MS = float(getenv("CHOICES_COMMIT_DELAY_MS", "5"))
+CHOICES_COMMIT_BATCH = int(getenv("CHOICES_COMMIT_BATCH", "200"))
+
+# shared table of all games used before partitioning, split into partitions on first access
 GAME_DATA_FILE_NAME = "./data/game_data.json"
+GAMES_DIRECTORY = "./data/games"
+ARCHIVE_DIRECTORY = "./data/archive"
 GAME_INDEX_FILE_NAME = "./data/game_index.json"
 GAME_STATUS_FILE_NAME = "./data/game_status.json"
-ROLE_ARCHITECT = "архитектор"
-ROLE_HACKER = "хакер"
+PLAYER_SESSIONS_FILE_NAME = "./data/player_sessions.json"
+SHEET_ROWS_FILE_NAME = "./data/sheet_rows.json"
 GAME_STATUS_IN_PROGRESS = 'in progress'
 GAME_STATUS_COMPLETED = 'completed'
+# game_index records of this type map game ids to their partitions
+PARTITION_TYPE = "game_partition"
+# game_index records of this type map uploaded files to their Telegram file_id
+TELEGRAM_FILE_TYPE = "telegram_file"
+# game_index records of this type map join codes to games
+GAME_ROOM_TYPE = "game_room"
+
+# hash indexes kept for each table, every query used by the game is covered by one of them
+_TABLE_INDEXES = {
+    GAME_INDEX_FILE_NAME: (("type",),),
+    GAME_STATUS_FILE_NAME: (("game_id",),),
+    PLAYER_SESSIONS_FILE_NAME: (("key",),),
+    SHEET_ROWS_FILE_NAME: (("game_id",),),
+}
+# game partitions hold records of one game only, so game_id isn't indexed
+_PARTITION_INDEXES = (
+    ("round",),
+    ("round", "role"),
+    ("player_username", "round"),
+)
+SQLITE_TABLE_NAMES = {
+    GAME_INDEX_FILE_NAME: "game_index",
+    GAME_STATUS_FILE_NAME: "game_status",
+    PLAYER_SESSIONS_FILE_NAME: "player_sessions",
+    SHEET_ROWS_FILE_NAME: "sheet_rows",
+}
+SQLITE_GAME_DATA_TABLE_NAME = "game_data"
+_tables = {}
+_sqlite_database = None
+# guards creation of the lazily built tables, database, queues and caches, they are first used
+# by any of the event loop, the persistence thread and the background writers;
+# reentrant, as tables open the database
+_singletons_lock = threading.RLock()
+_status_cache = None
+_choices_queue = None
+# game_id -> opened partition table
+_partitions = {}
+# game_id -> game_index record of the partition
+_partition_records = None
+_partitions_lock = threading.RLock()
+# game_id -> GameTotals, built on first use and maintained on writes
+_game_totals = {}
+_totals_lock = threading.Lock()
+# game_id -> {(round, chat_id): sheet_rows record}, loaded on first use and maintained on writes
+_sheet_rows = {}
+# the first row of the Moves sheet after the header
+FIRST_SHEET_ROW = 2
+
+
+def _database() -> SqliteDatabase:
+    global _sqlite_database
+    if _sqlite_database is None:
+        with _singletons_lock:
+            if _sqlite_database is None:
+                _sqlite_database = SqliteDatabase(SQLITE_DB_FILE_NAME)
+    return _sqlite_database
+
+
+def _table(file_name: str) -> IndexedTable or SqliteTable:
+    """ tables are opened once and stay resident for the process lifetime """
+    table = _tables.get(file_name)
+    if table is None:
+        with _singletons_lock:
+            # two tables over the same journal would append conflicting entries
+            table = _tables.get(file_name)
+            if table is None:
+                if PERSISTENCE_BACKEND == BACKEND_SQLITE:
+                    table = SqliteTable(_database(), SQLITE_TABLE_NAMES[file_name])
+                else:
+                    table = IndexedTable(file_name, indexes=_TABLE_INDEXES.get(file_name, ()))
+                _tables[file_name] = table
+    return table
+
+
+def partition_name(game_id: str) -> str:
+    # game ids are uuids or spreadsheet ids, hashing keeps file and table names safe
+    return hashlib.sha1(game_id.encode("utf-8")).hexdigest()[:20]
+
+
+def partition_file_name(name: str) -> str:
+    return os.path.join(GAMES_DIRECTORY, name + ".json")
+
+
+def partition_table_name(name: str) -> str:
+    return f"{SQLITE_GAME_DATA_TABLE_NAME}_{name}"
+
+
+def _open_partition(name: str) -> IndexedTable or SqliteTable:
+    if PERSISTENCE_BACKEND == BACKEND_SQLITE:
+        return SqliteTable(_database(), partition_table_name(name), schema=SQLITE_GAME_DATA_TABLE_NAME)
+    # journal appends are fsynced, group commit keeps it to one fsync per batch of choices
+    return IndexedTable(partition_file_name(name), indexes=_PARTITION_INDEXES, fsync=True, record_type=PlayerRound)
+
+
+def _partitions_index() -> dict:
+    global _partition_records
+    if _partition_records is None:
+        with _partitions_lock:
+            if _partition_records is None:
+                _partition_records = {r["game_id"]: r for r in
+                                      _table(GAME_INDEX_FILE_NAME).get_by_query({"type": PARTITION_TYPE})}
+                _split_shared_game_data()
+    return _partition_records
+
+
+def _partition(game_id: str, create: bool = False) -> IndexedTable or SqliteTable or None:
+    """ live partition of the game, an archived game is restored when ``create`` is set """
+    with _partitions_lock:
+        table = _partitions.get(game_id)
+        if table is not None:
+            return table
+        record = _partitions_index().get(game_id)
+        if record is None or record["archived"]:
+            if not create:
+                return None
+            if record is None:
+                record = {"type": PARTITION_TYPE, "game_id": game_id, "partition": partition_name(game_id),
+                          "archived": False}
+                _table(GAME_INDEX_FILE_NAME).add(record)
+                _partitions_index()[game_id] = record
+            else:
+                return _restore_archived_game(record)
+        table = _open_partition(record["partition"])
+        _partitions[game_id] = table
+        return table
+
+
+def _split_shared_game_data() -> None:
+    """ moves records of the shared game data table, used before partitioning, into partitions """
+    if PERSISTENCE_BACKEND == BACKEND_SQLITE:
+        if not SqliteTable.exists(_database(), SQLITE_GAME_DATA_TABLE_NAME):
+            return
+        shared = SqliteTable(_database(), SQLITE_GAME_DATA_TABLE_NAME)
+    else:
+        if not any(os.path.exists(f) for f in (GAME_DATA_FILE_NAME, GAME_DATA_FILE_NAME + JOURNAL_SUFFIX)):
+            return
+        shared = IndexedTable(GAME_DATA_FILE_NAME)
+    games = {}
+    for record in shared.get_all():
+        # padded records are converted to the compact format on the way
+        games.setdefault(record["game_id"], []).append(PlayerRound.from_dict(record).to_dict())
+    for game_id, records in games.items():
+        _partition(game_id, create=True).import_records(records)
+    shared.drop()
+    logging.info(f"split shared game data into {len(games)} game partitions")
+
+
+def _game_archive() -> GameArchive:
+    return GameArchive(ARCHIVE_DIRECTORY)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_archive(name: str) -> dict:
+    """ recently used archived games are kept in memory """
+    return _game_archive().read(name)
+
+
+def _archived_game(game_id: str) -> dict or None:
+    record = _partitions_index().get(game_id)
+    if record is None or not record["archived"]:
+        return None
+    return _load_archive(record["partition"])
+
+
+def _restore_archived_game(record: dict) -> IndexedTable or SqliteTable:
+    """ a game archived by mistake or continued with the same id gets a live partition back """
+    game = _load_archive(record["partition"])
+    table = _open_partition(record["partition"])
+    table.import_records(game["data"])
+    record["archived"] = False
+    _table(GAME_INDEX_FILE_NAME).update_by_id(record["id"], record)
+    _partitions[record["game_id"]] = table
+    current_status = _game_status_cache().get(record["game_id"])
+    if game["status"] is not None and (current_status is None or current_status == game["status"]):
+        # store the status again, it was removed from the status table on archiving
+        _game_status_cache().set(**game["status"])
+    _game_archive().remove(record["partition"])
+    _load_archive.cache_clear()
+    logging.info(f"restored archived game {record['game_id']}")
+    return table
+
+
+def archive_game(game_id: str) -> bool:
+    """ moves data and status of the game to the archive, returns False if there is nothing to archive """
+    flush()
+    with _partitions_lock:
+        table = _partition(game_id)
+        if table is None:
+            return False
+        record = _partitions_index()[game_id]
+        _game_archive().write(record["partition"], {
+            "game_id": game_id,
+            "status": get_game_status(game_id),
+            "data": table.get_all()
+        })
+        record["archived"] = True
+        _table(GAME_INDEX_FILE_NAME).update_by_id(record["id"], record)
+        del _partitions[game_id]
+        table.drop()
+        _delete_stored_game_status(game_id)
+    logging.info(f"archived game {game_id}")
+    return True
+
+
+def archive_completed_games() -> list:
+    """ archives completed games still having live partitions, e.g. after a restart """
+    flush()
+    completed = [s["game_id"] for s in _table(GAME_STATUS_FILE_NAME).get_all() if s["status"] == GAME_STATUS_COMPLETED]
+    return [game_id for game_id in completed if archive_game(game_id)]
+
+
+def _drop_game(game_id: str) -> None:
+    _forget_totals(game_id)
+    with _partitions_lock:
+        record = _partitions_index().pop(game_id, None)
+        table = _partitions.pop(game_id, None)
+        if record is None:
+            return
+        if record["archived"]:
+            _game_archive().remove(record["partition"])
+            _load_archive.cache_clear()
+        else:
+            (table or _open_partition(record["partition"])).drop()
+        _table(GAME_INDEX_FILE_NAME).delete_by_id(record["id"])
+
+
+def _force_backend(backend: str, sqlite_db_file_name: str = SQLITE_DB_FILE_NAME):
+    '''
+    mainly used for tests, benchmarks and migration
+    '''
+    global PERSISTENCE_BACKEND
+    global SQLITE_DB_FILE_NAME
+    global _sqlite_database
+    global _status_cache
+    global _choices_queue
+    global _partition_records
+    flush()
+    with _singletons_lock:
+        _status_cache = None
+        _choices_queue = None
+        PERSISTENCE_BACKEND = backend
+        SQLITE_DB_FILE_NAME = sqlite_db_file_name
+        _tables.clear()
+        _partitions.clear()
+        _partition_records = None
+        _game_totals.clear()
+        _sheet_rows.clear()
+        _load_archive.cache_clear()
+        if _sqlite_database is not None:
+            _sqlite_database.close()
+            _sqlite_database = None
+    return PERSISTENCE_BACKEND
 
 def store_data(data: dict) -> None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
+    _flush_choices()
+    game_db = _partition(data["game_id"], create=True)
     game_db.add(data)
+    # arbitrary data, the totals are rebuilt on the next read
+    _forget_totals(data["game_id"])
 
 def read_all_data():
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
-    data = game_db.getAll()
+    """ records of all games, archived ones included """
+    _flush_choices()
+    data = []
+    for game_id in list(_partitions_index()):
+        data.extend(_views(_game_data_table(game_id).get_all()))
     return data
 
+def _views(records: list) -> list:
+    # read only records with the padded *_round_N score fields
+    return [PlayerRoundView(r) for r in records]
+
 def _convert_choices_string_to_list(choice: str) -> list:
     choices = choice.split(",")
     choices_list = []
@@ -28,6 +319,7 @@ def _convert_choices_string_to_list(choice: str) -> list:
     return choices_list
 
 def preserve_entry_schema(entry: dict):
+    """ pads an entry with the score fields of all rounds, the format choices were stored in before compact records """
     extra_fields = [
        "compromised_score_round_1",
        "compromised_score_round_2",
@@ -54,63 +346,219 @@ def preserve_entry_schema(entry: dict):
             entry[f] = -1
     return entry
 
-def store_update_choice(choice : dict, round: int = 1) -> None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
-    choices_str = choice["choice"]
-    choice = preserve_entry_schema(choice)
-    choice["round"] = round    
-    choice["choice"] = _convert_choices_string_to_list(choices_str)
-    try:
-        # if choice already present, update it
-        data = game_db.getByQuery({
-            "game_id": choice["game_id"],
-            "player_username": choice["player_username"],
-            "round": round
-        })[0]
-        data["choice"] = choice["choice"]
-        # just in case the player has changed the team name
-        data["player_name"] = choice["player_name"]
-        game_db.updateById(data["id"], data)
-    except Exception as _:
-        # if it's a new choice, add it to the db        
-        data = choice        
-        data["choice"] = choice["choice"]        
-        game_db.add(data)
+def _choices_write_queue() -> GroupCommitQueue:
+    global _choices_queue
+    if _choices_queue is None:
+        with _singletons_lock:
+            if _choices_queue is None:
+                _choices_queue = GroupCommitQueue(
+                    commit=_commit_choices,
+                    max_delay=CHOICES_COMMIT_DELAY_MS / 1000,
+                    max_batch=CHOICES_COMMIT_BATCH,
+                    name="choices-writer"
+                )
+    return _choices_queue
+
+
+def _flush_choices() -> None:
+    # queued choices are committed before game data is read or changed, so callers read their own writes
+    if _choices_queue is not None:
+        _choices_queue.flush()
+
+
+def _game_data_table(game_id: str) -> IndexedTable or SqliteTable or ArchivedTable:
+    """ game data for reading: the live partition, the archived game, or an empty table """
+    _flush_choices()
+    table = _partition(game_id)
+    if table is None:
+        game = _archived_game(game_id)
+        table = ArchivedTable(game["data"] if game is not None else [])
+    return table
+
+
+def store_update_choice(choice : dict, round: int = 1) -> dict:
+    """
+    queues the choice for the next group commit and returns the entry as it will
+    be stored, a newer choice of the same player in the round replaces a queued one
+    """
+    entry = _prepare_choice(choice, round)
+    _choices_write_queue().submit((entry["game_id"], entry["player_username"], round), entry)
+    return dict(entry)
+
+
+def _prepare_choice(choice: dict, round: int) -> dict:
+    """ compact record of the choice, scores are set when the round ends """
+    choices = choice["choice"]
+    if isinstance(choices, str):
+        choices = _convert_choices_string_to_list(choices)
+    record = PlayerRound.from_dict({**choice, "round": round, "choice": choices, "scores": None})
+    return record.to_dict()
+
+
+def _commit_choices(choices: list) -> None:
+    """ stores a batch of choices, each one is unique per player and round, in one durable write per game """
+    games = {}
+    for choice in choices:
+        games.setdefault(choice["game_id"], []).append(choice)
+    for game_id, game_choices in games.items():
+        game_db = _partition(game_id, create=True)
+        updated = []
+        added = []
+        for choice in game_choices:
+            stored = game_db.get_by_query({
+                "player_username": choice["player_username"],
+                "round": choice["round"]
+            })
+            if len(stored) > 0:
+                # if choice already present, update it
+                updated.append({
+                    "id": stored[0]["id"],
+                    "choice": choice["choice"],
+                    # just in case the player has changed the team name
+                    "player_name": choice["player_name"]
+                })
+            else:
+                added.append(choice)
+        game_db.update_many(updated, new_records=added)
+        with _totals_lock:
+            totals = _game_totals.get(game_id)
+            if totals is not None:
+                for choice in added:
+                    totals.put(choice["id"], choice["round"], choice["role"], None)
+
+
+def get_write_stats() -> dict:
+    """ batch sizes and commit latencies of the choices writer """
+    return _choices_write_queue().stats()
 
 def store_update_score(player_info):
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
-    game_db.updateById(player_info["id"], player_info)
+    store_update_scores([player_info])
+
+def store_update_scores(players_info: list) -> None:
+    """ persists scores of many players as one atomic batch per game and updates round totals """
+    _flush_choices()
+    games = {}
+    for p in players_info:
+        games.setdefault(p["game_id"], []).append(p)
+    for game_id, players in games.items():
+        table = _partition(game_id, create=True)
+        players = [_compact_score_update(table, p) for p in players]
+        table.update_many(players)
+        with _totals_lock:
+            totals = _game_totals.get(game_id)
+            if totals is not None and not all("scores" in p and totals.set_scores(p["id"], p["scores"]) for p in players):
+                # a record the totals don't know, rebuild them on the next read
+                del _game_totals[game_id]
+
+
+def _compact_score_update(table, player_info: dict) -> dict:
+    """ scores in the padded format, e.g. of an older store_update_score caller, are stored compact """
+    if "scores" in player_info or player_info.keys().isdisjoint(LEGACY_SCORE_FIELDS):
+        return player_info
+    if "role" in player_info and "round" in player_info:
+        record = player_info
+    else:
+        stored = table.get_by_query({"id": player_info["id"]})
+        if not stored:
+            raise KeyError(player_info["id"])
+        record = stored[0]
+    return compact_scores(player_info, role=record["role"], round=record["round"])
+
+
+def _forget_totals(game_id: str) -> None:
+    with _totals_lock:
+        _game_totals.pop(game_id, None)
+
+
+def _totals(game_id: str) -> GameTotals:
+    with _totals_lock:
+        totals = _game_totals.get(game_id)
+        if totals is None:
+            # the only scan of the game records, later writes keep the totals up to date.
+            # It is done under the lock, so a write committed meanwhile waits for the totals and updates them,
+            # putting a record twice replaces it
+            totals = GameTotals()
+            for r in _views(_game_data_table(game_id).get_all()):
+                totals.put(r["id"], r["round"], r["role"], r["scores"])
+            _game_totals[game_id] = totals
+    return totals
+
+
+def get_round_totals(game_id: str, round: int = 1) -> dict:
+    """ score totals and participant counts by role, without reading player records """
+    totals = _totals(game_id)
+    with _totals_lock:
+        return totals.round_summary(round)
+
+def _game_status_cache() -> GameStatusCache:
+    global _status_cache
+    if _status_cache is None:
+        with _singletons_lock:
+            if _status_cache is None:
+                _status_cache = GameStatusCache(
+                    load=_table(GAME_STATUS_FILE_NAME).get_all,
+                    persist=_store_game_status,
+                    completed_status=GAME_STATUS_COMPLETED
+                )
+    return _status_cache
+
 
 def get_game_status(game_id: str) -> dict or None:
-    game_status_db = db.getDb(GAME_STATUS_FILE_NAME)
-    try:
-        game_status = game_status_db.getByQuery(query={"game_id": game_id})[0]
-    except Exception as _:
-        game_status = None
-    return game_status
+    """ served from the in-process cache, the returned status must not be modified """
+    status = _game_status_cache().get(game_id)
+    if status is None:
+        # statuses of archived games are kept with their data
+        game = _archived_game(game_id)
+        if game is not None and game["status"] is not None:
+            status = game["status"]
+            _game_status_cache().remember(status)
+    return status
 
 
 def set_game_status(game_id: str, round: int, status: str) -> None:
-    game_status_db = db.getDb(GAME_STATUS_FILE_NAME)    
-    games = game_status_db.getByQuery(query={"game_id": game_id})
+    """ updates the cache at once, the status is persisted in background """
+    _game_status_cache().set(game_id=game_id, round=round, status=status)
+
+
+def wait_for_game_round(game_id: str, round: int) -> Future:
+    """
+    concurrent.futures.Future of the game status once the game reaches the round or is completed,
+    of None if the game is reset meanwhile, see persistence.aio.wait_for_game_round
+    """
+    # archived games are completed, their status is cached by the lookup
+    get_game_status(game_id)
+    return _game_status_cache().wait_for_round(game_id=game_id, round=round)
+
+
+def flush() -> None:
+    """ blocks until background writes are persisted """
+    if _choices_queue is not None:
+        _choices_queue.flush()
+    if _status_cache is not None:
+        _status_cache.flush()
+
+
+def _store_game_status(new_status: dict) -> None:
+    game_status_db = _table(GAME_STATUS_FILE_NAME)    
+    games = game_status_db.get_by_query(query={"game_id": new_status["game_id"]})
     if len(games) == 0:
         game_status = None    
     else:
         game_status = games[0]
     if game_status is None:
         game_status = {}
-    game_status["game_id"] = game_id
-    game_status["round"] = round
-    game_status["status"] = status
+    game_status["game_id"] = new_status["game_id"]
+    game_status["round"] = new_status["round"]
+    game_status["status"] = new_status["status"]
     game_id = game_status.get("id", None)
     if game_id is not None:
-        game_status_db.updateById(pk=game_id, new_data=game_status)
+        game_status_db.update_by_id(pk=game_id, new_data=game_status)
     else:
         game_status_db.add(game_status)
 
 
 def get_game_data(game_id: str, round: int or None, role: str or None) -> dict:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
+    game_db = _game_data_table(game_id)
     query={"game_id": game_id}
 
     if round is not None:
@@ -121,53 +569,62 @@ def get_game_data(game_id: str, round: int or None, role: str or None) -> dict:
     if role is not None:
         query["role"] = role
 
-    data = game_db.getByQuery(query=query)
-    return data
+    data = game_db.get_by_query(query=query)
+    return _views(data)
+
+def _delete_stored_game_status(game_id: str) -> None:
+    game_status_db = _table(GAME_STATUS_FILE_NAME)
+    for game_status in game_status_db.get_by_query(query={"game_id": game_id}):
+        game_status_db.delete_by_id(game_status["id"])
+
 
-def reset_game_data() -> None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
-    game_db.deleteAll()
-    game_status_db = db.getDb(GAME_STATUS_FILE_NAME)
-    game_status_db.deleteAll()
+def reset_game_data(game_id: str or None = None) -> None:
+    """ drops the partition and status of the game, of all games if no game is given """
+    _flush_choices()
+    if game_id is not None:
+        _drop_game(game_id)
+        # pending status writes are flushed first, so they can't land after the cleanup
+        _game_status_cache().forget(game_id)
+        _delete_stored_game_status(game_id)
+        _drop_sheet_rows(game_id)
+        return
+    for g in list(_partitions_index()):
+        _drop_game(g)
+    _sheet_rows.clear()
+    _table(SHEET_ROWS_FILE_NAME).delete_all()
+    with _totals_lock:
+        _game_totals.clear()
+    _game_status_cache().clear()
+    game_status_db = _table(GAME_STATUS_FILE_NAME)
+    game_status_db.delete_all()
 
 
 def get_score(game_id: str, player_info: dict, round: int = 1) -> dict or None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
+    game_db = _game_data_table(game_id)
     query={"game_id": game_id, "player_username": player_info["username"], "round": round}
 
-    data = game_db.getByQuery(query=query)[0]
-    return data
+    data = game_db.get_by_query(query=query)[0]
+    return PlayerRoundView(data)
 
 def get_round_summary(game_id: str, round: int = 1) -> dict or None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
-    query={"game_id": game_id}
-    data = game_db.getByQuery(query=query)
-    architects_score = 0
-    hackers_score = 0
-
-    for e in data:
-        if e["role"] == ROLE_ARCHITECT:
-            if e["protected_score_round_"+str(round)] > 0:
-                architects_score += e["protected_score_round_"+str(round)]
-        elif e["role"] == ROLE_HACKER:
-            if e["successful_attacks_score_round_"+str(round)] > 0:
-                hackers_score += e["successful_attacks_score_round_"+str(round)]
+    """ protected attacks of architects and successful attacks of hackers in the round """
+    totals = get_round_totals(game_id=game_id, round=round)
     result = {
-        "architects": architects_score,
-        "hackers": hackers_score
+        "architects": totals["architects"],
+        "hackers": totals["hackers"]
     }
     return result
 
 def get_round_details(game_id: str, round: int = 1) -> dict or None:
-    game_db = db.getDb(GAME_DATA_FILE_NAME)
+    game_db = _game_data_table(game_id)
     query={"game_id": game_id, "round": round}
-    data = game_db.getByQuery(query=query)
-    return data
+    data = game_db.get_by_query(query=query)
+    return _views(data)
 
 def get_last_game_id() -> str or None:
-    game_index = db.getDb(GAME_INDEX_FILE_NAME)
+    game_index = _table(GAME_INDEX_FILE_NAME)
     try:
-        data = game_index.getByQuery({"type": "last_game_id"})[0]
+        data = game_index.get_by_query({"type": "last_game_id"})[0]
         last_game_id = data["last_game_id"]
         return last_game_id
     except Exception as _:
@@ -175,11 +632,11 @@ def get_last_game_id() -> str or None:
         return None
 
 def set_last_game_id(game_id: str) -> None:
-    game_index = db.getDb(GAME_INDEX_FILE_NAME)
+    game_index = _table(GAME_INDEX_FILE_NAME)
     try:
-        data = game_index.getByQuery({"type": "last_game_id"})[0]
+        data = game_index.get_by_query({"type": "last_game_id"})[0]
         data["last_game_id"] = game_id
-        game_index.updateById(data["id"], data)
+        game_index.update_by_id(data["id"], data)
     except Exception as _:
         # not found
         data = {
@@ -187,3 +644,130 @@ def set_last_game_id(game_id: str) -> None:
             "last_game_id": game_id
         }
         game_index.add(data)
+
+
+def get_telegram_file_id(path: str, sha256: str) -> str or None:
+    """ file_id of the uploaded file, None if it wasn't uploaded or its content has changed since """
+    game_index = _table(GAME_INDEX_FILE_NAME)
+    for record in game_index.get_by_query({"type": TELEGRAM_FILE_TYPE, "path": path}):
+        if record["sha256"] == sha256:
+            return record["file_id"]
+    return None
+
+
+def set_telegram_file_id(path: str, sha256: str, file_id: str) -> None:
+    game_index = _table(GAME_INDEX_FILE_NAME)
+    data = {"type": TELEGRAM_FILE_TYPE, "path": path, "sha256": sha256, "file_id": file_id}
+    records = game_index.get_by_query({"type": TELEGRAM_FILE_TYPE, "path": path})
+    if records:
+        # one record per path, a changed file replaces the previous upload
+        game_index.update_by_id(records[0]["id"], data)
+    else:
+        game_index.add(data)
+
+
+def get_player_sessions() -> list:
+    """ records of persistence.sessions.PlayerSession, all sessions are loaded at once on start """
+    return _table(PLAYER_SESSIONS_FILE_NAME).get_all()
+
+
+def store_player_session(session: dict) -> None:
+    sessions = _table(PLAYER_SESSIONS_FILE_NAME)
+    records = sessions.get_by_query({"key": session["key"]})
+    if records:
+        # the stored record is replaced in one write, fields missing in the new one are dropped
+        sessions.import_records([{**session, "id": records[0]["id"]}])
+    else:
+        sessions.add(session)
+
+
+def delete_player_session(key: str) -> None:
+    sessions = _table(PLAYER_SESSIONS_FILE_NAME)
+    for record in sessions.get_by_query({"key": key}):
+        sessions.delete_by_id(record["id"])
+
+
+def get_game_rooms() -> list:
+    """ {"game_id", "code", "sheet_id"} of every game players can join by code """
+    game_index = _table(GAME_INDEX_FILE_NAME)
+    # rooms stored before spreadsheets had their own ids used the game id
+    return [{"game_id": r["game_id"], "code": r["code"], "sheet_id": r.get("sheet_id", r["game_id"])}
+            for r in game_index.get_by_query({"type": GAME_ROOM_TYPE})]
+
+
+def get_game_room(game_id: str) -> dict or None:
+    """ room of the game as get_game_rooms returns it, None if the game has no room """
+    records = _table(GAME_INDEX_FILE_NAME).get_by_query({"type": GAME_ROOM_TYPE, "game_id": game_id})
+    if not records:
+        return None
+    return {"game_id": game_id, "code": records[0]["code"], "sheet_id": records[0].get("sheet_id", game_id)}
+
+
+def store_game_room(game_id: str, code: str, sheet_id: str or None = None) -> dict:
+    """ room of the game, a game keeps the room it got first """
+    game_index = _table(GAME_INDEX_FILE_NAME)
+    records = game_index.get_by_query({"type": GAME_ROOM_TYPE, "game_id": game_id})
+    if records:
+        return {"game_id": game_id, "code": records[0]["code"], "sheet_id": records[0].get("sheet_id", game_id)}
+    game_index.add({"type": GAME_ROOM_TYPE, "game_id": game_id, "code": code, "sheet_id": sheet_id})
+    return {"game_id": game_id, "code": code, "sheet_id": sheet_id}
+
+
+def set_game_room_sheet(game_id: str, sheet_id: str) -> None:
+    game_index = _table(GAME_INDEX_FILE_NAME)
+    for record in game_index.get_by_query({"type": GAME_ROOM_TYPE, "game_id": game_id}):
+        game_index.update_by_id(record["id"], {"sheet_id": sheet_id})
+
+
+def _game_sheet_rows(game_id: str) -> dict:
+    rows = _sheet_rows.get(game_id)
+    if rows is None:
+        rows = {(r["round"], r["chat_id"]): r for r in _table(SHEET_ROWS_FILE_NAME).get_by_query({"game_id": game_id})}
+        _sheet_rows[game_id] = rows
+    return rows
+
+
+def plan_sheet_rows(game_id: str, rows: list) -> list:
+    """
+    Row map of the game's Moves sheet: every (round, chat_id) keeps the row it got first,
+    new ones get the rows after the last one. ``rows`` are [round, chat_id, values].
+    Returns [row, values] of the rows whose values differ from the written ones.
+    """
+    stored = _game_sheet_rows(game_id)
+    next_row = max((r["row"] for r in stored.values()), default=FIRST_SHEET_ROW - 1) + 1
+    added = []
+    changed = []
+    for round, chat_id, values in rows:
+        record = stored.get((round, chat_id))
+        if record is None:
+            # values are set once the row is written
+            record = {"game_id": game_id, "round": round, "chat_id": chat_id, "row": next_row, "values": None}
+            next_row += 1
+            stored[(round, chat_id)] = record
+            added.append(record)
+        if record["values"] != values:
+            changed.append([record["row"], values])
+    if added:
+        _table(SHEET_ROWS_FILE_NAME).update_many([], new_records=added)
+    return changed
+
+
+def confirm_sheet_rows(game_id: str, rows: list) -> None:
+    """ [round, chat_id, values] rows were written to the sheet, they aren't sent again until changed """
+    stored = _game_sheet_rows(game_id)
+    updated = []
+    for round, chat_id, values in rows:
+        record = stored.get((round, chat_id))
+        # rows dropped by a reset meanwhile stay dropped
+        if record is not None and record["values"] != values:
+            record["values"] = values
+            updated.append({"id": record["id"], "values": values})
+    if updated:
+        _table(SHEET_ROWS_FILE_NAME).update_many(updated)
+
+
+def _drop_sheet_rows(game_id: str) -> None:
+    table = _table(SHEET_ROWS_FILE_NAME)
+    _sheet_rows.pop(game_id, None)
+    for record in table.get_by_query({"game_id": game_id}):
+        table.delete_by_id(record["id"])
@@ -0,0 +1,222 @@
+""" game rooms: every game has a join code, players join by the code or a deep link
+and the bot routes their updates to the game of their room, so one bot runs many games at once
+"""
+import asyncio
+import logging
+import secrets
+from google_sheets.pipeline import RetryLater
+from persistence import aio as storage
+
+# no easily confused characters, codes are typed by players
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 6
+# seconds a report job waits for the storage when it looks up the game's spreadsheet
+STORAGE_TIMEOUT = 10
+
+
+class GameRoom:
+    """
+    Per-game context of the bot. Status and scores are kept by game id in the storage
+    and in the game class, the room adds the join code and the report sink.
+    Report calls are queued to ``reports`` (google_sheets.pipeline.ReportQueue) and run in its thread.
+    """
+
+    __slots__ = ("game_id", "code", "sheet_id", "report", "_create_report", "_reports",
+                 "_rows", "_rows_done", "_flush")
+
+    def __init__(self, game_id: str, code: str, sheet_id: str or None = None, create_report=None,
+                 reports=None) -> None:
+        self.game_id = game_id
+        self.code = code
+        # spreadsheet of the game's Google Sheets mirror, None if not mirrored (yet)
+        self.sheet_id = sheet_id
+        # the mirror itself, created by the first report job
+        self.report = None
+        self._create_report = create_report
+        self._reports = reports
+        # Moves sheet rows waiting for the next flush: (round, chat_id) -> values
+        self._rows = {}
+        self._rows_done = []
+        # the task writing rows, one flush at a time
+        self._flush = None
+
+    @property
+    def mirrored(self) -> bool:
+        return self._create_report is not None and self._reports is not None
+
+    def deep_link(self, bot_username: str) -> str:
+        return f"https://t.me/{bot_username}?start={self.code}"
+
+    def _report(self, loop):
+        # called in the report thread, storage is reached through ``loop``, the event loop that queued the call
+        if self.report is None:
+            if self.sheet_id is None:
+                # the spreadsheet may have been created since the room was loaded, e.g. by another worker
+                room = asyncio.run_coroutine_threadsafe(storage.get_game_room(game_id=self.game_id), loop) \
+                    .result(STORAGE_TIMEOUT)
+                if room is not None:
+                    self.sheet_id = room["sheet_id"]
+            if self.sheet_id is None:
+                # the spreadsheet is still being created, the job is retried
+                raise RetryLater(f"game {self.game_id} has no spreadsheet yet")
+            self.report = self._create_report(self.sheet_id)
+        return self.report
+
+    def mirror(self, method: str, *args, done=None, **kwargs) -> None:
+        """ queues a report call and returns at once, its failure doesn't affect the game """
+        if not self.mirrored:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def run():
+            return getattr(self._report(loop), method)(*args, **kwargs)
+
+        self._reports.put(f"{method} of game {self.game_id}", run, done)
+
+    def create_sheet(self, done=None) -> None:
+        """
+        Queues creation of the game's spreadsheet, report calls queued after it go to the new sheet.
+        ``done(sheet_id, error)`` is awaited after the sheet id is stored with the room.
+        """
+        if not self.mirrored:
+            return
+
+        def run():
+            report = self._create_report(None)
+            sheet_id = report.create_game_details_sheet(self.game_id)
+            self.report, self.sheet_id = report, sheet_id
+            return sheet_id
+
+        async def created(sheet_id, error):
+            if error is None:
+                await storage.set_game_room_sheet(game_id=self.game_id, sheet_id=sheet_id)
+            if done is not None:
+                await done(sheet_id, error)
+
+        self._reports.put(f"spreadsheet of game {self.game_id}", run, created)
+
+    def write_rows(self, rows: dict, done=None) -> None:
+        """
+        Queues rows of the Moves sheet, ``rows`` maps (round, chat_id) to the row values.
+        Rows keep their place in the sheet by the row map in the storage, a flush sends
+        the rows that changed since they were written in one request.
+        Rows queued while a flush is running go with the next one.
+        ``done(count, error)`` is awaited once the rows are written.
+        """
+        if not self.mirrored:
+            return
+        self._rows.update(rows)
+        if done is not None:
+            self._rows_done.append(done)
+        if self._flush is None:
+            self._flush = asyncio.ensure_future(self._flush_rows())
+
+    def forget_rows(self) -> None:
+        """ drops rows that aren't being written yet, the game was reset """
+        self._rows.clear()
+
+    async def _flush_rows(self) -> None:
+        try:
+            while self._rows or self._rows_done:
+                rows, self._rows = self._rows, {}
+                waiters, self._rows_done = self._rows_done, []
+                count, error = 0, None
+                try:
+                    rows = [[round, chat_id, values] for (round, chat_id), values in rows.items()]
+                    updates = await storage.plan_sheet_rows(game_id=self.game_id, rows=rows)
+                    if updates:
+                        count = await self._send_rows(updates)
+                        await storage.confirm_sheet_rows(game_id=self.game_id, rows=rows)
+                except Exception as e:
+                    error = e
+                    logging.error(f"failed to write rows of game {self.game_id}: {e}")
+                for done in waiters:
+                    try:
+                        await done(count, error)
+                    except Exception as e:
+                        logging.error(f"failed to report written rows of game {self.game_id}: {e}")
+        finally:
+            self._flush = None
+
+    def _send_rows(self, updates: list) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        sent = loop.create_future()
+
+        def run():
+            return self._report(loop).write_rows(updates)
+
+        async def done(result, error):
+            if error is None:
+                sent.set_result(result)
+            else:
+                sent.set_exception(error)
+
+        self._reports.put(f"{len(updates)} rows of game {self.game_id}", run, done)
+        return sent
+
+
+class RoomRegistry:
+    """
+    Rooms by game id and by code, persisted in game_index.
+    `create_report(sheet_id)` returns the report sink of a spreadsheet, of a new one if sheet_id is None,
+    report calls are run by the ``reports`` queue. Rooms aren't mirrored without both.
+    Rooms unknown to the registry are looked up in the storage, they may be created by another worker.
+    """
+
+    def __init__(self, rooms: list = (), create_report=None, reports=None) -> None:
+        self._create_report = create_report
+        self._reports = reports
+        self._rooms = {}
+        self._codes = {}
+        for r in rooms:
+            self._add(r["game_id"], r["code"], r["sheet_id"])
+
+    def _add(self, game_id: str, code: str, sheet_id: str or None) -> GameRoom:
+        room = self._rooms.get(game_id)
+        if room is None:
+            room = GameRoom(game_id, code, sheet_id=sheet_id, create_report=self._create_report,
+                            reports=self._reports)
+            self._rooms[game_id] = room
+            self._codes[code] = room
+        return room
+
+    async def _reload(self) -> None:
+        for r in await storage.get_game_rooms():
+            self._add(r["game_id"], r["code"], r["sheet_id"])
+
+    def _new_code(self) -> str:
+        while True:
+            code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            if code not in self._codes:
+                return code
+
+    async def get(self, game_id: str, new_game: bool = False) -> GameRoom:
+        """
+        Room of the game, a game without a room gets a new code. Spreadsheets of games started
+        before rooms or with an existing spreadsheet have the game id, a new game gets its own one later.
+        """
+        room = self._rooms.get(game_id)
+        if room is None:
+            await self._reload()
+            room = self._rooms.get(game_id)
+        if room is None:
+            # the storage keeps the room stored first if another worker created it meanwhile
+            stored = await storage.store_game_room(game_id=game_id, code=self._new_code(),
+                                                   sheet_id=None if new_game else game_id)
+            room = self._add(game_id, stored["code"], stored["sheet_id"])
+        return room
+
+    def by_code(self, code: str) -> GameRoom or None:
+        """ known rooms only, see find """
+        return self._codes.get(code.strip().upper())
+
+    async def find(self, code: str) -> GameRoom or None:
+        room = self.by_code(code)
+        if room is None:
+            await self._reload()
+            room = self.by_code(code)
+        return room
+
+    def __len__(self) -> int:
+        return len(self._rooms)
@@ -0,0 +1,84 @@
+""" FSM storage of the bot: compact player sessions kept in memory and persisted locally,
+so players in the middle of a game keep their state when the bot restarts
+"""
+import asyncio
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey, DEFAULT_DESTINY
+from persistence import aio as storage
+from persistence.sessions import PlayerSession
+
+
+def session_key(key: StorageKey) -> str:
+    parts = [key.bot_id, key.chat_id, key.user_id]
+    if key.thread_id is not None or key.destiny != DEFAULT_DESTINY:
+        parts += [key.thread_id if key.thread_id is not None else "", key.destiny]
+    return ":".join(str(p) for p in parts)
+
+
+def session_chat_id(key: str) -> int:
+    return int(key.split(":")[1])
+
+
+class PlayerSessionStorage(BaseStorage):
+    """
+    Reads are served from memory, every change is written through the persistence thread.
+    All sessions are loaded on first access. FSM data must be json serializable.
+    A worker of the multi-worker mode passes ``owns(chat_id)`` and loads only sessions of its chats.
+    """
+
+    def __init__(self, owns=None) -> None:
+        self._owns = owns
+        self._sessions = None
+        self._loading = asyncio.Lock()
+
+    async def _all(self) -> dict:
+        if self._sessions is None:
+            async with self._loading:
+                if self._sessions is None:
+                    records = await storage.get_player_sessions()
+                    if self._owns is not None:
+                        records = [r for r in records if self._owns(session_chat_id(r["key"]))]
+                    self._sessions = {r["key"]: PlayerSession.from_record(r) for r in records}
+        return self._sessions
+
+    async def _get(self, key: StorageKey) -> PlayerSession or None:
+        return (await self._all()).get(session_key(key))
+
+    async def _save(self, session: PlayerSession) -> None:
+        sessions = await self._all()
+        if session.is_empty():
+            # cleared sessions aren't kept
+            if sessions.pop(session.key, None) is not None:
+                await storage.delete_player_session(key=session.key)
+            return
+        sessions[session.key] = session
+        await storage.store_player_session(session=session.to_record())
+
+    async def _session(self, key: StorageKey) -> PlayerSession:
+        session = await self._get(key)
+        return PlayerSession(session_key(key)) if session is None else session
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        session = await self._session(key)
+        session.state = state.state if isinstance(state, State) else state
+        await self._save(session)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        session = await self._get(key)
+        return None if session is None else session.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        session = await self._session(key)
+        session.set_data(data)
+        await self._save(session)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        session = await self._get(key)
+        return {} if session is None else session.data()
+
+    async def count(self) -> int:
+        return len(await self._all())
+
+    async def close(self) -> None:
+        pass
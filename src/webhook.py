@@ -0,0 +1,37 @@
+""" webhook mode: updates are posted by Telegram to an embedded aiohttp server.
+Every update is acknowledged at once and handled in its own task, so a slow
+handler doesn't hold back the others.
+"""
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+def create_app(dp: Dispatcher, bot: Bot, path: str, secret_token: str or None) -> web.Application:
+    """ requests without the secret token in X-Telegram-Bot-Api-Secret-Token are rejected with 401 """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=True,
+                         secret_token=secret_token).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_webhook(dp: Dispatcher, bot: Bot, url: str, path: str, host: str, port: int,
+                        secret_token: str or None, allowed_updates: list = None) -> web.AppRunner:
+    """
+    Serves updates on host:port and registers url + path as the bot webhook, the caller cleans up the runner.
+    Update types default to the ones handled by the routers of the dispatcher.
+    """
+    runner = web.AppRunner(create_app(dp, bot, path, secret_token))
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await bot.set_webhook(url.rstrip("/") + path, secret_token=secret_token,
+                              allowed_updates=allowed_updates if allowed_updates is not None
+                              else dp.resolve_used_update_types())
+    except Exception:
+        await runner.cleanup()
+        raise
+    logging.info(f"serving webhook {path} on {host}:{port}")
+    return runner
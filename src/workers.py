@@ -0,0 +1,179 @@
+""" multi-worker mode: the front process receives updates (polling or webhook) and passes every
+update to the worker process of its chat, so updates of one chat are always handled by the same worker.
+Workers run the bot's handlers, shared state (game status, FSM sessions, choices and scoring)
+lives in the state service (persistence/service.py). All processes talk over unix sockets in one directory.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from aiogram import Dispatcher
+from persistence import aio as storage
+from persistence import service
+from persistence.service import read_frame, write_frame
+
+SERVICE_SOCKET = "state.sock"
+
+
+def worker_socket(socket_dir: str, index: int) -> str:
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+def worker_of(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+
+def update_chat_id(update: dict) -> int:
+    """ chat of the update as aiogram sees it for FSM, the user for updates without a chat """
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        if "chat" in event:
+            return event["chat"]["id"]
+        if isinstance(event.get("message"), dict):
+            # callback queries
+            return event["message"]["chat"]["id"]
+        if "from" in event:
+            return event["from"]["id"]
+    return 0
+
+
+class UpdateRouter:
+    """ front side: one connection per worker, updates are sent as json """
+
+    def __init__(self, paths: list) -> None:
+        self.paths = paths
+        self.routed = [0] * len(paths)
+        self._writers = [None] * len(paths)
+        self._connecting = None
+
+    async def _writer(self, index: int) -> asyncio.StreamWriter:
+        writer = self._writers[index]
+        if writer is None or writer.is_closing():
+            if self._connecting is None:
+                self._connecting = asyncio.Lock()
+            async with self._connecting:
+                writer = self._writers[index]
+                if writer is None or writer.is_closing():
+                    _, writer = await asyncio.open_unix_connection(self.paths[index])
+                    self._writers[index] = writer
+        return writer
+
+    async def route(self, update: dict) -> int:
+        index = worker_of(update_chat_id(update), len(self.paths))
+        writer = await self._writer(index)
+        write_frame(writer, json.dumps(update, ensure_ascii=False).encode("utf-8"))
+        await writer.drain()
+        self.routed[index] += 1
+        return index
+
+    async def close(self) -> None:
+        writers, self._writers = self._writers, [None] * len(self.paths)
+        for writer in writers:
+            if writer is not None:
+                writer.close()
+                await writer.wait_closed()
+
+
+def forwarding_dispatcher(router: UpdateRouter) -> Dispatcher:
+    """ dispatcher of the front process, updates are forwarded to the workers instead of handled """
+    dp = Dispatcher()
+
+    async def forward(handler, update, data) -> None:
+        await router.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+    dp.update.outer_middleware(forward)
+    return dp
+
+
+class UpdateServer:
+    """ worker side: every update from the front is handled in its own task, as in polling """
+
+    def __init__(self, dp: Dispatcher, bot, path: str) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self._tasks = set()
+        self._writers = set()
+
+    async def _handle(self, update: dict) -> None:
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            logging.exception(f"failed to handle update {update.get('update_id')}: {e}")
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                task = asyncio.create_task(self._handle(json.loads(await read_frame(reader))))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def disconnect(self) -> None:
+        """ closes the connection of the front, updates already received are still handled """
+        for writer in list(self._writers):
+            writer.close()
+
+    async def start(self) -> asyncio.AbstractServer:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        return await asyncio.start_unix_server(self._receive, path=self.path)
+
+
+def _spawn(target, *args) -> multiprocessing.Process:
+    # spawned, not forked: the front process already runs an event loop and threads
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+async def _wait_for_socket(path: str, process: multiprocessing.Process, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+            writer.close()
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not process.is_alive():
+                raise RuntimeError(f"{process.name} exited with code {process.exitcode}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{process.name} doesn't listen on {path}")
+            await asyncio.sleep(0.05)
+
+
+async def start_workers(workers: int, socket_dir: str, worker_main, *args) -> (list, UpdateRouter):
+    """
+    Starts the state service and the workers, `worker_main(index, workers, socket_dir, *args)` runs a worker.
+    Storage calls of this process go to the service from now on.
+    Returns the processes, the service first, and the router of updates to the workers.
+    """
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    service_path = os.path.join(socket_dir, SERVICE_SOCKET)
+    processes = [_spawn(service.main, service_path)]
+    try:
+        await _wait_for_socket(service_path, processes[0])
+        storage.connect(service_path)
+        processes += [_spawn(worker_main, i, workers, socket_dir, *args) for i in range(workers)]
+        for i, process in enumerate(processes[1:]):
+            await _wait_for_socket(worker_socket(socket_dir, i), process)
+    except Exception:
+        stop_workers(processes)
+        raise
+    logging.info(f"{workers} workers started")
+    return processes, UpdateRouter([worker_socket(socket_dir, i) for i in range(workers)])
+
+
+def stop_workers(processes: list) -> None:
+    """ workers are stopped before the service, so it gets their last calls """
+    for process in reversed(processes):
+        process.terminate()
+        process.join(timeout=10)
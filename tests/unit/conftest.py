@@ -0,0 +1,52 @@
+""" fixtures shared by the unit tests: a fresh storage in a temporary directory and choices of players """
+from pytest import fixture
+from games.ogneborec import KiprGameOgneborec
+from persistence import stub
+
+
+def choice_record(username: str, role: str = stub.ROLE_ARCHITECT, choice="1,2", game_id: str = "g1",
+                  chat_id=None, name: str or None = None) -> dict:
+    """ choice of a player as the bot stores it, the chat is the username unless given """
+    return {
+        "game_id": game_id,
+        "chat_id": username if chat_id is None else chat_id,
+        "player_username": username,
+        "player_name": username if name is None else name,
+        "role": role,
+        "choice": choice
+    }
+
+
+@fixture
+def storage(tmp_path, monkeypatch):
+    """ json storage in an empty working directory, nothing is left from other tests """
+    monkeypatch.chdir(tmp_path)
+    stub._force_backend(stub.BACKEND_JSON)
+    KiprGameOgneborec.reset_live_scores()
+    yield tmp_path
+    stub._force_backend(stub.BACKEND_JSON)
+    KiprGameOgneborec.reset_live_scores()
+
+
+@fixture(params=[stub.BACKEND_JSON, stub.BACKEND_SQLITE])
+def backend(request, tmp_path, monkeypatch):
+    """ the same as storage, for each of the backends """
+    monkeypatch.chdir(tmp_path)
+    stub._force_backend(request.param, "./data/game.sqlite")
+    KiprGameOgneborec.reset_live_scores()
+    yield request.param
+    stub._force_backend(stub.BACKEND_JSON)
+    KiprGameOgneborec.reset_live_scores()
+
+
+@fixture
+def make_choice():
+    return choice_record
+
+
+@fixture
+def store_choice():
+    """ stores a choice through the game, as the handlers do, so live scores follow it """
+    def store(username: str, role: str = stub.ROLE_ARCHITECT, choice="1,2", round: int = 1, **fields) -> None:
+        KiprGameOgneborec.store_update_choice(choice_record(username, role, choice, **fields), round=round)
+    return store
@@ -0,0 +1,65 @@
+import asyncio
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from broadcast import BroadcastScheduler, TokenBucket
+
+
+class FakeBot:
+    """ answers after `latency`, rejects the first message to `flooded` chats with retry after """
+
+    def __init__(self, latency: float = 0.005, flooded=(), blocked=()) -> None:
+        self._latency = latency
+        self._flooded = set(flooded)
+        self._blocked = set(blocked)
+        self.sent = []
+        self.active = 0
+        self.max_active = 0
+
+    async def send_message(self, chat_id, text: str) -> None:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self._latency)
+            method = SendMessage(chat_id=chat_id, text=text)
+            if chat_id in self._blocked:
+                raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+            if chat_id in self._flooded:
+                self._flooded.discard(chat_id)
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.01)
+            self.sent.append((chat_id, text))
+        finally:
+            self.active -= 1
+
+
+def test_token_bucket_rate():
+    async def play():
+        bucket = TokenBucket(rate=200, capacity=5)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(25):
+            await bucket.acquire()
+        return loop.time() - started
+
+    # 5 at once, the other 20 at 200 per second
+    assert asyncio.run(play()) >= 0.09
+
+
+def test_broadcast_delivers_in_order_within_limits():
+    bot = FakeBot(flooded={3, 7}, blocked={5})
+    scheduler = BroadcastScheduler(bot, concurrency=4, rate=1000, chat_rate=1000, chat_burst=2)
+    reported = []
+
+    async def job(bot, chat_id):
+        await bot.send_message(chat_id, "first")
+        await bot.send_message(chat_id, "second")
+
+    async def progress(stats):
+        reported.append(stats)
+
+    stats = asyncio.run(scheduler.broadcast(range(10), job, progress=progress, progress_every=0.01))
+    assert stats == {"total": 10, "delivered": 9, "failed": 1}
+    assert reported[-1] == stats
+    assert bot.max_active <= 4
+    assert scheduler.retries == 2
+    for chat_id in set(range(10)) - {5}:
+        assert [text for c, text in bot.sent if c == chat_id] == ["first", "second"]
@@ -0,0 +1,40 @@
+import asyncio
+from persistence import aio, stub
+
+
+def test_game_status_write_behind(storage):
+    assert stub.get_game_status("g1") is None
+    stub.set_game_status("g1", 1, stub.GAME_STATUS_IN_PROGRESS)
+    stub.set_game_status("g1", 2, stub.GAME_STATUS_IN_PROGRESS)
+    assert stub.get_game_status("g1")["round"] == 2
+
+    # a fresh process sees the persisted status
+    stub._force_backend(stub.BACKEND_JSON)
+    assert stub.get_game_status("g1")["round"] == 2
+    assert len(stub._table(stub.GAME_STATUS_FILE_NAME).get_all()) == 1
+
+    stub.reset_game_data()
+    assert stub.get_game_status("g1") is None
+
+
+def test_wait_for_game_round(storage):
+    stub.set_game_status("g1", 1, stub.GAME_STATUS_IN_PROGRESS)
+
+    async def play():
+        waiter = asyncio.ensure_future(aio.wait_for_game_round(game_id="g1", round=2))
+        reset = asyncio.ensure_future(aio.wait_for_game_round(game_id="g1", round=5))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await aio.set_game_status(game_id="g1", round=2, status=stub.GAME_STATUS_IN_PROGRESS)
+        status = await asyncio.wait_for(waiter, timeout=1)
+        # reached rounds return at once, a completed game reaches every round
+        assert (await aio.wait_for_game_round(game_id="g1", round=1))["round"] == 2
+        await aio.set_game_status(game_id="g2", round=1, status=stub.GAME_STATUS_COMPLETED)
+        assert (await aio.wait_for_game_round(game_id="g2", round=3))["round"] == 1
+        # a reset game wakes its waiters
+        await aio.reset_game_data(game_id="g1")
+        return status, await asyncio.wait_for(reset, timeout=1)
+
+    status, reset = asyncio.run(play())
+    assert status["round"] == 2
+    assert reset is None
@@ -0,0 +1,92 @@
+import threading
+from pytest import raises
+from persistence import stub
+from persistence.group_commit import GroupCommitQueue
+
+
+def test_rapid_changes_are_coalesced():
+    committed = []
+    release = threading.Event()
+
+    def commit(batch):
+        release.wait(timeout=1)
+        committed.append(batch)
+
+    queue = GroupCommitQueue(commit, max_delay=10)
+    for n in range(5):
+        queue.submit(("g1", "alice", 1), n)
+    queue.submit(("g1", "bob", 1), "b")
+    release.set()
+    # flush doesn't wait for the delay to pass
+    queue.flush()
+    assert committed == [[4, "b"]]
+    stats = queue.stats()
+    assert (stats["submitted"], stats["coalesced"], stats["commits"], stats["batch_max"]) == (6, 4, 1, 2)
+
+
+def test_full_batch_is_committed_at_once():
+    committed = threading.Event()
+    queue = GroupCommitQueue(lambda batch: committed.set(), max_delay=10, max_batch=3)
+    for n in range(3):
+        queue.submit(n, n)
+    assert committed.wait(timeout=1)
+
+
+def test_failed_batch_is_kept_and_retried():
+    committed = []
+    broken = threading.Event()
+    broken.set()
+
+    def commit(batch):
+        if broken.is_set():
+            raise OSError("disk full")
+        committed.append(batch)
+
+    queue = GroupCommitQueue(commit, max_delay=0, retry_delay=0.05)
+    queue.submit("alice", 1)
+    # the failed record isn't reported as stored
+    with raises(RuntimeError):
+        queue.flush()
+    assert committed == []
+    assert queue.stats()["pending"] == 1
+    # a newer record of the same key replaces the failed one
+    queue.submit("alice", 2)
+    queue.submit("bob", "b")
+    broken.clear()
+    queue.flush()
+    assert committed == [[2, "b"]]
+    stats = queue.stats()
+    assert stats["failed_commits"] >= 1 and (stats["commits"], stats["pending"]) == (1, 0)
+
+
+def test_queued_choices_are_read_back(storage, make_choice):
+    for choice in ("1,2", "3", "4, 5"):
+        stub.store_update_choice(make_choice("alice", choice=choice, name="Alice"))
+    assert stub.get_score("g1", {"username": "alice"})["choice"] == [4, 5]
+    stub.store_update_choice(make_choice("alice", choice="6", name="Alice team"))
+    stub.store_update_choice(make_choice("bob", stub.ROLE_HACKER, "1", name="Bob"))
+
+    # a fresh process sees the committed batch
+    stub._force_backend(stub.BACKEND_JSON)
+    stored = stub.get_game_data("g1", round=1, role=None)
+    assert [(r["player_name"], r["choice"]) for r in stored] == [("Alice team", [6]), ("Bob", [1])]
+
+
+def test_reads_fail_while_choices_are_not_committed(storage, monkeypatch, make_choice):
+    broken = threading.Event()
+    broken.set()
+    commit_choices = stub._commit_choices
+
+    def commit(choices):
+        if broken.is_set():
+            raise OSError("disk full")
+        commit_choices(choices)
+
+    monkeypatch.setattr(stub, "_commit_choices", commit)
+    stub._force_backend(stub.BACKEND_JSON)
+    stub.store_update_choice(make_choice("alice"))
+    # the round isn't read without the choice
+    with raises(RuntimeError):
+        stub.get_game_data("g1", round=1, role=None)
+    broken.clear()
+    assert stub.get_score("g1", {"username": "alice"})["choice"] == [1, 2]
@@ -0,0 +1,24 @@
+from games.leaderboard import Leaderboard
+from persistence import stub
+
+
+def test_leaderboard_ranks_by_role():
+    leaderboard = Leaderboard()
+    leaderboard.close_round(1, [(1, "a", stub.ROLE_ARCHITECT, 3), (2, "b", stub.ROLE_ARCHITECT, 5),
+                                (3, "c", stub.ROLE_ARCHITECT, 3), (4, "h", stub.ROLE_HACKER, 1)])
+    assert [leaderboard.rank(c) for c in (1, 2, 3, 4)] == [2, 1, 2, 1]
+
+    leaderboard.close_round(2, [(1, "a", stub.ROLE_ARCHITECT, 4), (2, "b", stub.ROLE_ARCHITECT, 0)])
+    assert leaderboard.total(1) == 7
+    assert leaderboard.standings(stub.ROLE_ARCHITECT) == [(1, "a", 7), (2, "b", 5), (3, "c", 3)]
+
+    # closing a round again replaces its scores instead of adding them
+    leaderboard.close_round(2, [(1, "a", stub.ROLE_ARCHITECT, 1)])
+    assert leaderboard.total(1) == 4
+    assert leaderboard.rank(1) == 2
+    assert leaderboard.feedback(1, round=2) == "* за этот ход вы получаете 1 очков\n" \
+                                               "* общее количество очков 4\n" \
+                                               "ваша позиция в рейтинге №2."
+    assert set(leaderboard.round_feedback(2)) == {1, 2}
+    assert leaderboard.feedback(5, round=1) is None
+
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+from aiogram.types import FSInputFile
+from pytest import fixture
+from media import PhotoCache
+from persistence import stub
+
+
+@fixture
+def storage(storage):
+    (storage / "arch.jpg").write_bytes(b"image")
+    (storage / "sd.jpg").write_bytes(b"diagram")
+    return storage
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.uploads = 0
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        await asyncio.sleep(0.001)
+        if isinstance(photo, FSInputFile):
+            self.uploads += 1
+            photo = f"file-{self.uploads}"
+        self.sent.append((chat_id, photo))
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="thumb"), SimpleNamespace(file_id=photo)])
+
+    async def send_media_group(self, chat_id, media):
+        return [await self.send_photo(chat_id, photo=m.media, caption=m.caption) for m in media]
+
+
+def test_photo_uploaded_once(storage):
+    bot = FakeBot()
+
+    async def play(cache):
+        await asyncio.gather(*(cache.send(bot, chat_id, "arch.jpg", caption="c") for chat_id in range(20)))
+
+    asyncio.run(play(PhotoCache()))
+    assert bot.uploads == 1
+    assert {photo for _, photo in bot.sent} == {"file-1"}
+
+    # the file_id is persisted, after a restart the image isn't uploaded again
+    asyncio.run(play(PhotoCache()))
+    assert bot.uploads == 1
+
+    # a changed image is uploaded again
+    (storage / "arch.jpg").write_bytes(b"new image")
+    assert asyncio.run(PhotoCache().preload(bot, "service", ["arch.jpg", "arch.jpg"])) == 1
+    assert stub.get_telegram_file_id("arch.jpg", "unknown") is None
+
+
+def test_media_group_reuses_file_ids(storage):
+    bot = FakeBot()
+    cache = PhotoCache()
+    group = [("arch.jpg", "architecture"), ("sd.jpg", "diagram")]
+
+    async def play():
+        await cache.send(bot, 1, "arch.jpg")
+        await asyncio.gather(*(cache.send_group(bot, chat_id, group) for chat_id in range(2, 10)))
+
+    asyncio.run(play())
+    # arch.jpg was uploaded alone, sd.jpg with the first group
+    assert bot.uploads == 2
+    assert [photo for chat_id, photo in bot.sent if chat_id == 9] == ["file-1", "file-2"]
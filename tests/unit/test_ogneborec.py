@@ -0,0 +1,143 @@
+from games.ogneborec import KiprGameOgneborec
+from persistence import stub
+
+
+GAME_ID = "g1"
+
+
+def test_calculate_game_round_results(storage, store_choice):
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2,3")
+    store_choice("arch_2", stub.ROLE_ARCHITECT, "6,7")
+    # component 5 is outside of the trusted code base
+    store_choice("hacker_1", stub.ROLE_HACKER, "1,5,6")
+    store_choice("hacker_2", stub.ROLE_HACKER, "4")
+
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=1)
+
+    arch_1 = stub.get_score(GAME_ID, {"username": "arch_1"}, round=1)
+    assert arch_1["protected_score_round_1"] == 1
+    assert arch_1["compromised_score_round_1"] == 2
+    assert sorted(arch_1["compromised_tcb_components_round_1"]) == [4, 6]
+    arch_2 = stub.get_score(GAME_ID, {"username": "arch_2"}, round=1)
+    assert arch_2["protected_score_round_1"] == 1
+    assert arch_2["compromised_score_round_1"] == 2
+    assert sorted(arch_2["compromised_tcb_components_round_1"]) == [1, 4]
+
+    hacker_1 = stub.get_score(GAME_ID, {"username": "hacker_1"}, round=1)
+    assert hacker_1["successful_attacks_score_round_1"] == 2
+    assert hacker_1["unsuccessful_attacks_score_round_1"] == 2
+    assert hacker_1["irrelevant_attacks_score_round_1"] == 2
+    hacker_2 = stub.get_score(GAME_ID, {"username": "hacker_2"}, round=1)
+    assert hacker_2["successful_attacks_score_round_1"] == 2
+    assert hacker_2["unsuccessful_attacks_score_round_1"] == -1
+    assert hacker_2["irrelevant_attacks_score_round_1"] == -1
+
+    assert stub.get_round_summary(GAME_ID, round=1) == {"architects": 2, "hackers": 4}
+
+
+def test_live_round_summary(storage, store_choice):
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2")
+    store_choice("hacker_1", stub.ROLE_HACKER, "1,3")
+    store_choice("hacker_2", stub.ROLE_HACKER, "2")
+    # changed choices retract the previous contribution
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "3,4")
+    store_choice("hacker_2", stub.ROLE_HACKER, "4,5,6")
+
+    live = KiprGameOgneborec.get_live_round_summary(GAME_ID, round=1)
+    assert live == {"architects": 2, "hackers": 2, "architects_count": 1, "hackers_count": 2}
+
+    # after restart live scores are restored from the stored choices
+    KiprGameOgneborec.reset_live_scores()
+    assert KiprGameOgneborec.get_live_round_summary(GAME_ID, round=1) == live
+
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=1)
+    assert stub.get_round_summary(GAME_ID, round=1) == {"architects": 2, "hackers": 2}
+
+
+def test_round_tables():
+    round_1 = KiprGameOgneborec.get_round_table(round=1)
+    round_3 = KiprGameOgneborec.get_round_table(round=3)
+    assert round_1.allowed_ids == frozenset(range(1, 9))
+    assert round_3.allowed_ids == frozenset(range(1, 13))
+    assert round_1.costs[1] == 2 and round_1.costs[9] == 0 and round_3.costs[9] == 1
+    assert KiprGameOgneborec.get_attacks_text_block(round=1).count("\n") == 7
+
+    assert KiprGameOgneborec.calculate_security_costs("1,3", 1) == 3
+    assert KiprGameOgneborec.is_security_choice_valid("1,2,3", 1)
+    assert not KiprGameOgneborec.is_security_choice_valid("9", 1)
+    assert KiprGameOgneborec.is_security_choice_valid("9", 3)
+    assert KiprGameOgneborec.is_attacking_choice_valid("1,5,8", 1)
+    assert not KiprGameOgneborec.is_attacking_choice_valid("1,5,8,2", 1)
+    assert not KiprGameOgneborec.is_attacking_choice_valid("12", 2)
+
+
+def test_parse_choice():
+    choice = KiprGameOgneborec.parse_choice(" 3, 1,3 ", 1, stub.ROLE_ARCHITECT)
+    assert choice.ids == (1, 3)
+    assert choice.mask == 0b1010
+    assert choice.cost == 3 and choice.valid
+    assert KiprGameOgneborec.calculate_security_costs(choice, 1) == 3
+
+    over_budget = KiprGameOgneborec.parse_choice("1,2,6,8", 1, stub.ROLE_ARCHITECT)
+    assert over_budget.cost == 8 and not over_budget.valid
+    assert not KiprGameOgneborec.parse_choice("1,x", 1, stub.ROLE_HACKER).valid
+    assert not KiprGameOgneborec.parse_choice("9", 1, stub.ROLE_HACKER).valid
+    # ids not typed as the round table has them are parsed as numbers
+    assert KiprGameOgneborec.parse_choice("01,+3", 1, stub.ROLE_ARCHITECT).ids == (1, 3)
+    # a sticker or a photo has no text
+    assert not KiprGameOgneborec.parse_choice(None, 1, stub.ROLE_ARCHITECT).valid
+    assert not KiprGameOgneborec.is_security_choice_valid(None, 1)
+    assert not KiprGameOgneborec.is_attacking_choice_valid(None, 1)
+    # repeated attacks are counted once against the budget
+    assert KiprGameOgneborec.parse_choice("1,1,1,2", 1, stub.ROLE_HACKER).valid
+
+
+def test_store_parsed_choice(storage, store_choice):
+    choice = KiprGameOgneborec.parse_choice("4,2", 1, stub.ROLE_HACKER)
+    store_choice("hacker_1", stub.ROLE_HACKER, choice.ids)
+    assert stub.get_score(GAME_ID, {"username": "hacker_1"}, round=1)["choice"] == [2, 4]
+
+
+def test_result_cards(storage, store_choice):
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2,3")
+    store_choice("hacker_1", stub.ROLE_HACKER, "1,4")
+    assert KiprGameOgneborec.peek_result_cards(GAME_ID, round=1) is None
+
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=1)
+    cards = KiprGameOgneborec.peek_result_cards(GAME_ID, round=1)
+    assert "Пропущенные критические атаки: 1" in cards["arch_1"]
+    assert KiprGameOgneborec.get_component_by_id(4)["attack_text"] in cards["arch_1"]
+    assert "Успешный взлом: 1" in cards["hacker_1"]
+
+    # after restart the cards are rendered again from the stored scores
+    KiprGameOgneborec.reset_live_scores()
+    assert KiprGameOgneborec.get_result_cards(GAME_ID, round=1) == cards
+
+
+def test_round_feedback(storage, store_choice):
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2,3")
+    store_choice("arch_2", stub.ROLE_ARCHITECT, "2")
+    store_choice("hacker_1", stub.ROLE_HACKER, "1,4")
+    assert KiprGameOgneborec.peek_round_feedback(GAME_ID, round=1) is None
+
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=1)
+    feedback = KiprGameOgneborec.peek_round_feedback(GAME_ID, round=1)
+    assert set(feedback) == {"arch_1", "arch_2", "hacker_1"}
+    assert "№1." in feedback["arch_1"]
+    assert "№2." in feedback["arch_2"]
+
+    # after restart the leaderboard is rebuilt from the stored scores
+    KiprGameOgneborec.reset_live_scores()
+    assert KiprGameOgneborec.get_round_feedback(GAME_ID, round=1) == feedback
+
+
+def test_reset_live_scores_of_one_game(storage, store_choice):
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2,3")
+    store_choice("p2", stub.ROLE_HACKER, "1", game_id="g2")
+    KiprGameOgneborec.calculate_game_round_results(game_id=GAME_ID, round=1)
+    KiprGameOgneborec.calculate_game_round_results(game_id="g2", round=1)
+
+    KiprGameOgneborec.reset_live_scores(game_id="g2")
+    assert KiprGameOgneborec.peek_result_cards("g2", round=1) is None
+    assert KiprGameOgneborec.peek_round_feedback("g2", round=1) is None
+    assert KiprGameOgneborec.peek_result_cards(GAME_ID, round=1) is not None
@@ -0,0 +1,46 @@
+import threading
+from games.ogneborec import KiprGameOgneborec
+from persistence import stub
+
+
+def test_round_totals_are_maintained(storage, store_choice):
+    # totals exist before any choice, later writes must keep them in sync
+    assert stub.get_round_totals("g1", round=1) == {"architects": 0, "hackers": 0,
+                                                    "architects_count": 0, "hackers_count": 0}
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1,2,3")
+    store_choice("arch_2", stub.ROLE_ARCHITECT, "6,7")
+    store_choice("hacker_1", stub.ROLE_HACKER, "1,5,6")
+    store_choice("hacker_2", stub.ROLE_HACKER, "4")
+    store_choice("arch_1", stub.ROLE_ARCHITECT, "1", round=2)
+    assert stub.get_round_totals("g1", round=1)["architects_count"] == 2
+
+    KiprGameOgneborec.calculate_game_round_results(game_id="g1", round=1)
+    # scoring the round again replaces the contributions instead of adding them
+    KiprGameOgneborec.calculate_game_round_results(game_id="g1", round=1)
+    maintained = stub.get_round_totals("g1", round=1)
+    assert maintained == {"architects": 2, "hackers": 4, "architects_count": 2, "hackers_count": 2}
+    assert stub.get_round_totals("g1", round=2)["architects_count"] == 1
+
+    # the same totals are rebuilt from the stored records after restart
+    stub._force_backend(stub.BACKEND_JSON)
+    assert stub.get_round_totals("g1", round=1) == maintained
+
+
+def test_choice_committed_while_totals_are_built_is_counted(storage, monkeypatch, store_choice, make_choice):
+    store_choice("arch_1")
+    stub.flush()
+    views = stub._views
+    writers = []
+
+    def scan(records):
+        # the choices writer commits a batch between the scan and the totals being kept
+        writer = threading.Thread(target=stub._commit_choices, args=([{**make_choice("arch_2"), "round": 1}],))
+        writer.start()
+        writer.join(timeout=0.2)
+        writers.append(writer)
+        return views(records)
+
+    monkeypatch.setattr(stub, "_views", scan)
+    stub.get_round_totals("g1", round=1)
+    writers[0].join()
+    assert stub.get_round_totals("g1", round=1)["architects_count"] == 2
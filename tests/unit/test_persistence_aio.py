@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from persistence import aio, stub
+
+
+def test_storage_runs_off_the_loop_in_order(storage):
+    threads = []
+    applied = []
+
+    def work(n):
+        threads.append(threading.current_thread())
+        applied.append(n)
+        return n
+
+    async def play():
+        return await asyncio.gather(*(aio.run(work, n) for n in range(20)))
+
+    assert asyncio.run(play()) == list(range(20))
+    assert applied == list(range(20))
+    assert threading.main_thread() not in threads
+    assert len(set(threads)) == 1
+
+
+def test_async_choice_roundtrip(storage, make_choice):
+    choice = make_choice("p1", choice=(1, 2))
+
+    async def play():
+        await aio.store_update_choice(choice=choice, round=1)
+        return await aio.get_game_data(game_id="g1", round=1, role=stub.ROLE_ARCHITECT)
+
+    stored = asyncio.run(play())
+    assert len(stored) == 1
+    assert stored[0]["player_username"] == "p1"
+
+
+def test_game_status_is_read_off_the_loop(storage, monkeypatch):
+    threads = []
+    get_game_status = stub.get_game_status
+
+    def traced(game_id):
+        threads.append(threading.current_thread())
+        return get_game_status(game_id)
+
+    monkeypatch.setattr(stub, "get_game_status", traced)
+
+    async def play():
+        await aio.set_game_status(game_id="g1", round=2, status=stub.GAME_STATUS_IN_PROGRESS)
+        return await aio.get_game_status(game_id="g1")
+
+    assert asyncio.run(play())["round"] == 2
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,48 @@
+from src.persistence.memory import IndexedTable
+from src.persistence.journal import JOURNAL_SUFFIX
+
+
+def test_journal_replay_and_compaction(tmp_path):
+    file_name = str(tmp_path / "game_data.json")
+    table = IndexedTable(file_name, indexes=(("game_id",),), compact_every=3)
+    pk = table.add({"game_id": "g1", "score": 0})
+    table.update_by_id(pk, {"score": 1})
+
+    # nothing compacted yet, the state is restored from the journal only
+    restored = IndexedTable(file_name, indexes=(("game_id",),), compact_every=3)
+    assert restored.get_by_query({"game_id": "g1"})[0]["score"] == 1
+
+    # the third entry triggers compaction into the snapshot
+    table.add({"game_id": "g2", "score": 5})
+    with open(file_name + JOURNAL_SUFFIX, encoding="utf-8") as f:
+        assert f.read() == ""
+    table.delete_all()
+    table.add({"game_id": "g3", "score": 7})
+
+    restored = IndexedTable(file_name, indexes=(("game_id",),), compact_every=3)
+    assert [r["game_id"] for r in restored.get_all()] == ["g3"]
+
+
+def test_journal_torn_entry(tmp_path):
+    file_name = str(tmp_path / "game_status.json")
+    table = IndexedTable(file_name, indexes=(("game_id",),))
+    table.add({"game_id": "g1", "round": 1})
+    with open(file_name + JOURNAL_SUFFIX, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "rec')
+
+    restored = IndexedTable(file_name, indexes=(("game_id",),))
+    restored.add({"game_id": "g2", "round": 1})
+    assert len(IndexedTable(file_name).get_all()) == 2
+
+
+def test_journal_batch_update(tmp_path):
+    file_name = str(tmp_path / "game_data.json")
+    table = IndexedTable(file_name, indexes=(("game_id",),))
+    first = table.add({"game_id": "g1", "score": 0})
+    second = table.add({"game_id": "g1", "score": 0})
+    table.update_many([{"id": first, "score": 1}, {"id": second, "score": 2}])
+
+    with open(file_name + JOURNAL_SUFFIX, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    restored = IndexedTable(file_name, indexes=(("game_id",),))
+    assert [r["score"] for r in restored.get_by_query({"game_id": "g1"})] == [1, 2]
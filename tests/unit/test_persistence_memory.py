@@ -0,0 +1,40 @@
+import json
+from src.persistence.memory import IndexedTable
+
+
+def test_indexed_table_query(tmp_path):
+    file_name = str(tmp_path / "game_data.json")
+    table = IndexedTable(file_name, indexes=(("game_id", "round"), ("game_id", "round", "role")))
+    pk = table.add({"game_id": "g1", "round": 1, "role": "хакер", "choice": [1, 2]})
+    table.add({"game_id": "g1", "round": 1, "role": "архитектор", "choice": [3]})
+    table.add({"game_id": "g2", "round": 1, "role": "хакер", "choice": [4]})
+
+    assert len(table.get_by_query({"game_id": "g1", "round": 1})) == 2
+    hackers = table.get_by_query({"game_id": "g1", "round": 1, "role": "хакер"})
+    assert len(hackers) == 1 and hackers[0]["id"] == pk
+
+    # returned records are copies, changes are visible only after update
+    hackers[0]["choice"].append(5)
+    hackers[0]["round"] = 2
+    assert table.get_by_query({"game_id": "g1", "round": 2}) == []
+    table.update_by_id(pk, hackers[0])
+    assert table.get_by_query({"game_id": "g1", "round": 2})[0]["choice"] == [1, 2, 5]
+    assert len(table.get_by_query({"game_id": "g1", "round": 1})) == 1
+
+    # query fields not covered by an index fall back to filtering
+    assert len(table.get_by_query({"role": "хакер"})) == 2
+
+
+def test_indexed_table_file_roundtrip(tmp_path):
+    file_name = str(tmp_path / "game_status.json")
+    table = IndexedTable(file_name, indexes=(("game_id",),))
+    table.add({"game_id": "g1", "round": 1, "status": "in progress"})
+    table.compact()
+
+    with open(file_name, encoding="utf-8") as f:
+        assert len(json.load(f)["data"]) == 1
+
+    restored = IndexedTable(file_name, indexes=(("game_id",),))
+    assert restored.get_by_query({"game_id": "g1"})[0]["status"] == "in progress"
+    restored.delete_all()
+    assert IndexedTable(file_name).get_all() == []
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from pytest import mark
+from persistence import stub
+from persistence.memory import IndexedTable
+
+
+def players(game_id: str) -> list:
+    return [r["player_username"] for r in stub.get_game_data(game_id, round=None, role=None)]
+
+
+def test_games_are_partitioned(backend, store_choice):
+    store_choice("alice", choice="1", game_id="g1")
+    store_choice("bob", choice="2", game_id="g2")
+    assert players("g1") == ["alice"]
+    assert players("g2") == ["bob"]
+
+    stub.reset_game_data("g1")
+    assert players("g1") == []
+    assert players("g2") == ["bob"]
+    assert sorted(r["player_username"] for r in stub.read_all_data()) == ["bob"]
+
+
+def test_completed_game_is_archived(backend, store_choice):
+    store_choice("alice", choice="1,2", game_id="g1")
+    stub.set_game_status("g1", 3, stub.GAME_STATUS_COMPLETED)
+    store_choice("bob", choice="2", game_id="g2")
+    stub.set_game_status("g2", 1, stub.GAME_STATUS_IN_PROGRESS)
+    assert stub.archive_completed_games() == ["g1"]
+    assert stub.archive_game("g1") is False
+
+    # a fresh process reads the archived game lazily
+    stub._force_backend(backend, "./data/game.sqlite")
+    assert [s["game_id"] for s in stub._table(stub.GAME_STATUS_FILE_NAME).get_all()] == ["g2"]
+    assert stub.get_game_status("g1")["status"] == stub.GAME_STATUS_COMPLETED
+    assert stub.get_score("g1", {"username": "alice"})["choice"] == [1, 2]
+
+    # writing to an archived game restores it
+    store_choice("carol", choice="3", game_id="g1")
+    assert players("g1") == ["alice", "carol"]
+    stub._force_backend(backend, "./data/game.sqlite")
+    assert players("g1") == ["alice", "carol"]
+    assert stub.get_game_status("g1")["status"] == stub.GAME_STATUS_COMPLETED
+
+    stub.reset_game_data("g1")
+    assert players("g1") == []
+    assert stub.get_game_status("g1") is None
+
+
+@mark.parametrize("backend", [stub.BACKEND_JSON], indirect=True)
+def test_shared_game_data_is_split(backend):
+    shared = IndexedTable(stub.GAME_DATA_FILE_NAME)
+    shared.add({"game_id": "g1", "player_username": "alice", "round": 1})
+    shared.add({"game_id": "g2", "player_username": "bob", "round": 1})
+    shared.compact()
+
+    assert players("g1") == ["alice"]
+    assert players("g2") == ["bob"]
+    assert not os.path.exists(stub.GAME_DATA_FILE_NAME)
+
+
+def test_tables_are_opened_once_by_concurrent_threads(storage, monkeypatch):
+    class SlowTable(IndexedTable):
+        def __init__(self, *args, **kwargs):
+            # widens the window in which another thread could open the same table
+            time.sleep(0.02)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(stub, "IndexedTable", SlowTable)
+    stub._force_backend(stub.BACKEND_JSON)
+    opened = []
+    threads = [threading.Thread(target=lambda: opened.append(stub._table(stub.GAME_INDEX_FILE_NAME)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(t) for t in opened}) == 1
@@ -0,0 +1,59 @@
+from pytest import raises
+from persistence import stub
+from persistence.records import PlayerRound, PlayerRoundView, ROLE_ARCHITECT, ROLE_HACKER, LEGACY_SCORE_FIELDS
+
+
+def padded(**fields) -> dict:
+    record = {"id": 1, "game_id": "g1", "chat_id": 1, "player_username": "alice", "player_name": "Alice",
+              "role": ROLE_ARCHITECT, "round": 2, "choice": [1, 2]}
+    record.update({f: -1 for f in LEGACY_SCORE_FIELDS})
+    record.update(fields)
+    return record
+
+
+def test_padded_record_is_compacted():
+    record = PlayerRound.from_dict(padded(protected_score_round_2=1, compromised_score_round_2=2,
+                                          compromised_tcb_components_round_2=[4, 6, 4]))
+    assert record.scores == (1, 2)
+    assert record.compromised_mask == 1 << 4 | 1 << 6
+    compact = record.to_dict()
+    assert not set(compact) & set(LEGACY_SCORE_FIELDS)
+    assert PlayerRound.from_dict(compact).to_dict() == compact
+
+    assert PlayerRound.from_dict(padded()).scores is None
+
+
+def test_view_shows_padded_fields():
+    architect = PlayerRoundView(PlayerRound.from_dict(padded()).to_dict() | {"scores": [0, 2], "compromised_mask": 0b1010})
+    assert architect["protected_score_round_2"] == 0
+    assert architect["compromised_score_round_2"] == 2
+    assert architect["compromised_tcb_components_round_2"] == [1, 3]
+    assert architect["protected_score_round_1"] == -1
+    assert architect["successful_attacks_score_round_2"] == -1
+    assert architect["player_name"] == "Alice"
+
+    hacker = PlayerRoundView(padded(role=ROLE_HACKER, successful_attacks_score_round_2=3))
+    assert hacker["successful_attacks_score_round_2"] == 3
+    # zero scores of hackers keep the placeholder
+    assert hacker["unsuccessful_attacks_score_round_2"] == -1
+    assert dict(hacker)["irrelevant_attacks_score_round_3"] == -1
+
+
+def test_padded_scores_are_stored_compact(backend, store_choice):
+    store_choice("alice", choice="4,6")
+    stored = stub.get_game_data("g1", round=1, role=None)[0]
+    # an update in the padded format, as store_update_score callers wrote it before
+    update = {f: -1 for f in LEGACY_SCORE_FIELDS}
+    update.update({"id": stored["id"], "game_id": "g1", "protected_score_round_1": 1,
+                   "compromised_score_round_1": 2, "compromised_tcb_components_round_1": [4]})
+    stub.store_update_score(update)
+    score = stub.get_score("g1", {"username": "alice"})
+    assert (score["protected_score_round_1"], score["compromised_score_round_1"]) == (1, 2)
+    assert score["compromised_tcb_components_round_1"] == [4]
+    assert stub.get_round_totals("g1", round=1)["architects"] == 1
+
+    # scores of another round don't belong to the record
+    with raises(ValueError):
+        stub.store_update_score({"id": stored["id"], "game_id": "g1", "protected_score_round_2": 1})
+    with raises(ValueError):
+        PlayerRound.from_dict(padded())["protected_score_round_2"] = 1
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from pytest import raises
+from persistence import aio, leases, stub
+from persistence.service import StateClient, StateService
+
+
+def fail(message: str) -> None:
+    raise ValueError(message)
+
+
+class Unloadable:
+    """ pickled fine by the service, fails to load in the worker """
+
+    def __reduce__(self):
+        return fail, ("can't be loaded",)
+
+
+def unloadable() -> Unloadable:
+    return Unloadable()
+
+
+def slow(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def test_workers_share_the_storage_of_the_service(storage, make_choice):
+    async def play():
+        server = await StateService("state.sock").start()
+        workers = [StateClient("state.sock") for _ in range(3)]
+        async with server:
+            await asyncio.gather(*(w.call(stub.store_update_choice, choice=make_choice(f"p{n}", choice=(1, 2), chat_id=n), round=1)
+                                   for n, w in enumerate(workers * 10)))
+            await workers[0].call(stub.set_game_status, game_id="g1", round=2, status=stub.GAME_STATUS_IN_PROGRESS)
+            stored = await workers[1].call(stub.get_game_data, game_id="g1", round=1, role=None)
+            status = await workers[2].call(stub.get_game_status, game_id="g1")
+            with raises(ValueError, match="nope"):
+                await workers[0].call(fail, "nope")
+            # the connection is still usable after a failed call
+            rooms = await workers[0].call(stub.get_game_rooms)
+            for w in workers:
+                await w.close()
+        return stored, status, rooms
+
+    stored, status, rooms = asyncio.run(play())
+    assert sorted(r["chat_id"] for r in stored) == list(range(30))
+    assert status["round"] == 2
+    assert rooms == []
+
+
+def test_worker_reconnects_after_a_broken_reply(storage):
+    async def play():
+        server = await StateService("state.sock").start()
+        worker = StateClient("state.sock")
+        async with server:
+            # a call waiting behind the broken reply fails instead of hanging
+            broken, waiting = await asyncio.wait_for(
+                asyncio.gather(worker.call(unloadable), worker.call(slow, 0.05), return_exceptions=True), timeout=2)
+            rooms = await asyncio.wait_for(worker.call(stub.get_game_rooms), timeout=2)
+            await worker.close()
+        return broken, waiting, rooms
+
+    broken, waiting, rooms = asyncio.run(play())
+    assert isinstance(broken, ConnectionError)
+    assert isinstance(waiting, ConnectionError)
+    assert rooms == []
+
+
+def test_workers_wait_for_rounds_in_the_service(storage, monkeypatch):
+    async def play():
+        server = await StateService("state.sock").start()
+        async with server:
+            monkeypatch.setattr(aio, "_client", StateClient("state.sock"))
+            waiters = [asyncio.ensure_future(aio.wait_for_game_round(game_id="g1", round=2)) for _ in range(3)]
+            reset = asyncio.ensure_future(aio.wait_for_game_round(game_id="g1", round=3))
+            await asyncio.sleep(0.05)
+            assert not any(w.done() for w in waiters)
+            # another worker starts the round
+            other = StateClient("state.sock")
+            await other.call(stub.set_game_status, game_id="g1", round=2, status=stub.GAME_STATUS_IN_PROGRESS)
+            statuses = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+            await other.call(stub.reset_game_data)
+            reset = await asyncio.wait_for(reset, timeout=1)
+            await other.close()
+            await aio._client.close()
+        return statuses, reset
+
+    statuses, reset = asyncio.run(play())
+    assert [s["round"] for s in statuses] == [2, 2, 2]
+    assert reset is None
+
+
+def test_lease_is_held_by_one_worker(storage):
+    token = leases.acquire("endround:g1:1")
+    assert token is not None
+    assert leases.acquire("endround:g1:1") is None
+    assert leases.acquire("endround:g1:2") is not None
+    assert not leases.release("endround:g1:1", "someone else")
+    assert leases.release("endround:g1:1", token)
+    assert leases.acquire("endround:g1:1", ttl=0) is not None
+    # an expired lease of a crashed holder is taken over
+    assert leases.acquire("endround:g1:1") is not None
@@ -0,0 +1,45 @@
+from persistence import stub
+from persistence.memory import IndexedTable
+from persistence.migrate import migrate
+
+
+def test_sqlite_migration(storage, store_choice):
+    store_choice("alice", stub.ROLE_ARCHITECT, "1,2")
+    store_choice("bob", stub.ROLE_HACKER, "3")
+    stub.set_game_status("g1", 2, stub.GAME_STATUS_IN_PROGRESS)
+    stub.set_last_game_id("g1")
+    stub.flush()
+
+    imported = migrate("./data/game.sqlite")
+    # game_index holds the last game id and the game partition
+    assert imported == {"game_data": 2, "game_index": 2, "game_status": 1, "player_sessions": 0, "sheet_rows": 0}
+
+    stub._force_backend(stub.BACKEND_SQLITE, "./data/game.sqlite")
+    assert stub.get_last_game_id() == "g1"
+    assert stub.get_game_status("g1")["round"] == 2
+    hackers = stub.get_game_data("g1", round=1, role=stub.ROLE_HACKER)
+    assert [h["player_username"] for h in hackers] == ["bob"]
+
+
+def test_sqlite_store_update_choice(storage, store_choice):
+    stub._force_backend(stub.BACKEND_SQLITE, "./data/game.sqlite")
+    store_choice("alice", stub.ROLE_ARCHITECT, "1,2")
+    store_choice("alice", stub.ROLE_ARCHITECT, "4", round=2)
+    store_choice("alice", stub.ROLE_ARCHITECT, "5, 6")
+
+    assert stub.get_score("g1", {"username": "alice"}, round=1)["choice"] == [5, 6]
+    assert [r["choice"] for r in stub.get_round_details("g1", round=2)] == [[4]]
+    stub.reset_game_data()
+    assert stub.get_game_data("g1", round=None, role=None) == []
+
+
+def test_sqlite_migration_of_journal_only_table(storage):
+    # the shared table of an older version, its records are still in the journal only
+    shared = IndexedTable(stub.GAME_DATA_FILE_NAME)
+    shared.add({"game_id": "g0", "chat_id": 1, "player_username": "carol", "player_name": "carol",
+                "role": stub.ROLE_HACKER, "round": 1, "choice": [3], "scores": None})
+
+    imported = migrate("./data/game.sqlite")
+    assert imported["game_data"] == 1
+    stub._force_backend(stub.BACKEND_SQLITE, "./data/game.sqlite")
+    assert [r["player_username"] for r in stub.get_game_data("g0", round=1, role=None)] == ["carol"]
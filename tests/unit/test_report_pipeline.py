@@ -0,0 +1,60 @@
+import asyncio
+import httplib2
+from googleapiclient.errors import HttpError
+from google_sheets.pipeline import ReportQueue
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+def test_transient_failures_are_retried_with_backoff():
+    delays = []
+    attempts = {"flaky": 0}
+    applied = []
+    notices = []
+
+    def flaky():
+        attempts["flaky"] += 1
+        if attempts["flaky"] < 4:
+            raise http_error(503 if attempts["flaky"] % 2 else 429)
+        applied.append("flaky")
+        return "ok"
+
+    def broken():
+        raise http_error(403)
+
+    async def notice(result, error):
+        notices.append((result, type(error).__name__ if error else None))
+
+    async def play():
+        reports = ReportQueue(backoff=1, max_backoff=3, sleep=delays.append)
+        reports.put("flaky", flaky, notice)
+        reports.put("broken", broken, notice)
+        reports.put("next", lambda: applied.append("next"))
+        await asyncio.to_thread(reports.flush)
+        await asyncio.sleep(0.01)
+        return reports.stats()
+
+    stats = asyncio.run(play())
+    # jobs keep their order, a retried job holds back the next ones
+    assert applied == ["flaky", "next"]
+    assert len(delays) == 3
+    # doubling with jitter, capped
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2 and 1.5 <= delays[2] <= 3
+    assert notices == [("ok", None), (None, "HttpError")]
+    assert stats["pending"] == 0
+    assert (stats["done"], stats["failed"], stats["retries"]) == (2, 1, 3)
+
+
+def test_retries_give_up():
+    delays = []
+
+    def down():
+        raise ConnectionResetError("reset by peer")
+
+    reports = ReportQueue(max_retries=2, sleep=delays.append)
+    reports.put("down", down)
+    reports.flush()
+    assert len(delays) == 2
+    assert reports.stats()["failed"] == 1
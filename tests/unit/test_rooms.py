@@ -0,0 +1,150 @@
+import asyncio
+from persistence import stub
+from google_sheets.pipeline import ReportQueue
+from rooms import CODE_LENGTH, RoomRegistry
+
+
+def test_rooms_are_joined_by_code_and_restored(storage):
+    async def play():
+        registry = RoomRegistry()
+        rooms = [await registry.get(f"game-{n}") for n in range(20)]
+        # an existing game keeps its room
+        assert await registry.get("game-0") is rooms[0]
+        return rooms
+
+    rooms = asyncio.run(play())
+    assert len({r.code for r in rooms}) == 20
+    assert all(len(r.code) == CODE_LENGTH for r in rooms)
+
+    restored = RoomRegistry(stub.get_game_rooms())
+    assert len(restored) == 20
+    assert restored.by_code(rooms[3].code.lower()).game_id == "game-3"
+    assert restored.by_code("nope") is None
+    assert rooms[3].deep_link("kipr_bot") == f"https://t.me/kipr_bot?start={rooms[3].code}"
+
+
+def test_rooms_mirror_to_their_own_report(storage):
+    calls = []
+    notices = []
+
+    class Report:
+        def __init__(self, sheet_id):
+            self.sheet_id = sheet_id
+
+        def create_game_details_sheet(self, game_id):
+            self.sheet_id = f"sheet-of-{game_id}"
+            return self.sheet_id
+
+        def update_game_results(self, round_num):
+            calls.append((self.sheet_id, round_num))
+
+    async def notice(result, error):
+        notices.append(error is None)
+
+    async def play():
+        reports = ReportQueue()
+        registry = RoomRegistry(create_report=Report, reports=reports)
+        (await registry.get("g1")).mirror("update_game_results", 1)
+        new_game = await registry.get("g2", new_game=True)
+        assert new_game.sheet_id is None
+        new_game.create_sheet()
+        # queued after the sheet is created, so it goes to the new sheet
+        new_game.mirror("update_game_results", 2)
+        # failures of the mirror are reported, the game goes on
+        new_game.mirror("missing_method", done=notice)
+        await asyncio.to_thread(reports.flush)
+        await asyncio.sleep(0.01)
+        return new_game
+
+    new_game = asyncio.run(play())
+    assert calls == [("g1", 1), ("sheet-of-g2", 2)]
+    assert new_game.sheet_id == "sheet-of-g2"
+    assert stub.get_game_rooms()[1]["sheet_id"] == "sheet-of-g2"
+    assert notices == [False]
+
+
+def test_missing_spreadsheet_is_reloaded_and_retried(storage):
+    calls = []
+
+    class Report:
+        def __init__(self, sheet_id):
+            self.sheet_id = sheet_id
+
+        def update_game_results(self, round_num):
+            calls.append((self.sheet_id, round_num))
+
+    def created_meanwhile(delay):
+        # another worker creates the spreadsheet while the job waits for its retry
+        stub.set_game_room_sheet("g1", "sheet-of-g1")
+
+    async def play():
+        reports = ReportQueue(sleep=created_meanwhile)
+        room = await RoomRegistry(create_report=Report, reports=reports).get("g1", new_game=True)
+        room.mirror("update_game_results", 1)
+        await asyncio.to_thread(reports.flush)
+        return room, reports.stats()
+
+    room, stats = asyncio.run(play())
+    assert calls == [("sheet-of-g1", 1)]
+    assert room.sheet_id == "sheet-of-g1"
+    assert stats["retries"] == 1 and stats["failed"] == 0
+
+
+def test_rooms_of_other_workers_are_found_in_storage(storage):
+    async def play():
+        worker_1, worker_2 = RoomRegistry(), RoomRegistry()
+        room = await worker_1.get("g1")
+        assert worker_2.by_code(room.code) is None
+        found = await worker_2.find(room.code)
+        # the game keeps its first code
+        again = await RoomRegistry().get("g1")
+        return room, found, again
+
+    room, found, again = asyncio.run(play())
+    assert found.game_id == "g1"
+    assert again.code == room.code
+
+
+def test_rows_are_written_once_and_keep_their_place(storage):
+    writes = []
+
+    class Report:
+        def __init__(self, sheet_id):
+            self.sheet_id = sheet_id
+
+        def write_rows(self, rows):
+            writes.append(sorted(rows))
+            return len(rows)
+
+    def row(round_num, chat_id, choice):
+        return {(round_num, chat_id): [str(chat_id), "хакер", f"Team {chat_id}", round_num, choice]}
+
+    async def play(rows: list, done=None):
+        reports = ReportQueue()
+        room = await RoomRegistry(create_report=Report, reports=reports).get("g1")
+        for r in rows:
+            room.write_rows(r)
+        room.write_rows({}, done=done)
+        while room._flush is not None:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(play([row(1, 10, "'01"), row(1, 11, "'02"), row(1, 12, "'03")]))
+    # rows queued before the flush go in one request
+    assert writes == [[[2, ["10", "хакер", "Team 10", 1, "'01"]], [3, ["11", "хакер", "Team 11", 1, "'02"]],
+                       [4, ["12", "хакер", "Team 12", 1, "'03"]]]]
+
+    # after a restart unchanged rows aren't sent again, a changed choice keeps its row
+    writes.clear()
+    stub._force_backend(stub.BACKEND_JSON)
+    counts = []
+
+    async def done(count, error):
+        counts.append(count)
+
+    asyncio.run(play([{**row(1, 10, "'01"), **row(1, 11, "'04"), **row(2, 10, "'05")}], done=done))
+    assert writes == [[[3, ["11", "хакер", "Team 11", 1, "'04"]], [5, ["10", "хакер", "Team 10", 2, "'05"]]]]
+    assert counts == [2]
+
+    # a reset game starts from the first row
+    stub.reset_game_data("g1")
+    assert stub.plan_sheet_rows("g1", [[1, 11, ["11"]]]) == [[2, ["11"]]]
@@ -0,0 +1,49 @@
+import asyncio
+from aiogram.fsm.storage.base import StorageKey
+from persistence import stub
+from session_storage import PlayerSessionStorage
+
+
+def test_sessions_are_restored(backend):
+    player = StorageKey(bot_id=1, chat_id=42, user_id=42)
+    other = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+    async def play():
+        sessions = PlayerSessionStorage()
+        await sessions.set_state(player, "Form:choice")
+        await sessions.update_data(player, {"name": "Team", "role": stub.ROLE_HACKER})
+        await sessions.update_data(player, {"round": 2, "username": "team", "choice_round_2": "1,2", "note": [1]})
+        await sessions.set_state(other, "Form:name")
+        await sessions.set_state(other, None)
+        await sessions.set_data(other, {})
+        return await sessions.count()
+
+    assert asyncio.run(play()) == 1
+    stored = stub.get_player_sessions()
+    assert len(stored) == 1
+    assert "message" not in stored[0]
+
+    async def restart():
+        sessions = PlayerSessionStorage()
+        return await sessions.get_state(player), await sessions.get_data(player), await sessions.get_data(other)
+
+    state, data, other_data = asyncio.run(restart())
+    assert state == "Form:choice"
+    assert data == {"name": "Team", "role": stub.ROLE_HACKER, "round": 2, "username": "team",
+                    "choice_round_2": "1,2", "note": [1]}
+    assert other_data == {}
+
+
+def test_session_is_replaced_in_one_write(storage, monkeypatch):
+    stub.store_player_session({"key": "1:42:42", "state": "Form:name", "data": {"name": "Team"}})
+    writes = []
+    sessions = stub._table(stub.PLAYER_SESSIONS_FILE_NAME)
+    append = sessions._journal.append
+    monkeypatch.setattr(sessions._journal, "append", lambda *entries: writes.append(entries) or append(*entries))
+
+    stub.store_player_session({"key": "1:42:42", "data": {"name": "Team", "round": 2}})
+    # a crash can't leave the player without a session
+    assert len(writes) == 1 and len(writes[0]) == 1
+    stub._force_backend(stub.BACKEND_JSON)
+    assert [{k: v for k, v in s.items() if k != "id"} for s in stub.get_player_sessions()] == \
+        [{"key": "1:42:42", "data": {"name": "Team", "round": 2}}]
@@ -0,0 +1,45 @@
+import asyncio
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+from webhook import create_app
+
+
+def update(update_id: int, text: str) -> dict:
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "date": 0, "text": text,
+                        "chat": {"id": update_id, "type": "private"},
+                        "from": {"id": update_id, "is_bot": False, "first_name": "player"}}}
+
+
+def test_webhook_checks_secret_and_handles_concurrently():
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def slow_handler(message: Message) -> None:
+        await asyncio.sleep(0.05)
+        handled.append(message.text)
+
+    async def play():
+        dp = Dispatcher()
+        dp.include_router(router)
+        app = create_app(dp, Bot(token="42:TEST"), path="/webhook", secret_token="secret")
+        async with TestClient(TestServer(app)) as client:
+            rejected = await client.post("/webhook", json=update(1, "no secret"))
+            assert rejected.status == 401
+            headers = {"X-Telegram-Bot-Api-Secret-Token": "secret"}
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            responses = await asyncio.gather(*(client.post("/webhook", json=update(n, str(n)), headers=headers)
+                                               for n in range(10)))
+            # acknowledged before the handlers are done
+            assert all(r.status == 200 for r in responses)
+            assert len(handled) < 10
+            while len(handled) < 10:
+                await asyncio.sleep(0.01)
+            # handled concurrently, not one after another
+            assert loop.time() - started < 0.4
+
+    asyncio.run(play())
+    assert sorted(handled, key=int) == [str(n) for n in range(10)]
@@ -0,0 +1,53 @@
+import asyncio
+from aiogram import Bot
+from aiogram.types import Update
+from workers import UpdateRouter, UpdateServer, forwarding_dispatcher, update_chat_id, worker_socket
+
+
+def update(update_id: int, chat_id: int, text: str) -> dict:
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "date": 0, "text": text,
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": {"id": chat_id, "is_bot": False, "first_name": "player"}}}
+
+
+def test_update_chat_id():
+    assert update_chat_id(update(1, 42, "1,2")) == 42
+    callback = {"update_id": 2, "callback_query": {"id": "q", "chat_instance": "c", "data": "*",
+                                                    "from": {"id": 7, "is_bot": False, "first_name": "p"},
+                                                    "message": {"message_id": 1, "date": 0,
+                                                                "chat": {"id": -100, "type": "group"}}}}
+    assert update_chat_id(callback) == -100
+
+
+def test_updates_of_a_chat_go_to_its_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handled = []
+
+    class Worker:
+        def __init__(self, index):
+            self.index = index
+
+        async def feed_raw_update(self, bot, update):
+            handled.append((self.index, update["message"]["chat"]["id"], update["message"]["text"]))
+
+    async def play():
+        servers = [await UpdateServer(Worker(i), bot=None, path=worker_socket(".", i)).start() for i in range(3)]
+        router = UpdateRouter([worker_socket(".", i) for i in range(3)])
+        for n in range(30):
+            await router.route(update(n, chat_id=n % 7, text=f"текст {n}"))
+        # the front dispatcher forwards updates as they came from Telegram
+        front = forwarding_dispatcher(router)
+        await front.feed_update(Bot(token="42:TEST"), Update.model_validate(update(31, chat_id=5, text="front")))
+        while len(handled) < 31:
+            await asyncio.sleep(0.01)
+        await router.close()
+        for server in servers:
+            server.close()
+        return router.routed
+
+    routed = asyncio.run(play())
+    assert sum(routed) == 31
+    assert all(worker == chat_id % 3 for worker, chat_id, _ in handled)
+    assert (2, 5, "front") in handled
+    assert (0, 3, "текст 3") in handled